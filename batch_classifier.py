@@ -0,0 +1,219 @@
+import math
+from typing import Dict, List, Tuple
+
+
+class BatchedLabelScorer:
+    def __init__(self, labels: List[str], max_batch_size=16, sequence_tokens=320):
+        # Scores the closed label set like LabelScorer, but for several
+        # tickets at once: every ticket is its own sequence in one llama.cpp
+        # batch and all of them share the evaluated prompt prefix.
+        # sequence_tokens is the expected length of one ticket's prompt
+        # behind the prefix, the KV cache holds max_batch_size of them.
+        self.labels = list(labels)
+        self.max_batch_size = max_batch_size
+        self.sequence_tokens = sequence_tokens
+        self.label_tokens = None
+        self.context = None
+        self.context_llm = None
+
+    def plan_batches(self, prefix_length, suffix_lengths, n_ctx, n_seq_max=None) -> List[List[int]]:
+        # Packs ticket indices into batches whose sequences fit into the
+        # context together with the shared prefix. Every ticket uses one
+        # sequence id plus one per multi-token label, the prefix uses id 0.
+        label_length = sum(max(0, len(tokens) - 1) for tokens in self.label_tokens.values())
+        max_batch_size = self.max_batch_size
+        if n_seq_max is not None:
+            sequences = 1 + sum(1 for tokens in self.label_tokens.values() if len(tokens) > 1)
+            max_batch_size = min(max_batch_size, (n_seq_max - 1) // sequences)
+            if max_batch_size < 1:
+                raise RuntimeError(
+                    f"The llama.cpp context allows {n_seq_max} sequences, "
+                    f"batched scoring needs at least {1 + sequences}"
+                )
+        batches = []
+        batch = []
+        used = prefix_length
+        for index, suffix_length in enumerate(suffix_lengths):
+            needed = suffix_length + label_length
+            if batch and (
+                used + needed > n_ctx or len(batch) >= max_batch_size
+            ):
+                batches.append(batch)
+                batch = []
+                used = prefix_length
+            batch.append(index)
+            used += needed
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def score(self, llm, prefix, prompts) -> List[Tuple[str, Dict[str, float]]]:
+        if self.label_tokens is None:
+            self.label_tokens = {
+                label: llm.tokenize(f" {label}".encode("utf-8"), add_bos=False)
+                for label in self.labels
+            }
+        prefix_tokens = llm.tokenize(prefix.encode("utf-8"))
+        prompt_tokens = [llm.tokenize(prompt.encode("utf-8")) for prompt in prompts]
+        # Tokenization can differ at the border between prefix and ticket, so
+        # only the prefix shared by all prompts is evaluated once
+        shared = min(
+            [self.__common_length(prefix_tokens, tokens) for tokens in prompt_tokens]
+            + [len(tokens) - 1 for tokens in prompt_tokens]
+        )
+        suffixes = [tokens[shared:] for tokens in prompt_tokens]
+
+        import llama_cpp
+
+        ctx = self.__context(llm)
+        results = [None] * len(prompts)
+        for batch in self.plan_batches(
+            shared,
+            [len(suffix) for suffix in suffixes],
+            llama_cpp.llama_n_ctx(ctx),
+            llama_cpp.llama_n_seq_max(ctx),
+        ):
+            batch_results = self.__score_batch(
+                llm, prefix_tokens[:shared], [suffixes[index] for index in batch]
+            )
+            for index, result in zip(batch, batch_results):
+                results[index] = result
+        return results
+
+    def __score_batch(self, llm, prefix_tokens, suffixes):
+        import llama_cpp
+        import numpy as np
+
+        ctx = self.__context(llm)
+        llama_cpp.llama_kv_cache_seq_rm(ctx, -1, -1, -1)
+        self.__decode(
+            llm,
+            [(token, position, 0, None) for position, token in enumerate(prefix_tokens)],
+        )
+
+        entries = []
+        ends = []
+        for index, suffix in enumerate(suffixes):
+            seq_id = index + 1
+            llama_cpp.llama_kv_cache_seq_cp(ctx, 0, seq_id, 0, len(prefix_tokens))
+            for offset, token in enumerate(suffix):
+                last = offset == len(suffix) - 1
+                entries.append(
+                    (token, len(prefix_tokens) + offset, seq_id, (index, None, 0) if last else None)
+                )
+            ends.append(len(prefix_tokens) + len(suffix))
+        logits = self.__decode(llm, entries)
+
+        # Multi-token labels continue from a copy of the ticket sequence
+        entries = []
+        seq_id = len(suffixes) + 1
+        for index in range(len(suffixes)):
+            for label, tokens in self.label_tokens.items():
+                if len(tokens) < 2:
+                    continue
+                llama_cpp.llama_kv_cache_seq_cp(ctx, index + 1, seq_id, 0, ends[index])
+                for offset, token in enumerate(tokens[:-1]):
+                    entries.append(
+                        (token, ends[index] + offset, seq_id, (index, label, offset + 1))
+                    )
+                seq_id += 1
+        logits.update(self.__decode(llm, entries))
+        llama_cpp.llama_kv_cache_seq_rm(ctx, -1, -1, -1)
+
+        results = []
+        for index in range(len(suffixes)):
+            log_likelihoods = {}
+            for label, tokens in self.label_tokens.items():
+                log_likelihood = 0.0
+                for position, token in enumerate(tokens):
+                    row = logits[(index, None, 0)] if position == 0 else logits[(index, label, position)]
+                    max_logit = row.max()
+                    log_likelihood += float(
+                        row[token] - max_logit - np.log(np.exp(row - max_logit).sum())
+                    )
+                log_likelihoods[label] = log_likelihood
+            results.append(self.__normalize(log_likelihoods))
+        return results
+
+    def __decode(self, llm, entries):
+        # entries are (token, position, seq_id, key), logits are returned for
+        # every entry with a key. Entries are split into chunks of n_batch.
+        import llama_cpp
+        import numpy as np
+
+        ctx = self.__context(llm)
+        n_vocab = llm.n_vocab()
+        n_batch = llm.n_batch
+        logits = {}
+        batch = llama_cpp.llama_batch_init(n_batch, 0, 1)
+        try:
+            for start in range(0, len(entries), n_batch):
+                chunk = entries[start : start + n_batch]
+                batch.n_tokens = len(chunk)
+                for index, (token, position, seq_id, key) in enumerate(chunk):
+                    batch.token[index] = token
+                    batch.pos[index] = position
+                    batch.n_seq_id[index] = 1
+                    batch.seq_id[index][0] = seq_id
+                    batch.logits[index] = key is not None
+                if llama_cpp.llama_decode(ctx, batch) != 0:
+                    raise RuntimeError("llama_decode failed, the batch does not fit into the context")
+                for index, (_, _, _, key) in enumerate(chunk):
+                    if key is not None:
+                        row = llama_cpp.llama_get_logits_ith(ctx, index)
+                        logits[key] = np.ctypeslib.as_array(row, shape=(n_vocab,)).astype(
+                            np.float64
+                        )
+        finally:
+            llama_cpp.llama_batch_free(batch)
+        return logits
+
+    def __context(self, llm):
+        # The context of llm holds a single sequence, so the batches run in a
+        # context of their own on the same model, with a sequence id for the
+        # prefix and for every ticket and multi-token label of a full batch
+        import llama_cpp
+
+        if self.context_llm is not llm:
+            self.close()
+            params = llama_cpp.llama_context_default_params()
+            sequences = 1 + sum(1 for tokens in self.label_tokens.values() if len(tokens) > 1)
+            params.n_seq_max = 1 + self.max_batch_size * sequences
+            # The sequences share one KV cache: the prefix plus one ticket
+            # prompt and its label continuations per ticket of the batch
+            params.n_ctx = llm.n_ctx() + self.max_batch_size * self.sequence_tokens
+            params.n_batch = llm.n_batch
+            params.n_threads = llm.n_threads
+            params.n_threads_batch = llm.n_threads_batch
+            context = llama_cpp.llama_new_context_with_model(llm.model, params)
+            if not context:
+                raise RuntimeError("Failed to create the llama.cpp context for batched scoring")
+            self.context = context
+            self.context_llm = llm
+        return self.context
+
+    def close(self):
+        if self.context is not None:
+            import llama_cpp
+
+            llama_cpp.llama_free(self.context)
+            self.context = None
+            self.context_llm = None
+
+    def __common_length(self, first, second):
+        length = 0
+        for a, b in zip(first, second):
+            if a != b:
+                break
+            length += 1
+        return length
+
+    def __normalize(self, log_likelihoods):
+        max_log_likelihood = max(log_likelihoods.values())
+        exps = {
+            label: math.exp(log_likelihood - max_log_likelihood)
+            for label, log_likelihood in log_likelihoods.items()
+        }
+        total = sum(exps.values())
+        probabilities = {label: value / total for label, value in exps.items()}
+        return max(probabilities, key=probabilities.get), probabilities
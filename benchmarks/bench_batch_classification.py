@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llama_cpp import Llama
+from batch_classifier import BatchedLabelScorer
+from label_scorer import LabelScorer
+from support_agent import MODEL_PATH, TRIGGER_PHRASES_PATH, build_prompt_template
+from trigger_matcher import load_trigger_phrases
+
+LABELS = ["RESEND_TICKET", "DELETE_ACCOUNT"]
+DESCRIPTIONS = [
+    "Hallo, ich habe gestern bestellt und seitdem nichts mehr gehört.",
+    "Kann ich mein Konto irgendwie auflösen? Ich nutze es nicht mehr.",
+    "Meine Bestellung ist nicht angekommen, bitte noch einmal schicken.",
+    "Bitte entfernen Sie alles, was Sie über mich gespeichert haben.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classification throughput by batch size")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--tickets", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    llm = Llama(model_path=args.model, n_ctx=4096, n_batch=512, verbose=False)
+    template = build_prompt_template(load_trigger_phrases(TRIGGER_PHRASES_PATH))
+    prefix = template.split("{support_ticket}")[0]
+    prompts = [
+        template.replace("{support_ticket}", DESCRIPTIONS[index % len(DESCRIPTIONS)])
+        for index in range(args.tickets)
+    ]
+
+    # Single-ticket baseline with the prefix state restored per ticket
+    scorer = LabelScorer(labels=LABELS)
+    llm.reset()
+    llm.eval(llm.tokenize(prefix.encode("utf-8")))
+    state = llm.save_state()
+    start = time.perf_counter()
+    for prompt in prompts:
+        llm.load_state(state)
+        scorer.score(llm, prompt)
+    elapsed = time.perf_counter() - start
+    print(f"single ticket:  {args.tickets / elapsed:8.2f} tickets/s")
+
+    for batch_size in args.batch_sizes:
+        batched_scorer = BatchedLabelScorer(labels=LABELS, max_batch_size=batch_size)
+        start = time.perf_counter()
+        batched_scorer.score(llm, prefix, prompts)
+        elapsed = time.perf_counter() - start
+        print(f"batch size {batch_size:>3}: {args.tickets / elapsed:8.2f} tickets/s")
+        batched_scorer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# SupportAgent.solve_tickets asks for count:50
+SOLVE_TICKET_COUNT = 50
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "zendesk_recording.json")
+
+
+def load_fixture(path):
+    with open(path, "r", encoding="utf-8") as infile:
+        return json.load(infile)
+
+
+def make_tickets(recorded_tickets, count):
+    # The recorded tickets are repeated with fresh ids up to count
+    tickets = []
+    for ticket_id in range(1, count + 1):
+        ticket = copy.deepcopy(recorded_tickets[(ticket_id - 1) % len(recorded_tickets)])
+        ticket["id"] = ticket_id
+        ticket["url"] = ticket["url"].rsplit("/", 1)[0] + f"/{ticket_id}.json"
+        tickets.append(ticket)
+    return tickets
+
+
+def run_child(args):
+    # Runs in its own process, so peak RSS is the agent's alone
+    from stub_llm import StubLlama
+    from support_agent import SupportAgent
+
+    workdir = tempfile.mkdtemp()
+    support_agent = SupportAgent(
+        model_path=args.model or "stub",
+        classification_mode=args.classification_mode,
+        prompt_cache_path=None,
+        classification_cache_path=None,
+        history_path=os.path.join(workdir, "history.jsonl"),
+        journal_path=os.path.join(workdir, "run_journal.db"),
+        reply_workers=args.reply_workers,
+        bulk_replies=args.bulk_replies,
+        # The stub server has no rate limit
+        rate_limit=10**9,
+        zendesk_base_url=args.base_url,
+    )
+    if not args.model:
+        support_agent.llm = StubLlama(
+            prefill_seconds_per_token=args.stub_prefill_ms / 1000,
+            decode_seconds_per_token=args.stub_decode_ms / 1000,
+        )
+    start = time.perf_counter()
+    if args.mode == "pipeline":
+        support_agent.solve_tickets_pipelined(page_size=args.page_size)
+    elif args.mode == "backlog":
+        support_agent.solve_ticket_backlog(page_size=args.page_size)
+    else:
+        support_agent.solve_tickets()
+    seconds = time.perf_counter() - start
+    result = {
+        "seconds": round(seconds, 3),
+        "tickets": support_agent.run_stats["tickets"],
+        "tickets_per_second": round(support_agent.run_stats["tickets"] / seconds, 2),
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "run_stats": support_agent.run_stats,
+        "spans": support_agent.tracer.summary(),
+        "requests": support_agent.zendesk_service.scheduler.metrics.as_dict(),
+    }
+    support_agent.close()
+    with open(args.result_path, "w") as outfile:
+        outfile.write(json.dumps(result))
+
+
+def run_size(args, fixture, count):
+    from tests.stub_zendesk_server import StubZendeskServer
+
+    server = StubZendeskServer(
+        tickets=make_tickets(fixture["tickets"], count), macros=fixture["macros"]
+    ).start()
+    result_path = os.path.join(tempfile.mkdtemp(), "result.json")
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--child",
+        "--base-url",
+        server.base_url,
+        "--result-path",
+        result_path,
+        "--mode",
+        args.mode,
+        "--classification-mode",
+        args.classification_mode,
+        "--reply-workers",
+        str(args.reply_workers),
+        "--page-size",
+        str(args.page_size),
+        "--stub-prefill-ms",
+        str(args.stub_prefill_ms),
+        "--stub-decode-ms",
+        str(args.stub_decode_ms),
+    ]
+    if args.model:
+        command += ["--model", args.model]
+    if args.bulk_replies:
+        command.append("--bulk-replies")
+    try:
+        subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        with open(result_path, "r") as infile:
+            result = json.load(infile)
+    finally:
+        server.stop()
+    result["size"] = count
+    result["http_calls"] = dict(server.calls)
+    result["replies"] = len(server.replies)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_result(result, baseline=None):
+    spans = result["spans"]
+    latencies = ", ".join(
+        f"{name} p50/p95/p99 {spans[name]['p50_ms']}/{spans[name]['p95_ms']}/{spans[name]['p99_ms']}ms"
+        for name in ("classify", "llm", "macro", "reply")
+        if name in spans
+    )
+    line = (
+        f"{result['size']:>7} tickets: {result['tickets_per_second']:>9.1f} tickets/s, "
+        f"{result['seconds']:>8.2f}s, peak RSS {result['peak_rss_mib']:.0f} MiB, "
+        f"{sum(result['http_calls'].values())} HTTP calls"
+    )
+    if baseline is not None and baseline.get("tickets_per_second"):
+        change = result["tickets_per_second"] / baseline["tickets_per_second"] - 1
+        line += f" ({change:+.1%} vs baseline)"
+    print(line)
+    print(f"{'':>17}{latencies}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end SupportAgent runs against a stub Zendesk serving recorded responses"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100_000])
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="tiny GGUF model, without it a deterministic stub LLM is used",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["solve", "backlog", "pipeline"],
+        default="backlog",
+        help="solve only answers the first 50 tickets, like one run against Zendesk",
+    )
+    parser.add_argument(
+        "--classification-mode",
+        choices=["generate", "constrained", "batched"],
+        default="generate",
+        help="the stub LLM only supports generate",
+    )
+    parser.add_argument("--reply-workers", type=int, default=8)
+    parser.add_argument("--bulk-replies", action="store_true")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--stub-prefill-ms", type=float, default=0.0, help="simulated ms per prompt token")
+    parser.add_argument("--stub-decode-ms", type=float, default=0.0, help="simulated ms per generated token")
+    parser.add_argument("--output", default="bench_end_to_end.json", help="results are saved here")
+    parser.add_argument("--baseline", default=None, help="results of an earlier run to compare with")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+    if not args.model and args.classification_mode != "generate":
+        parser.error("--classification-mode constrained and batched need --model")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r") as infile:
+            baseline = {result["size"]: result for result in json.load(infile)["results"]}
+
+    if args.mode == "solve" and max(args.sizes) > SOLVE_TICKET_COUNT:
+        print(
+            f"--mode solve fetches {SOLVE_TICKET_COUNT} tickets per run, "
+            "larger sizes measure the same run; use backlog or pipeline for them"
+        )
+
+    fixture = load_fixture(args.fixture)
+    results = []
+    for count in args.sizes:
+        result = run_size(args, fixture, count)
+        print_result(result, baseline.get(count))
+        results.append(result)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "model": args.model or "stub",
+            "mode": args.mode,
+            "classification_mode": args.classification_mode,
+            "reply_workers": args.reply_workers,
+            "bulk_replies": args.bulk_replies,
+            "stub_prefill_ms": args.stub_prefill_ms,
+            "stub_decode_ms": args.stub_decode_ms,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as outfile:
+        outfile.write(json.dumps(report, indent=2))
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
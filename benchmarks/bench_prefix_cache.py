@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llama_cpp import Llama
+from prompt_cache import PromptPrefixCache
+from support_agent import MODEL_PATH, TRIGGER_PHRASES_PATH, build_prompt_template
+from trigger_matcher import load_trigger_phrases
+
+TICKETS = [
+    "Hallo, ich finde meine Tickets nicht mehr. Können Sie sie neu senden?",
+    "Bitte löschen Sie meinen Account und alle meine Daten (DSGVO).",
+    "Ich habe keine E-Mail mit den Tickets erhalten.",
+    "Wie kann ich meine Daten entfernen lassen?",
+]
+
+
+def run(llm, template, prompt_cache=None):
+    prefill_tokens = []
+    latencies = []
+    for ticket in TICKETS:
+        prompt = template.replace("{support_ticket}", ticket)
+        start = time.perf_counter()
+        if prompt_cache is None:
+            llm.reset()
+            prefill_tokens.append(len(llm.tokenize(prompt.encode("utf-8"))))
+        else:
+            prompt_cache.restore(llm)
+            prefill_tokens.append(prompt_cache.prefill_tokens(llm, prompt))
+        llm(prompt, max_tokens=1, echo=False)
+        latencies.append(time.perf_counter() - start)
+    return prefill_tokens, latencies
+
+
+def report(name, prefill_tokens, latencies):
+    print(
+        f"{name:<12} prefill tokens/ticket: {sum(prefill_tokens) / len(prefill_tokens):8.1f}"
+        f"   latency/ticket: {1000 * sum(latencies) / len(latencies):8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-ticket prefill with and without the prompt prefix cache")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--cache-path", default="bench_prompt_cache.bin")
+    args = parser.parse_args()
+
+    llm = Llama(model_path=args.model, n_ctx=2048, verbose=False)
+    template = build_prompt_template(load_trigger_phrases(TRIGGER_PHRASES_PATH))
+
+    report("cold", *run(llm, template))
+
+    prefix = template.split("{support_ticket}")[0]
+    if os.path.exists(args.cache_path):
+        os.remove(args.cache_path)
+    prompt_cache = PromptPrefixCache(prefix, args.model, cache_path=args.cache_path)
+    start = time.perf_counter()
+    prompt_cache.restore(llm)
+    print(f"prefix evaluated once in {1000 * (time.perf_counter() - start):.1f} ms")
+    report("prefix cache", *run(llm, template, prompt_cache))
+
+    # A new process only has to load the snapshot from disk
+    reloaded = PromptPrefixCache(prefix, args.model, cache_path=args.cache_path)
+    start = time.perf_counter()
+    reloaded.restore(llm)
+    print(f"snapshot restored from disk in {1000 * (time.perf_counter() - start):.1f} ms")
+    report("from disk", *run(llm, template, reloaded))
+
+
+if __name__ == "__main__":
+    main()
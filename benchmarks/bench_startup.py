@@ -0,0 +1,64 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import support_agent
+print(time.perf_counter() - start)
+"""
+
+
+def measure_import():
+    # A fresh interpreter, otherwise the modules are already cached
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of SupportAgent broken down by phase")
+    parser.add_argument("--model", default=None, help="GGUF model, defaults to MODEL_PATH")
+    args = parser.parse_args()
+
+    from support_agent import MODEL_PATH, SupportAgent
+
+    print(f"import support_agent: {1000 * measure_import():8.1f} ms")
+
+    start = time.perf_counter()
+    support_agent = SupportAgent(
+        model_path=args.model or MODEL_PATH,
+        prompt_cache_path=None,
+        classification_cache_path=None,
+        history_path=None,
+        journal_path=None,
+    )
+    print(f"SupportAgent():       {1000 * (time.perf_counter() - start):8.1f} ms")
+
+    start = time.perf_counter()
+    llm = support_agent.llm
+    print(f"model load (mmap):    {1000 * (time.perf_counter() - start):8.1f} ms")
+
+    start = time.perf_counter()
+    support_agent.prompt.format(support_ticket="Hallo")
+    print(f"LangChain prompt:     {1000 * (time.perf_counter() - start):8.1f} ms")
+
+    start = time.perf_counter()
+    llm("Hallo", max_tokens=1, echo=False)
+    print(f"first token:          {1000 * (time.perf_counter() - start):8.1f} ms")
+    support_agent.close()
+
+
+if __name__ == "__main__":
+    main()
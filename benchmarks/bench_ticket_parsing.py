@@ -0,0 +1,140 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ticket_parser
+from ticket_parser import parse_ticket_page
+
+
+class DictTicket:
+    # The SupportTicket before slots and enums, for comparison
+    def __init__(self, ticket_id, customer_email, status, subject, description, classification):
+        self.ticket_id = ticket_id
+        self.customer_email = customer_email
+        self.status = status
+        self.subject = subject
+        self.description = description
+        self.classification = classification
+
+
+def make_page(n_tickets):
+    # Roughly the shape of a Zendesk ticket, most fields are never read
+    tickets = []
+    for ticket_id in range(1, n_tickets + 1):
+        tickets.append(
+            {
+                "url": f"https://example.zendesk.com/api/v2/tickets/{ticket_id}.json",
+                "id": ticket_id,
+                "external_id": None,
+                "via": {
+                    "channel": "email",
+                    "source": {
+                        "from": {"address": f"customer{ticket_id}@example.com", "name": "Customer"},
+                        "to": {"address": "support@example.com", "name": "Support"},
+                        "rel": None,
+                    },
+                },
+                "created_at": "2023-10-01T08:00:00Z",
+                "updated_at": "2023-10-01T08:05:00Z",
+                "type": None,
+                "subject": f"Tickets nicht erhalten ({ticket_id})",
+                "raw_subject": f"Tickets nicht erhalten ({ticket_id})",
+                "description": "Hallo, ich habe meine Tickets nicht erhalten. "
+                "Bitte senden Sie sie erneut an meine E-Mail-Adresse. " * 4,
+                "priority": "normal",
+                "status": "open",
+                "recipient": "support@example.com",
+                "requester_id": 1000000 + ticket_id,
+                "submitter_id": 1000000 + ticket_id,
+                "assignee_id": None,
+                "organization_id": None,
+                "group_id": 360000000001,
+                "collaborator_ids": [],
+                "follower_ids": [],
+                "email_cc_ids": [],
+                "has_incidents": False,
+                "is_public": True,
+                "tags": ["eticket", "resend", "web"],
+                "custom_fields": [{"id": 360000000000 + index, "value": None} for index in range(8)],
+                "satisfaction_rating": {"score": "unoffered"},
+                "sharing_agreement_ids": [],
+                "brand_id": 360000000002,
+                "allow_channelback": False,
+                "allow_attachments": True,
+            }
+        )
+    return json.dumps(
+        {"tickets": tickets, "meta": {"has_more": False}, "links": {"next": None}}
+    ).encode("utf-8")
+
+
+def parse_with_json_text(body):
+    # The old path: response.text, json.loads and a dict-backed ticket
+    json_response = json.loads(body.decode("utf-8"))
+    return [
+        DictTicket(
+            ticket_id=ticket_data["id"],
+            customer_email=ticket_data["via"]["source"]["from"]["address"],
+            status=ticket_data["status"],
+            subject=ticket_data["subject"],
+            description=ticket_data["description"],
+            classification=None,
+        )
+        for ticket_data in json_response["tickets"]
+    ]
+
+
+def parse_compact(body):
+    return parse_ticket_page(body)["tickets"]
+
+
+def measure(name, parse, pages):
+    # Timed without tracemalloc, which slows down allocations a lot
+    gc.collect()
+    start = time.perf_counter()
+    n_tickets = sum(len(parse(body)) for body in pages)
+    seconds = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    tickets = []
+    for body in pages:
+        tickets.extend(parse(body))
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<16} {n_tickets / seconds:>10.0f} tickets/s  "
+        f"peak {peak / 2**20:7.1f} MiB  retained {retained / 2**20:7.1f} MiB  "
+        f"{retained / len(tickets):6.0f} B/ticket"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and memory of parsing ticket pages")
+    parser.add_argument("--tickets", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    page = make_page(args.page_size)
+    pages = [page] * (args.tickets // args.page_size)
+    print(f"{len(pages)} pages of {len(page) / 1024:.0f} KiB")
+
+    measure("json + dict", parse_with_json_text, pages)
+    orjson = ticket_parser.orjson
+    ticket_parser.orjson = None
+    measure("json + slots", parse_compact, pages)
+    ticket_parser.orjson = orjson
+    if orjson is not None:
+        measure("orjson + slots", parse_compact, pages)
+    else:
+        print("orjson is not installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from support_agent import SupportAgent
+from support_ticket import SupportTicket
+
+DESCRIPTIONS = [
+    "Hallo, ich habe gestern bestellt und seitdem nichts mehr gehört.",
+    "Kann ich mein Konto irgendwie auflösen? Ich nutze es nicht mehr.",
+    "Meine Bestellung ist nicht angekommen, bitte noch einmal schicken.",
+    "Bitte entfernen Sie alles, was Sie über mich gespeichert haben.",
+]
+
+
+def make_tickets(count):
+    return [
+        SupportTicket(
+            ticket_id=ticket_id,
+            customer_email=f"customer{ticket_id}@example.com",
+            status="open",
+            subject=f"Ticket {ticket_id}",
+            description=DESCRIPTIONS[ticket_id % len(DESCRIPTIONS)],
+            classification=None,
+        )
+        for ticket_id in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classification throughput by number of worker processes")
+    parser.add_argument("--model", required=True, help="path to a tiny local GGUF model")
+    parser.add_argument("--tickets", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    # No trigger phrases, so every ticket goes through the model
+    trigger_phrases_path = os.path.join(tempfile.mkdtemp(), "trigger_phrases.json")
+    with open(trigger_phrases_path, "w") as outfile:
+        outfile.write(json.dumps({"RESEND_TICKET": [], "DELETE_ACCOUNT": []}))
+
+    results = []
+    for workers in args.workers:
+        support_agent = SupportAgent(
+            model_path=args.model,
+            trigger_phrases_path=trigger_phrases_path,
+            classification_mode="constrained",
+            prompt_cache_path=None,
+            classification_workers=workers,
+            # Cached labels would turn repeated descriptions into lookups
+            classification_cache_path=None,
+            history_path=None,
+            journal_path=None,
+            n_threads=max(1, (os.cpu_count() or 1) // workers),
+        )
+        # Warm up the workers so model loading is not measured
+        support_agent.classify_tickets(make_tickets(workers))
+        tickets = make_tickets(args.tickets)
+        start = time.perf_counter()
+        support_agent.classify_tickets(tickets)
+        elapsed = time.perf_counter() - start
+        support_agent.close()
+        results.append({"workers": workers, "tickets_per_second": args.tickets / elapsed})
+        print(f"{workers} workers: {args.tickets / elapsed:8.2f} tickets/s")
+
+    baseline = results[0]["tickets_per_second"]
+    for result in results:
+        print(f"{result['workers']} workers: {result['tickets_per_second'] / baseline:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
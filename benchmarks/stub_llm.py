@@ -0,0 +1,80 @@
+import re
+import threading
+import time
+
+# Ticket words that make the stub answer DELETE_ACCOUNT, anything else is
+# RESEND_TICKET. Only the ticket after [/INST] is looked at, the few-shot
+# examples of the prompt contain both labels.
+DELETE_WORDS = ("lösch", "entfern", "konto", "account", "gespeichert")
+
+
+class StubLlama:
+    def __init__(self, prefill_seconds_per_token=0.0, decode_seconds_per_token=0.0, n_ctx=2048):
+        # Deterministic stand-in for llama_cpp.Llama in generate mode. Words
+        # are tokens, and the optional per-token sleeps simulate model cost.
+        self.prefill_seconds_per_token = prefill_seconds_per_token
+        self.decode_seconds_per_token = decode_seconds_per_token
+        self._n_ctx = n_ctx
+        self.vocab = {}
+        self.words = []
+        self.input_ids = []
+        self.n_tokens = 0
+        self.lock = threading.Lock()
+
+    def tokenize(self, text, add_bos=True):
+        tokens = [1] if add_bos else []
+        with self.lock:
+            for word in re.findall(r"\S+", text.decode("utf-8", errors="ignore")):
+                if word not in self.vocab:
+                    self.vocab[word] = len(self.words) + 2
+                    self.words.append(word)
+                tokens.append(self.vocab[word])
+        return tokens
+
+    def detokenize(self, tokens):
+        return " ".join(self.words[token - 2] for token in tokens if token >= 2).encode("utf-8")
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def reset(self):
+        self.input_ids = []
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        self.input_ids = self.input_ids[: self.n_tokens] + list(tokens)
+        self.n_tokens = len(self.input_ids)
+        self.__sleep(self.prefill_seconds_per_token * len(tokens))
+
+    def save_state(self):
+        return (self.n_tokens, tuple(self.input_ids))
+
+    def load_state(self, state):
+        self.n_tokens, input_ids = state
+        self.input_ids = list(input_ids)
+
+    def __call__(self, prompt, echo=False, **kwargs):
+        tokens = self.tokenize(prompt.encode("utf-8"))
+        # Like llama.cpp, the prefix already in the context is not evaluated again
+        matched = 0
+        for cached, token in zip(self.input_ids[: self.n_tokens], tokens):
+            if cached != token:
+                break
+            matched += 1
+        self.n_tokens = matched
+        self.eval(tokens[matched:])
+        ticket = prompt.rsplit("[/INST]", 1)[-1].casefold()
+        label = "DELETE_ACCOUNT" if any(word in ticket for word in DELETE_WORDS) else "RESEND_TICKET"
+        self.__sleep(self.decode_seconds_per_token * 2)
+        return {
+            "choices": [{"text": f" {label}", "index": 0, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": len(tokens),
+                "completion_tokens": 2,
+                "total_tokens": len(tokens) + 2,
+            },
+        }
+
+    def __sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
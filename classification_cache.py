@@ -0,0 +1,134 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from ticket_text import normalize_description
+
+# Other tickets only share a label when their normalized text is at least
+# this long, empty or greeting-only tickets would collide otherwise
+MIN_SHARED_LENGTH = 20
+
+
+class ClassificationCache:
+    def __init__(
+        self,
+        path="classification_cache.db",
+        fingerprint="",
+        max_entries=100000,
+        max_age=30 * 24 * 3600,
+    ):
+        # fingerprint identifies the prompt template and model, cached labels
+        # of another fingerprint are dropped
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS classifications (
+                ticket_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                label TEXT NOT NULL,
+                confidence REAL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (ticket_id, content_hash)
+            );
+            CREATE INDEX IF NOT EXISTS classifications_content_hash
+                ON classifications (content_hash, created_at);
+            CREATE INDEX IF NOT EXISTS classifications_created_at
+                ON classifications (created_at);
+            """
+        )
+        self.__check_fingerprint(fingerprint)
+
+    def get(self, ticket_id, description, subject=""):
+        content_hash = self.content_hash(description, subject)
+        oldest = time.time() - self.max_age
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT label, confidence FROM classifications "
+                "WHERE ticket_id = ? AND content_hash = ? AND created_at >= ?",
+                (str(ticket_id), content_hash, oldest),
+            ).fetchone()
+            if row is None and len(normalize_description(description)) >= MIN_SHARED_LENGTH:
+                # A different ticket with the same normalized text
+                row = self.connection.execute(
+                    "SELECT label, confidence FROM classifications "
+                    "WHERE content_hash = ? AND created_at >= ? "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (content_hash, oldest),
+                ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0], row[1]
+
+    def put(self, ticket_id, description, label, confidence=None, subject=""):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?)",
+                (
+                    str(ticket_id),
+                    self.content_hash(description, subject),
+                    label,
+                    confidence,
+                    time.time(),
+                ),
+            )
+            self.connection.commit()
+            self.puts += 1
+            if self.puts % 100 == 0:
+                self.__evict()
+
+    def evict(self):
+        with self.lock:
+            self.__evict()
+
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute(
+                "SELECT COUNT(*) FROM classifications"
+            ).fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @staticmethod
+    def content_hash(description, subject=""):
+        # Subject and body are both part of the prompt, so both are part of the key
+        return hashlib.sha256(
+            f"{normalize_description(subject)}\n{normalize_description(description)}".encode("utf-8")
+        ).hexdigest()
+
+    def __evict(self):
+        self.connection.execute(
+            "DELETE FROM classifications WHERE created_at < ?",
+            (time.time() - self.max_age,),
+        )
+        self.connection.execute(
+            "DELETE FROM classifications WHERE rowid IN ("
+            "SELECT rowid FROM classifications ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self.connection.commit()
+
+    def __check_fingerprint(self, fingerprint):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'fingerprint'"
+            ).fetchone()
+            if row is not None and row[0] == fingerprint:
+                return
+            self.connection.execute("DELETE FROM classifications")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,)
+            )
+            self.connection.commit()
@@ -0,0 +1,54 @@
+import math
+import multiprocessing
+import os
+from typing import List
+from support_ticket import SupportTicket
+
+worker_agent = None
+
+
+def init_worker(agent_kwargs):
+    global worker_agent
+    # Imported here because support_agent imports this module
+    from support_agent import SupportAgent
+
+    worker_agent = SupportAgent(**agent_kwargs)
+
+
+def classify_shard(support_tickets):
+    worker_agent.history = []
+    worker_agent.run_stats = {}
+    classified_tickets = worker_agent.classify_tickets(support_tickets)
+    return classified_tickets, worker_agent.history, worker_agent.run_stats
+
+
+class ClassificationWorkerPool:
+    def __init__(self, n_workers, agent_kwargs):
+        # Every worker process opens the same GGUF file with use_mmap, so the
+        # weights live once in the page cache and only the contexts are per
+        # process. The cores are split between the workers.
+        self.n_workers = n_workers
+        self.n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+        worker_kwargs = dict(
+            agent_kwargs,
+            n_threads=self.n_threads,
+            classification_workers=1,
+            reply_workers=1,
+        )
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(
+            processes=n_workers, initializer=init_worker, initargs=(worker_kwargs,)
+        )
+
+    def classify(self, support_tickets: List[SupportTicket]):
+        # Small shards keep the workers busy when ticket lengths differ
+        shard_size = max(1, math.ceil(len(support_tickets) / (self.n_workers * 4)))
+        shards = [
+            support_tickets[start : start + shard_size]
+            for start in range(0, len(support_tickets), shard_size)
+        ]
+        return self.pool.map(classify_shard, shards)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from support_ticket import SupportTicket
+from zendesk_service import ZendeskService
+
+
+class ConcurrentZendeskService(ZendeskService):
+    def __init__(self, max_workers=8, **kwargs):
+        # The connection pool is as large as the number of workers, so every
+        # worker keeps its own keep-alive connection
+        super().__init__(pool_size=max_workers, **kwargs)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="zendesk"
+        )
+
+    def map(self, fn, items) -> List:
+        # At most max_workers calls are in flight, results keep input order
+        return list(self.executor.map(fn, items))
+
+    def get_tickets_by_id(self, ticket_ids) -> List[SupportTicket]:
+        return self.map(self.get_ticket, ticket_ids)
+
+    def utilize_mail_templates(self, macro_ids) -> Dict:
+        macro_ids = list(dict.fromkeys(macro_ids))
+        responses = self.map(
+            lambda macro_id: self.utilize_mail_template(macro_id=macro_id), macro_ids
+        )
+        return dict(zip(macro_ids, responses))
+
+    def reply_to_customers(self, replies) -> List:
+        # replies is an iterable of (ticket_id, payload) pairs
+        return self.map(
+            lambda reply: self.reply_to_customer(ticket_id=reply[0], payload=reply[1]),
+            replies,
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        super().close()
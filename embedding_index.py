@@ -0,0 +1,112 @@
+import json
+import os
+from collections import defaultdict
+import numpy as np
+from history_log import read_history
+
+
+class EmbeddingIndex:
+    def __init__(self, path="embedding_index"):
+        # The normalized embeddings of labelled tickets live in path.npy and
+        # are memory-mapped, labels and ticket ids live in path.json
+        self.path = path
+        self.matrix = None
+        self.labels = []
+        self.ticket_ids = []
+        self.pending_vectors = []
+        self.pending_labels = []
+        self.pending_ticket_ids = []
+        if os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json"):
+            self.matrix = np.load(f"{path}.npy", mmap_mode="r")
+            with open(f"{path}.json", "r") as infile:
+                metadata = json.load(infile)
+            self.labels = metadata["labels"]
+            self.ticket_ids = metadata["ticket_ids"]
+
+    def __len__(self):
+        return len(self.labels) + len(self.pending_labels)
+
+    def add(self, vector, label, ticket_id=None):
+        # New examples are searchable right away and written on save()
+        self.pending_vectors.append(self.__normalize(np.asarray(vector, dtype=np.float32)))
+        self.pending_labels.append(label)
+        self.pending_ticket_ids.append(ticket_id)
+
+    def query(self, vector, k=10):
+        # Returns the label with the highest similarity-weighted vote among
+        # the top k neighbours and the margin of its vote over the runner-up
+        if not len(self):
+            return None, 0.0, {}
+        vector = self.__normalize(np.asarray(vector, dtype=np.float32))
+        similarities = []
+        if self.matrix is not None and len(self.matrix):
+            similarities.append(self.matrix @ vector)
+        if self.pending_vectors:
+            similarities.append(np.stack(self.pending_vectors) @ vector)
+        similarities = np.concatenate(similarities)
+        labels = self.labels + self.pending_labels
+
+        k = min(k, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        votes = defaultdict(float)
+        for index in top:
+            votes[labels[index]] += max(float(similarities[index]), 0.0)
+        total = sum(votes.values())
+        if not total:
+            return None, 0.0, {}
+        ranked = sorted(votes.items(), key=lambda vote: vote[1], reverse=True)
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        shares = {label: vote / total for label, vote in ranked}
+        return ranked[0][0], (ranked[0][1] - runner_up) / total, shares
+
+    def save(self):
+        if not self.pending_vectors:
+            return
+        pending = np.stack(self.pending_vectors).astype(np.float32)
+        matrix = pending if self.matrix is None else np.concatenate([self.matrix, pending])
+        labels = self.labels + self.pending_labels
+        ticket_ids = self.ticket_ids + self.pending_ticket_ids
+        # Written next to the old files and swapped in, so readers never see
+        # a half written index
+        np.save(f"{self.path}.tmp.npy", matrix)
+        with open(f"{self.path}.tmp.json", "w") as outfile:
+            outfile.write(json.dumps({"labels": labels, "ticket_ids": ticket_ids}))
+        self.matrix = None
+        os.replace(f"{self.path}.tmp.npy", f"{self.path}.npy")
+        os.replace(f"{self.path}.tmp.json", f"{self.path}.json")
+        self.matrix = np.load(f"{self.path}.npy", mmap_mode="r")
+        self.labels = labels
+        self.ticket_ids = ticket_ids
+        self.pending_vectors = []
+        self.pending_labels = []
+        self.pending_ticket_ids = []
+
+    def build_from_history(self, history_path, embed, labels):
+        # embed maps a SupportTicket dict to its vector, only tickets with
+        # one of the given labels are indexed
+        known = set(self.ticket_ids + self.pending_ticket_ids)
+        for interaction in self.__read_history(history_path):
+            for entry in interaction.values():
+                support_ticket = entry["support_ticket"]
+                if support_ticket.get("classification") not in labels:
+                    continue
+                if support_ticket.get("ticket_id") in known:
+                    continue
+                known.add(support_ticket.get("ticket_id"))
+                self.add(
+                    embed(support_ticket),
+                    support_ticket["classification"],
+                    support_ticket.get("ticket_id"),
+                )
+        self.save()
+
+    def __read_history(self, history_path):
+        # history.jsonl of the history log or the old history.json export
+        if history_path.endswith(".json"):
+            with open(history_path, "r") as infile:
+                return json.load(infile)
+        return read_history(history_path)
+
+    def __normalize(self, vector):
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,149 @@
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+CHUNK_HEADER = struct.Struct(">I")
+
+
+class HistoryLog:
+    def __init__(self, path="history.jsonl", compress=False, buffer_size=64 * 1024, fsync_interval=5.0):
+        # Entries are appended as JSON Lines. With compress, the buffered lines
+        # are written as length-prefixed brotli chunks, so the file can still
+        # be appended to by later runs. Compressed logs always end in .br,
+        # which is how read_history recognizes them.
+        if compress and not path.endswith(".br"):
+            path += ".br"
+        self.path = path
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.entries = 0
+        self.last_fsync = time.monotonic()
+        self.lock = threading.Lock()
+        self.__truncate_torn_record()
+        self.file = open(path, "ab")
+
+    def append(self, entry):
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self.lock:
+            self.buffer.append(line)
+            self.buffered_bytes += len(line)
+            self.entries += 1
+            if self.buffered_bytes >= self.buffer_size:
+                self.__write_buffer()
+            if time.monotonic() - self.last_fsync >= self.fsync_interval:
+                self.__sync()
+
+    def flush(self):
+        with self.lock:
+            self.__sync()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.__sync()
+            self.file.close()
+
+    def __write_buffer(self):
+        if not self.buffer:
+            return
+        data = b"".join(self.buffer)
+        if self.compress:
+            import brotli
+
+            data = brotli.compress(data)
+            self.file.write(CHUNK_HEADER.pack(len(data)) + data)
+        else:
+            self.file.write(data)
+        self.buffer = []
+        self.buffered_bytes = 0
+
+    def __truncate_torn_record(self):
+        # A crashed run can leave a partial last line or chunk. It is cut off
+        # before appending, otherwise it would end up in the middle of the file.
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        end = self.__last_chunk_end(size) if self.compress else self.__last_line_end(size)
+        if end < size:
+            print(f"Removing {size - end} bytes of a torn record from {self.path}")
+            os.truncate(self.path, end)
+
+    def __last_line_end(self, size, block_size=64 * 1024):
+        with open(self.path, "rb") as infile:
+            position = size
+            while position > 0:
+                start = max(0, position - block_size)
+                infile.seek(start)
+                newline = infile.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    return start + newline + 1
+                position = start
+        return 0
+
+    def __last_chunk_end(self, size):
+        end = 0
+        with open(self.path, "rb") as infile:
+            while end + CHUNK_HEADER.size <= size:
+                infile.seek(end)
+                length = CHUNK_HEADER.unpack(infile.read(CHUNK_HEADER.size))[0]
+                if end + CHUNK_HEADER.size + length > size:
+                    break
+                end += CHUNK_HEADER.size + length
+        return end
+
+    def __sync(self):
+        self.__write_buffer()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_fsync = time.monotonic()
+
+
+def read_history(path, compress=None):
+    # Streams the entries of a history log one by one
+    if compress is None:
+        compress = path.endswith(".br")
+    with open(path, "rb") as infile:
+        if not compress:
+            for line in infile:
+                if line.endswith(b"\n"):
+                    yield json.loads(line)
+            return
+        import brotli
+
+        while True:
+            header = infile.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+            data = infile.read(CHUNK_HEADER.unpack(header)[0])
+            if len(data) < CHUNK_HEADER.unpack(header)[0]:
+                # The last chunk of a crashed run was only written partially
+                return
+            for line in brotli.decompress(data).splitlines():
+                yield json.loads(line)
+
+
+def tail_history(path, count=10, compress=None):
+    return list(deque(read_history(path, compress=compress), maxlen=count))
+
+
+def follow_history(path, poll_interval=1.0):
+    # Yields entries of an uncompressed log as they are appended, like tail -f
+    with open(path, "rb") as infile:
+        infile.seek(0, os.SEEK_END)
+        pending = b""
+        while True:
+            line = infile.readline()
+            if not line:
+                time.sleep(poll_interval)
+                continue
+            pending += line
+            if pending.endswith(b"\n"):
+                yield json.loads(pending)
+                pending = b""
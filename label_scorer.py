@@ -0,0 +1,68 @@
+import math
+from typing import Dict, List, Tuple
+
+
+class LabelScorer:
+    def __init__(self, labels: List[str]):
+        # Classification only ever picks one of these labels, so instead of
+        # sampling free text every label continuation is scored directly
+        self.labels = list(labels)
+        self.label_tokens = None
+
+    def score(self, llm, prompt) -> Tuple[str, Dict[str, float]]:
+        if self.label_tokens is None:
+            self.label_tokens = {
+                label: llm.tokenize(f" {label}".encode("utf-8"), add_bos=False)
+                for label in self.labels
+            }
+        self.__eval_prompt(llm, prompt)
+        base = llm.n_tokens
+        base_logits = llm.scores[base - 1].copy()
+
+        log_likelihoods = {}
+        for label, tokens in self.label_tokens.items():
+            # Rewind to the end of the prompt before scoring the next label
+            llm.n_tokens = base
+            logits = base_logits
+            log_likelihood = 0.0
+            for position, token in enumerate(tokens):
+                log_likelihood += self.__log_softmax(logits, token)
+                if position < len(tokens) - 1:
+                    llm.eval([token])
+                    logits = llm.scores[llm.n_tokens - 1]
+            log_likelihoods[label] = log_likelihood
+        llm.n_tokens = base
+
+        probabilities = self.__normalize(log_likelihoods)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities
+
+    def __eval_prompt(self, llm, prompt):
+        prompt_tokens = llm.tokenize(prompt.encode("utf-8"))
+        # Keep whatever prefix is already evaluated in the context (for
+        # example the restored system prompt) and only evaluate the rest
+        matched = 0
+        for cached, token in zip(llm.input_ids[: llm.n_tokens], prompt_tokens):
+            if cached != token:
+                break
+            matched += 1
+        matched = min(matched, len(prompt_tokens) - 1)
+        llm.n_tokens = matched
+        llm.eval(prompt_tokens[matched:])
+
+    def __log_softmax(self, logits, token):
+        import numpy as np
+
+        logits = np.asarray(logits, dtype=np.float64)
+        max_logit = logits.max()
+        log_sum = max_logit + np.log(np.exp(logits - max_logit).sum())
+        return float(logits[token] - log_sum)
+
+    def __normalize(self, log_likelihoods):
+        max_log_likelihood = max(log_likelihoods.values())
+        exps = {
+            label: math.exp(log_likelihood - max_log_likelihood)
+            for label, log_likelihood in log_likelihoods.items()
+        }
+        total = sum(exps.values())
+        return {label: value / total for label, value in exps.items()}
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+
+
+class MacroCache:
+    def __init__(self, ttl=300, path=None):
+        # ttl is the number of seconds an entry is used without asking
+        # Zendesk again, path enables the optional on-disk store
+        self.ttl = ttl
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.lock = threading.Lock()
+        self.macro_locks = {}
+        if self.path and os.path.exists(self.path):
+            self.__load()
+
+    def get(self, macro_id):
+        # Returns the html_body of a fresh entry, otherwise None
+        with self.lock:
+            entry = self.entries.get(str(macro_id))
+            if entry is not None and time.time() - entry["fetched_at"] < self.ttl:
+                self.hits += 1
+                return entry["html_body"]
+            return None
+
+    def etag(self, macro_id):
+        with self.lock:
+            entry = self.entries.get(str(macro_id))
+            return entry["etag"] if entry else None
+
+    def lock_for(self, macro_id):
+        # Only one thread fetches a given macro, the others wait for it
+        with self.lock:
+            return self.macro_locks.setdefault(str(macro_id), threading.Lock())
+
+    def put(self, macro_id, html_body, etag=None):
+        with self.lock:
+            self.misses += 1
+            self.entries[str(macro_id)] = {
+                "html_body": html_body,
+                "etag": etag,
+                "fetched_at": time.time(),
+            }
+            self.__save()
+
+    def revalidated(self, macro_id):
+        # Zendesk answered 304 Not Modified, the stored body is still valid
+        with self.lock:
+            self.revalidations += 1
+            entry = self.entries[str(macro_id)]
+            entry["fetched_at"] = time.time()
+            self.__save()
+            return entry["html_body"]
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.__save()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "entries": len(self.entries),
+            }
+
+    def __load(self):
+        try:
+            with open(self.path, "r") as infile:
+                self.entries = json.load(infile)
+        except Exception as e:
+            print(e)
+            self.entries = {}
+
+    def __save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as outfile:
+            outfile.write(json.dumps(self.entries))
+        os.replace(tmp_path, self.path)
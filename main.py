@@ -1,9 +1,257 @@
+import argparse
 from support_agent import SupportAgent
+from queue_scheduler import QueueScheduler, load_queue_config
+from ticket_daemon import TicketDaemon
+from tracing import profile_run
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Classify and answer Zendesk tickets")
+    parser.add_argument(
+        "--classification-mode",
+        choices=["generate", "constrained", "batched"],
+        default="generate",
+        help="sample free text, score the closed label set, or score it for several tickets per batch",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=16,
+        help="upper bound of tickets per batch in batched mode",
+    )
+    parser.add_argument(
+        "--ticket-token-budget",
+        type=int,
+        default=256,
+        help="maximum tokens of subject and newest message sent to the model",
+    )
+    parser.add_argument(
+        "--confidence-threshold",
+        type=float,
+        default=0.0,
+        help="skip replies for constrained labels below this probability",
+    )
+    parser.add_argument(
+        "--reply-workers",
+        type=int,
+        default=8,
+        help="number of concurrent Zendesk requests in the reply phase",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=700,
+        help="Zendesk requests per minute, lowered automatically to the limit the API reports",
+    )
+    parser.add_argument(
+        "--bulk-replies",
+        action="store_true",
+        help="reply with update_many jobs grouped by macro instead of one PUT per ticket",
+    )
+    parser.add_argument(
+        "--macro-cache-ttl",
+        type=float,
+        default=300,
+        help="seconds a macro body is reused before it is revalidated",
+    )
+    parser.add_argument(
+        "--macro-cache-path",
+        default=None,
+        help="optional JSON file to keep macro bodies between runs",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of classification processes sharing the mmap'd model",
+    )
+    parser.add_argument(
+        "--classification-cache-path",
+        default="classification_cache.db",
+        help="SQLite file for cached labels, empty string disables the cache",
+    )
+    parser.add_argument(
+        "--journal-path",
+        default="run_journal.db",
+        help="SQLite run journal, restarted runs skip answered tickets; empty string disables it",
+    )
+    parser.add_argument(
+        "--history-path",
+        default="history.jsonl",
+        help="append-only JSON Lines log of all classifications",
+    )
+    parser.add_argument(
+        "--compress-history",
+        action="store_true",
+        help="write the history log as brotli compressed chunks, .br is added to the path",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="classify tickets but do not post any replies",
+    )
+    parser.add_argument(
+        "--embedding-index",
+        default=None,
+        help="path prefix of the .npy/.json nearest-neighbour index of labelled tickets",
+    )
+    parser.add_argument(
+        "--embedding-margin",
+        type=float,
+        default=0.3,
+        help="minimum vote margin for a nearest-neighbour label, below it the LLM decides",
+    )
+    parser.add_argument(
+        "--build-embedding-index",
+        metavar="HISTORY",
+        default=None,
+        help="add the labelled tickets of a history export to --embedding-index and exit",
+    )
+    parser.add_argument(
+        "--backlog",
+        action="store_true",
+        help="work through all open tickets page by page instead of one batch",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="classify and reply concurrently with bounded queues between the stages",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=100,
+        help="tickets per page in backlog and pipeline mode",
+    )
+    parser.add_argument(
+        "--queues",
+        default=None,
+        help="JSON config of several queues served by one process, see queues.example.json",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and answer tickets from the incremental export as they come in",
+    )
+    parser.add_argument(
+        "--daemon-state-path",
+        default="daemon_state.json",
+        help="file holding the cursor of the incremental export between runs",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=10.0,
+        help="seconds between polls while tickets are coming in",
+    )
+    parser.add_argument(
+        "--max-poll-interval",
+        type=float,
+        default=120.0,
+        help="longest wait between polls when nothing changes",
+    )
+    parser.add_argument(
+        "--group-id",
+        type=int,
+        default=None,
+        help="Zendesk group whose tickets the daemon answers, "
+        "defaults to the id of the '1. Level Customer Support' group",
+    )
+    parser.add_argument(
+        "--metrics-path",
+        default=None,
+        help="append per-ticket spans and the run summary to this JSON Lines file",
+    )
+    parser.add_argument(
+        "--otel",
+        action="store_true",
+        help="also export the spans through the configured OpenTelemetry SDK",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="support_agent.prof",
+        default=None,
+        help="run under cProfile and tracemalloc and write the profile to this file",
+    )
+    args = parser.parse_args()
+    if args.build_embedding_index and not args.embedding_index:
+        parser.error("--build-embedding-index needs --embedding-index")
+    if args.queues and (args.daemon or args.pipeline or args.embedding_index):
+        parser.error("--queues cannot be combined with --daemon, --pipeline or --embedding-index")
+    if args.queues and args.workers > 1:
+        # Every queue would start its own worker processes, each with a model
+        parser.error("--queues shares one model between the queues and cannot use --workers above 1")
+    return args
 
 
 def main():
-    support_agent = SupportAgent()
-    support_agent.solve_tickets()
+    args = parse_args()
+    agent_kwargs = dict(
+        classification_mode=args.classification_mode,
+        confidence_threshold=args.confidence_threshold,
+        max_batch_size=args.max_batch_size,
+        ticket_token_budget=args.ticket_token_budget,
+        reply_workers=args.reply_workers,
+        bulk_replies=args.bulk_replies,
+        rate_limit=args.rate_limit,
+        macro_cache_ttl=args.macro_cache_ttl,
+        macro_cache_path=args.macro_cache_path,
+        classification_workers=args.workers,
+        classification_cache_path=args.classification_cache_path,
+        history_path=args.history_path,
+        journal_path=args.journal_path,
+        compress_history=args.compress_history,
+        dry_run=args.dry_run,
+        embedding_index_path=args.embedding_index,
+        embedding_margin=args.embedding_margin,
+        metrics_path=args.metrics_path,
+        otel=args.otel,
+    )
+    if args.queues:
+        run_queues(args, agent_kwargs)
+        return
+    support_agent = SupportAgent(**agent_kwargs)
+
+    def run():
+        if args.build_embedding_index:
+            support_agent.build_embedding_index(args.build_embedding_index)
+        elif args.daemon:
+            TicketDaemon(
+                support_agent,
+                state_path=args.daemon_state_path,
+                min_interval=args.poll_interval,
+                max_interval=args.max_poll_interval,
+                group_id=args.group_id,
+            ).run()
+        elif args.pipeline:
+            support_agent.solve_tickets_pipelined(page_size=args.page_size)
+        elif args.backlog:
+            support_agent.solve_ticket_backlog(page_size=args.page_size)
+        else:
+            support_agent.solve_tickets()
+
+    try:
+        if args.profile:
+            profile_run(run, output_path=args.profile)
+        else:
+            run()
+    finally:
+        support_agent.close()
+
+
+def run_queues(args, agent_kwargs):
+    # Caches, history and journal files are per queue, see queue_scheduler
+    for key in ("classification_cache_path", "history_path", "journal_path", "embedding_index_path"):
+        agent_kwargs.pop(key)
+    scheduler = QueueScheduler(load_queue_config(args.queues), **agent_kwargs)
+    try:
+        if args.profile:
+            profile_run(lambda: scheduler.run(page_size=args.page_size), output_path=args.profile)
+        else:
+            scheduler.run(page_size=args.page_size)
+    finally:
+        scheduler.close()
 
 
 if __name__ == "__main__":
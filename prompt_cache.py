@@ -0,0 +1,74 @@
+import hashlib
+import os
+import pickle
+
+
+class PromptPrefixCache:
+    def __init__(self, prefix, model_path, cache_path="prompt_cache.bin"):
+        # The prefix is the static part of the prompt (system prompt and
+        # few-shot examples) that is identical for every ticket
+        self.prefix = prefix
+        self.cache_path = cache_path
+        self.key = hashlib.sha256(f"{model_path}\n{prefix}".encode("utf-8")).hexdigest()
+        self.state = None
+        self.prefix_tokens = []
+
+    def restore(self, llm):
+        # Put the llama.cpp context back into the state right after the
+        # prefix, so the next completion only evaluates the ticket suffix
+        if self.state is None:
+            self.__warm(llm)
+        llm.load_state(self.state)
+
+    def prefill_tokens(self, llm, prompt):
+        # Number of tokens that still have to be evaluated for the prompt
+        prompt_tokens = llm.tokenize(prompt.encode("utf-8"))
+        matched = 0
+        for cached, token in zip(self.prefix_tokens, prompt_tokens):
+            if cached != token:
+                break
+            matched += 1
+        return len(prompt_tokens) - matched
+
+    def invalidate(self):
+        self.state = None
+        self.prefix_tokens = []
+        if self.cache_path and os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+    def __warm(self, llm):
+        if self.__load_from_disk():
+            return
+        self.prefix_tokens = llm.tokenize(self.prefix.encode("utf-8"))
+        llm.reset()
+        llm.eval(self.prefix_tokens)
+        self.state = llm.save_state()
+        self.__save_to_disk()
+
+    def __load_from_disk(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, "rb") as infile:
+                snapshot = pickle.load(infile)
+        except Exception as e:
+            print(e)
+            return False
+        if snapshot.get("key") != self.key:
+            return False
+        self.state = snapshot["state"]
+        self.prefix_tokens = snapshot["prefix_tokens"]
+        return True
+
+    def __save_to_disk(self):
+        if not self.cache_path:
+            return
+        snapshot = {
+            "key": self.key,
+            "state": self.state,
+            "prefix_tokens": list(self.prefix_tokens),
+        }
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as outfile:
+            pickle.dump(snapshot, outfile)
+        os.replace(tmp_path, self.cache_path)
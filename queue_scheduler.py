@@ -0,0 +1,119 @@
+import itertools
+import json
+import os
+from typing import Dict, List
+from support_agent import PROMPT_TEMPLATE, TRIGGER_PHRASES_PATH, SupportAgent
+from zendesk_service import DEFAULT_TICKET_QUERY
+
+
+def load_queue_config(path="queues.json") -> Dict:
+    # Relative paths in the config are relative to the config file
+    with open(path, "r", encoding="utf-8") as infile:
+        config = json.load(infile)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for queue in config["queues"]:
+        # The weight divides the tickets a queue was served
+        if float(queue.get("weight", 1)) <= 0:
+            raise ValueError(f"Queue {queue['name']} needs a weight above 0, got {queue['weight']}")
+        for key in ("trigger_phrases_path", "prompt_template_path"):
+            if queue.get(key):
+                queue[key] = os.path.join(base_dir, queue[key])
+    return config
+
+
+class Queue:
+    def __init__(self, name, agent, weight=1.0):
+        self.name = name
+        self.agent = agent
+        self.weight = weight
+        # Tickets served divided by weight, the queue with the lowest value
+        # goes next
+        self.virtual_time = 0.0
+        self.served = 0
+
+
+class QueueScheduler:
+    def __init__(self, config, quantum=None, **agent_kwargs):
+        # Every queue gets its own SupportAgent with its own query, prompt,
+        # labels and macros. The first agent owns the model and the Zendesk
+        # connection pool, the others borrow them.
+        if agent_kwargs.get("classification_workers", 1) > 1:
+            # Worker processes hold one queue's prompt and labels, so every
+            # queue would start its own and load the model once per worker
+            raise ValueError("Queues share one model, classification_workers must be 1")
+        self.quantum = quantum or config.get("quantum", 10)
+        self.metrics_path = agent_kwargs.pop("metrics_path", None)
+        self.queues: List[Queue] = []
+        owner = None
+        for queue_config in config["queues"]:
+            kwargs = dict(agent_kwargs)
+            kwargs.update(self.__agent_kwargs(queue_config))
+            if owner is not None:
+                kwargs["zendesk_service"] = owner.zendesk_service
+                kwargs["llm_loader"] = lambda owner=owner: owner.llm
+            agent = SupportAgent(**kwargs)
+            owner = owner or agent
+            self.queues.append(
+                Queue(queue_config["name"], agent, weight=float(queue_config.get("weight", 1)))
+            )
+
+    def run(self, page_size=100):
+        # Weighted fair queuing over the open tickets of all queues: each
+        # turn the queue that has received the least service relative to its
+        # weight gets the next quantum of tickets, so a large queue cannot
+        # starve a small one
+        streams = {
+            queue.name: queue.agent.zendesk_service.iter_tickets(
+                page_size=page_size, query=queue.agent.ticket_query
+            )
+            for queue in self.queues
+        }
+        active = list(self.queues)
+        for queue in active:
+            queue.virtual_time = 0.0
+            queue.served = 0
+        while active:
+            queue = min(active, key=lambda queue: queue.virtual_time)
+            batch = list(itertools.islice(streams[queue.name], self.quantum))
+            if not batch:
+                active.remove(queue)
+                continue
+            queue.agent.solve_ticket_batch(batch, report=False)
+            queue.served += len(batch)
+            queue.virtual_time += len(batch) / queue.weight
+        for queue in self.queues:
+            print(f"Queue {queue.name} (weight {queue.weight:g}): {queue.served} tickets")
+            queue.agent.report_run_stats()
+        return {queue.name: queue.served for queue in self.queues}
+
+    def close(self):
+        # The owner of the shared Zendesk service is closed last
+        for queue in reversed(self.queues):
+            queue.agent.close()
+
+    def __agent_kwargs(self, queue_config):
+        name = queue_config["name"]
+        prompt_template = PROMPT_TEMPLATE
+        if queue_config.get("prompt_template_path"):
+            with open(queue_config["prompt_template_path"], "r", encoding="utf-8") as infile:
+                prompt_template = infile.read()
+        kwargs = {
+            "ticket_query": queue_config.get("query", DEFAULT_TICKET_QUERY),
+            "trigger_phrases_path": queue_config.get("trigger_phrases_path", TRIGGER_PHRASES_PATH),
+            "prompt_template": prompt_template,
+            "classification_map": queue_config.get("classification_map"),
+            # Caches, history and journal are per queue, their fingerprints differ
+            "prompt_cache_path": queue_config.get("prompt_cache_path", f"prompt_cache.{name}.bin"),
+            "classification_cache_path": queue_config.get(
+                "classification_cache_path", f"classification_cache.{name}.db"
+            ),
+            "history_path": queue_config.get("history_path", f"history.{name}.jsonl"),
+            "journal_path": queue_config.get("journal_path", f"run_journal.{name}.db"),
+        }
+        if self.metrics_path:
+            root, extension = os.path.splitext(self.metrics_path)
+            kwargs["metrics_path"] = f"{root}.{name}{extension}"
+        for key in ("classification_mode", "confidence_threshold", "dry_run"):
+            if key in queue_config:
+                kwargs[key] = queue_config[key]
+        return kwargs
@@ -0,0 +1,212 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+import requests
+
+# Replies are what finishes a ticket, so they get the tokens before reads
+LANES = {"write": 0, "read": 1}
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        # rate is in requests per second, capacity is the burst size
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiters = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+    def acquire(self, priority=0):
+        # Blocks until a token is free and returns the seconds waited. Only
+        # the waiter with the lowest priority number may take the next token.
+        start = time.monotonic()
+        with self.condition:
+            waiter = (priority, next(self.counter))
+            heapq.heappush(self.waiters, waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.__refill(now)
+                    if now < self.blocked_until:
+                        timeout = self.blocked_until - now
+                    elif self.waiters[0] != waiter:
+                        timeout = None
+                    elif self.tokens >= 1:
+                        self.tokens -= 1
+                        return time.monotonic() - start
+                    else:
+                        timeout = (1 - self.tokens) / self.rate
+                    self.condition.wait(timeout)
+            finally:
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+    def sync(self, remaining=None, limit=None):
+        # Zendesk reports the limit per minute and what is left of it, the
+        # local bucket never holds more tokens than the server would allow
+        with self.condition:
+            self.__refill(time.monotonic())
+            if limit:
+                self.rate = limit / 60.0
+                self.capacity = min(self.capacity, limit)
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+
+    def block(self, seconds):
+        # Nobody gets a token until the server is willing to take requests
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.condition.notify_all()
+
+    def __refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class SchedulerMetrics:
+    def __init__(self):
+        self.requests = {lane: 0 for lane in LANES}
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.status_codes = {}
+        self.latency_seconds = {lane: 0.0 for lane in LANES}
+        self.max_latency_seconds = {lane: 0.0 for lane in LANES}
+        self.wait_seconds = {lane: 0.0 for lane in LANES}
+        self.throttled_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, lane, status_code, seconds, waited):
+        with self.lock:
+            self.requests[lane] += 1
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            self.latency_seconds[lane] += seconds
+            self.max_latency_seconds[lane] = max(self.max_latency_seconds[lane], seconds)
+            self.wait_seconds[lane] += waited
+
+    def record_retry(self, throttled_seconds=None):
+        with self.lock:
+            self.retries += 1
+            if throttled_seconds is not None:
+                self.throttled += 1
+                self.throttled_seconds += throttled_seconds
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+                "status_codes": dict(self.status_codes),
+                "mean_latency_seconds": {
+                    lane: round(self.latency_seconds[lane] / count, 4) if count else 0.0
+                    for lane, count in self.requests.items()
+                },
+                "max_latency_seconds": {
+                    lane: round(seconds, 4) for lane, seconds in self.max_latency_seconds.items()
+                },
+                "wait_seconds": {
+                    lane: round(seconds, 3) for lane, seconds in self.wait_seconds.items()
+                },
+                "throttled_seconds": round(self.throttled_seconds, 3),
+            }
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        session,
+        rate_limit=700,
+        burst=None,
+        max_retries=5,
+        backoff_base=0.5,
+        backoff_max=30.0,
+    ):
+        # rate_limit is in requests per minute like the Zendesk plan limits,
+        # it is lowered as soon as the server reports a smaller X-Rate-Limit
+        self.session = session
+        self.bucket = TokenBucket(rate=rate_limit / 60.0, capacity=burst or max(1, rate_limit // 10))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = SchedulerMetrics()
+
+    def request(self, method, url, lane=None, **kwargs):
+        # Returns the response, raises requests.HTTPError for error statuses
+        # that are not retried or still fail after max_retries
+        method = method.upper()
+        lane = lane or ("read" if method in READ_METHODS else "write")
+        send = getattr(self.session, method.lower())
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire(LANES[lane])
+            start = time.monotonic()
+            try:
+                response = send(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not self.__retryable_error(e, lane) or attempt >= self.max_retries:
+                    self.metrics.record_failure()
+                    raise
+                self.metrics.record_retry()
+                time.sleep(self.__backoff(attempt))
+                attempt += 1
+                continue
+            status_code = response.status_code
+            self.metrics.record(lane, status_code, time.monotonic() - start, waited)
+            self.bucket.sync(
+                remaining=self.__header_number(response, "X-Rate-Limit-Remaining"),
+                limit=self.__header_number(response, "X-Rate-Limit"),
+            )
+            if not self.__retryable_status(status_code, lane):
+                if status_code >= 400:
+                    self.metrics.record_failure()
+                    response.raise_for_status()
+                return response
+            if attempt >= self.max_retries:
+                self.metrics.record_failure()
+                response.raise_for_status()
+                return response
+            retry_after = self.__header_number(response, "Retry-After")
+            if status_code == 429:
+                delay = retry_after if retry_after is not None else self.__backoff(attempt)
+                # The whole account is throttled, so every lane waits
+                self.bucket.block(delay)
+                self.metrics.record_retry(throttled_seconds=delay)
+            else:
+                delay = retry_after if retry_after is not None else self.__backoff(attempt)
+                self.metrics.record_retry()
+                time.sleep(delay)
+            attempt += 1
+
+    def __retryable_status(self, status_code, lane):
+        # A write that failed with a 500 may still have been applied, retrying
+        # it could post the same reply twice. 429 and 503 are never applied.
+        if status_code in (429, 503):
+            return True
+        return lane == "read" and status_code in (500, 502, 504)
+
+    def __retryable_error(self, error, lane):
+        return lane == "read" or isinstance(error, requests.ConnectTimeout)
+
+    def __backoff(self, attempt):
+        # Full jitter, so throttled workers do not retry in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def __header_number(self, response, name):
+        try:
+            return float(response.headers.get(name))
+        except (TypeError, ValueError):
+            return None
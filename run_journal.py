@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+
+FETCHED = "fetched"
+CLASSIFIED = "classified"
+# The reply was sent, but its success is not recorded yet
+REPLYING = "replying"
+REPLIED = "replied"
+
+# SQLite limits the number of parameters of one statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+class JournalEntry:
+    __slots__ = ("ticket_id", "stage", "label", "confidence", "macro_id")
+
+    def __init__(self, ticket_id, stage, label=None, confidence=None, macro_id=None):
+        self.ticket_id = ticket_id
+        self.stage = stage
+        self.label = label
+        self.confidence = confidence
+        self.macro_id = macro_id
+
+
+class RunJournal:
+    def __init__(self, path="run_journal.db", max_age=90 * 24 * 3600):
+        # Write-ahead record of how far every ticket got, so a run that died
+        # halfway is resumed instead of repeated. Entries untouched for
+        # max_age are dropped when the journal is opened.
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL a commit survives a crash of the process, only a power
+        # loss can take back the last commits
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tickets (
+                ticket_id TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                label TEXT,
+                confidence REAL,
+                macro_id INTEGER,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS tickets_updated_at ON tickets (updated_at);
+            """
+        )
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM tickets WHERE updated_at < ?", (time.time() - max_age,)
+            )
+            self.connection.commit()
+
+    def lookup(self, ticket_ids):
+        # Entries of the given tickets by ticket id, unknown tickets are missing
+        ticket_ids = [str(ticket_id) for ticket_id in ticket_ids]
+        entries = {}
+        with self.lock:
+            for start in range(0, len(ticket_ids), LOOKUP_CHUNK_SIZE):
+                chunk = ticket_ids[start : start + LOOKUP_CHUNK_SIZE]
+                rows = self.connection.execute(
+                    "SELECT ticket_id, stage, label, confidence, macro_id FROM tickets "
+                    f"WHERE ticket_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for row in rows:
+                    entries[row[0]] = JournalEntry(*row)
+        return entries
+
+    def record_fetched(self, ticket_ids):
+        # Tickets the journal already knows keep their stage
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO tickets (ticket_id, stage, updated_at) VALUES (?, ?, ?)",
+                [(str(ticket_id), FETCHED, now) for ticket_id in ticket_ids],
+            )
+            self.connection.commit()
+
+    def record_classified(self, entries):
+        # entries is an iterable of (ticket_id, label, confidence, macro_id)
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (str(ticket_id), CLASSIFIED, label, confidence, macro_id, now)
+                    for ticket_id, label, confidence, macro_id in entries
+                ],
+            )
+            self.connection.commit()
+
+    def record_stage(self, ticket_ids, stage, macro_id=None):
+        # Moves known tickets to stage, one transaction for all of them
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE tickets SET stage = ?, macro_id = COALESCE(?, macro_id), updated_at = ? "
+                "WHERE ticket_id = ?",
+                [(stage, macro_id, now, str(ticket_id)) for ticket_id in ticket_ids],
+            )
+            self.connection.commit()
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                self.connection.execute("SELECT stage, COUNT(*) FROM tickets GROUP BY stage")
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
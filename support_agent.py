@@ -1,29 +1,27 @@
+import hashlib
 import json
+import os
 from typing import List
-from llama_cpp import Llama
-from langchain.prompts import PromptTemplate
-from langchain.callbacks.manager import CallbackManager
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from support_ticket import SupportTicket
-from zendesk_service import ZendeskService
+import requests
+from batch_classifier import BatchedLabelScorer
+from classification_cache import ClassificationCache
+from classification_workers import ClassificationWorkerPool
+from concurrent_zendesk_service import ConcurrentZendeskService
+from zendesk_service import DEFAULT_TICKET_QUERY
+from history_log import HistoryLog
+from label_scorer import LabelScorer
+from prompt_cache import PromptPrefixCache
+from run_journal import CLASSIFIED, FETCHED, REPLIED, REPLYING, RunJournal
+from ticket_pipeline import TicketPipeline
+from ticket_preprocessor import TicketPreprocessor
+from ticket_text import clean_ticket_text
+from tracing import Tracer, llm_timing_attributes, llm_timings
+from trigger_matcher import TriggerMatcher, load_trigger_phrases
+from support_ticket import SupportTicket, _plain
 
+MODEL_PATH = "/Users/michele/Documents/Arbeit/Projektarbeit/support-agent/llama.cpp/models/7B/ggml-model-q4_1.gguf"
 
-class SupportAgent:
-    def __init__(self):
-        # Initialize the SupportAgent with default parameters
-        self.llm = Llama(
-            model_path="/Users/michele/Documents/Arbeit/Projektarbeit/support-agent/llama.cpp/models/7B/ggml-model-q4_1.gguf",
-            temperature=0.6,
-            max_tokens=2000,
-            n_ctx=2048,
-            top_p=0.8,
-            callback_manager=CallbackManager([StreamingStdOutCallbackHandler()]),
-            verbose=True,
-            repeat_penalty=0.8,
-        )
-        self.zendesk_service = ZendeskService()
-        self.history = []
-        self.template = """
+PROMPT_TEMPLATE = """
            <s>[INST]<<SYS>>
             Du bist Supportio, ein qualifizierter Kunden-Support Mitarbeiter.
             Deine Aufgabe ist es,Support-Tickets zu klassifizieren.
@@ -33,30 +31,7 @@ class SupportAgent:
 
             Antworte mit:
 
-            RESEND_TICKET
-            wenn das Support-Ticket die folgenden Worte oder ähnliche Sätze enthält:
-
-            "Neu Senden"
-            "Neue Tickets"
-            "Ich finde meine Tickets nicht"
-            "Wo finde ich meine Tickets"
-            "Keine E-Mail erhalten"
-            "Ich komme nicht mehr an die Bestätigungs-Mail mit den Tickets"
-            "Email fach geleert"
-            "Email wiederherstellen"
-
-            DELETE_ACCOUNT
-            wenn das Support-Ticket die folgenden Worte oder ähnliche Sätze enthält:
-
-            "Account löschen"
-            "Ich möchte meinen Account löschen"
-            "Daten löschen"
-            "Ich würde gerne meine Daten löschen"
-            "Wie kann ich meine Daten löschen"
-            "DSGVO"
-            "Daten löschen lassen"
-            "Daten entfernen"
-
+{classification_rules}
             Hier sind einige Beispiele:
 
             Klassifiziere nun folgendes Support-Ticket in einem Wort
@@ -78,27 +53,703 @@ class SupportAgent:
             {support_ticket} 
         """
 
+# Added to every ticket the agent answers, so later passes can skip it
+REPLIED_TAG = "supportio_replied"
+
+TRIGGER_PHRASES_PATH = os.path.join(os.path.dirname(__file__), "trigger_phrases.json")
+
+
+DEFAULT_CLASSIFICATION_MAP = {
+    "RESEND_TICKET": 8140353174289,
+    "DELETE_ACCOUNT": 8147065642385,
+}
+
+
+def build_prompt_template(trigger_phrases, template=PROMPT_TEMPLATE):
+    rules = []
+    for label, phrases in trigger_phrases.items():
+        rules.append(f"            {label}")
+        rules.append(
+            "            wenn das Support-Ticket die folgenden Worte oder ähnliche Sätze enthält:"
+        )
+        rules.append("")
+        rules.extend(f'            "{phrase}"' for phrase in phrases)
+        rules.append("")
+    return template.replace("{classification_rules}", "\n".join(rules))
+
+
+class SupportAgent:
+    def __init__(
+        self,
+        prompt_cache_path="prompt_cache.bin",
+        trigger_phrases_path=TRIGGER_PHRASES_PATH,
+        classification_mode="generate",
+        confidence_threshold=0.0,
+        reply_workers=8,
+        macro_cache_ttl=300,
+        macro_cache_path=None,
+        model_path=MODEL_PATH,
+        n_threads=None,
+        classification_workers=1,
+        classification_cache_path="classification_cache.db",
+        history_path="history.jsonl",
+        compress_history=False,
+        dry_run=False,
+        max_batch_size=16,
+        ticket_token_budget=256,
+        embedding_index_path=None,
+        embedding_model_path=None,
+        embedding_margin=0.3,
+        embedding_k=10,
+        bulk_replies=False,
+        rate_limit=700,
+        metrics_path=None,
+        otel=False,
+        zendesk_base_url=None,
+        ticket_query=DEFAULT_TICKET_QUERY,
+        classification_map=None,
+        prompt_template=PROMPT_TEMPLATE,
+        zendesk_service=None,
+        llm_loader=None,
+        journal_path="run_journal.db",
+    ):
+        # Initialize the SupportAgent with default parameters. The model is
+        # only loaded when the first ticket actually needs the LLM.
+        self.model_path = model_path
+        self.n_threads = n_threads
+        self._llm = None
+        self._prompt = None
+        # Agents serving several queues in one process share the model through
+        # llm_loader and the HTTP pool through zendesk_service
+        self.llm_loader = llm_loader
+        self.owns_zendesk_service = zendesk_service is None
+        if zendesk_service is None:
+            # Macro lookups and replies of different tickets run concurrently
+            zendesk_service = ConcurrentZendeskService(
+                max_workers=reply_workers,
+                macro_cache_ttl=macro_cache_ttl,
+                macro_cache_path=macro_cache_path,
+                rate_limit=rate_limit,
+                **({"base_url": zendesk_base_url} if zendesk_base_url else {}),
+            )
+        self.zendesk_service = zendesk_service
+        self.ticket_query = ticket_query
+        # Per-ticket spans of every stage and per-run percentiles, optionally
+        # written to metrics_path and exported through OpenTelemetry
+        self.tracer = Tracer(metrics_path=metrics_path, otel=otel)
+        # History entries are streamed to an append-only log. Without a log
+        # (worker processes) they are kept in memory for the parent process.
+        # Like the model, the log and the caches below are only opened when a
+        # ticket needs them, so constructing the agent touches no files.
+        self.history = []
+        self.history_path = history_path
+        self.compress_history = compress_history
+        self._history_log = None
+        self.trigger_phrases = load_trigger_phrases(trigger_phrases_path)
+        self.template = build_prompt_template(self.trigger_phrases, prompt_template)
+        # Tickets containing trigger phrases of exactly one class are resolved
+        # before the LLM is asked
+        self.trigger_matcher = TriggerMatcher(self.trigger_phrases)
+        self.__reset_run_stats()
+        # The part of the prompt in front of the ticket never changes, so its
+        # llama.cpp state is evaluated once and restored for every ticket
+        self.prompt_cache = PromptPrefixCache(
+            prefix=self.template.split("{support_ticket}")[0],
+            model_path=model_path,
+            cache_path=prompt_cache_path,
+        )
+        self.classification_map = dict(classification_map or DEFAULT_CLASSIFICATION_MAP)
+        # "generate" samples free text, "constrained" and "batched" only score
+        # the labels of the classification map and yield a probability per label
+        self.classification_mode = classification_mode
+        self.confidence_threshold = confidence_threshold
+        self.label_scorer = LabelScorer(labels=self.classification_map.keys())
+        # Only subject and newest message within the token budget are sent
+        self.ticket_preprocessor = TicketPreprocessor(token_budget=ticket_token_budget)
+        # "batched" scores the labels of all tickets that need the LLM as
+        # parallel sequences of one llama.cpp context, with room for a ticket
+        # of the full token budget plus its label tokens per sequence
+        self.batched_label_scorer = BatchedLabelScorer(
+            labels=self.classification_map.keys(),
+            max_batch_size=max_batch_size,
+            sequence_tokens=ticket_token_budget + 32,
+        )
+        # Labels of earlier runs and of near-identical tickets are reused as
+        # long as template, model and mode stay the same
+        self.classification_cache_path = classification_cache_path
+        self.classification_fingerprint = hashlib.sha256(
+            f"{model_path}\n{classification_mode}\n{ticket_token_budget}\n{self.template}".encode("utf-8")
+        ).hexdigest()
+        self._classification_cache = None
+        # Nearest labelled tickets decide when their vote is clear enough,
+        # otherwise the ticket falls through to the generative prompt
+        self.embedding_index = None
+        if embedding_index_path:
+            from embedding_index import EmbeddingIndex
+
+            self.embedding_index = EmbeddingIndex(path=embedding_index_path)
+        self.embedding_model_path = embedding_model_path or model_path
+        self.embedding_margin = embedding_margin
+        self.embedding_k = embedding_k
+        self.ticket_embeddings = {}
+        self._embedding_llm = None
+        # With more than one worker, classification is sharded across worker
+        # processes that each hold their own llama.cpp context
+        self.classification_workers = classification_workers
+        self.worker_pool = None
+        self.worker_kwargs = {
+            "prompt_cache_path": prompt_cache_path,
+            "trigger_phrases_path": trigger_phrases_path,
+            "classification_mode": classification_mode,
+            "max_batch_size": max_batch_size,
+            "ticket_token_budget": ticket_token_budget,
+            "model_path": model_path,
+            "classification_cache_path": classification_cache_path,
+            "history_path": None,
+            "classification_map": self.classification_map,
+            "prompt_template": prompt_template,
+            "journal_path": None,
+        }
+        self.dry_run = dry_run
+        # Stage and macro of every ticket are journaled before and after each
+        # step, so a restarted run skips answered tickets and finishes the
+        # replies it was sending
+        self.journal_path = journal_path
+        self._run_journal = None
+        # Replies go out as update_many jobs of up to 100 tickets per macro
+        self.bulk_replies = bulk_replies
+
+    @property
+    def llm(self):
+        if self._llm is None and self.llm_loader is not None:
+            self._llm = self.llm_loader()
+        if self._llm is None:
+            from llama_cpp import Llama
+            from langchain.callbacks.manager import CallbackManager
+            from langchain.callbacks.streaming_stdout import (
+                StreamingStdOutCallbackHandler,
+            )
+
+            self._llm = Llama(
+                model_path=self.model_path,
+                n_threads=self.n_threads,
+                use_mmap=True,
+                temperature=0.6,
+                max_tokens=2000,
+                n_ctx=2048,
+                top_p=0.8,
+                callback_manager=CallbackManager([StreamingStdOutCallbackHandler()]),
+                verbose=True,
+                repeat_penalty=0.8,
+            )
+        return self._llm
+
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+
+    @property
+    def history_log(self):
+        if self._history_log is None and self.history_path:
+            self._history_log = HistoryLog(path=self.history_path, compress=self.compress_history)
+        return self._history_log
+
+    @property
+    def classification_cache(self):
+        if self._classification_cache is None and self.classification_cache_path:
+            self._classification_cache = ClassificationCache(
+                path=self.classification_cache_path, fingerprint=self.classification_fingerprint
+            )
+        return self._classification_cache
+
+    @property
+    def run_journal(self):
+        if self._run_journal is None and self.journal_path:
+            self._run_journal = RunJournal(path=self.journal_path)
+        return self._run_journal
+
+    @property
+    def embedding_llm(self):
+        if self._embedding_llm is None:
+            from llama_cpp import Llama
+
+            self._embedding_llm = Llama(
+                model_path=self.embedding_model_path,
+                n_threads=self.n_threads,
+                use_mmap=True,
+                embedding=True,
+                n_ctx=2048,
+                verbose=False,
+            )
+        return self._embedding_llm
+
+    @embedding_llm.setter
+    def embedding_llm(self, embedding_llm):
+        self._embedding_llm = embedding_llm
+
+    @property
+    def prompt(self):
+        if self._prompt is None:
+            from langchain.prompts import PromptTemplate
+
+            self._prompt = PromptTemplate.from_template(template=self.template)
+        return self._prompt
+
+    @prompt.setter
+    def prompt(self, prompt):
+        self._prompt = prompt
+
     def solve_tickets(self):
-        support_tickets = self.zendesk_service.get_tickets(count=50)
+        self.__reset_run_stats()
+        with self.tracer.span("fetch") as span:
+            support_tickets = self.zendesk_service.get_tickets(count=50, query=self.ticket_query)
+            span["tickets"] = len(support_tickets)
+        if not support_tickets:
+            # Nothing to do, so neither the model nor LangChain get loaded
+            print("No open tickets")
+            return
         classified_tickets = self.__classify_tickets(support_tickets)
         self.__generate_answers(classified_tickets)
+        self.__report_run_stats()
+
+    def solve_ticket_batch(self, support_tickets, report=True):
+        # Classifies and answers tickets fetched by the caller, e.g. one
+        # pass of the daemon. Without report the stats keep adding up until
+        # report_run_stats() is called.
+        if report:
+            self.__reset_run_stats()
+        classified_tickets = self.__classify_tickets(support_tickets)
+        self.__generate_answers(classified_tickets)
+        if report:
+            self.__report_run_stats()
+        return classified_tickets
+
+    def report_run_stats(self):
+        self.__report_run_stats()
+        self.__reset_run_stats()
+
+    def warm_up(self):
+        # Loads the model and evaluates the prompt prefix up front, so the
+        # first ticket of a long-running process does not pay for it
+        if self.classification_workers > 1:
+            return
+        self.prompt_cache.restore(self.llm)
+
+    def solve_ticket_backlog(self, page_size=100):
+        # Works through all open tickets page by page, the next page is
+        # downloaded while the current one is classified and answered
+        self.__reset_run_stats()
+        for support_tickets in self.tracer.traced(
+            "fetch",
+            self.zendesk_service.iter_ticket_pages(page_size=page_size, query=self.ticket_query),
+        ):
+            classified_tickets = self.__classify_tickets(support_tickets)
+            if self.bulk_replies:
+                self.__solve_classified_tickets_bulk(classified_tickets)
+            else:
+                self.zendesk_service.map(self.__reply_or_report, classified_tickets)
+        self.generate_export()
+        self.__report_run_stats()
+
+    def solve_tickets_pipelined(self, page_size=100, queue_size=32):
+        # Classification and replies run at the same time, connected by
+        # bounded queues, instead of one phase after the other
+        self.__reset_run_stats()
+        pipeline = TicketPipeline(
+            classify=lambda support_ticket: self.__classify_tickets([support_ticket]),
+            reply=self.__solve_classifyed_tickt,
+            queue_size=queue_size,
+            reply_workers=self.zendesk_service.max_workers,
+        )
+        pipeline_report = pipeline.run(
+            self.tracer.traced(
+                "fetch",
+                self.zendesk_service.iter_tickets(page_size=page_size, query=self.ticket_query),
+            )
+        )
+        self.generate_export()
+        self.__report_run_stats()
+        for name, stage in pipeline_report["stages"].items():
+            print(
+                f"Stage {name}: {stage['processed']} tickets, {stage['errors']} errors, "
+                f"{stage['tickets_per_second']} tickets/s, busy {stage['busy_seconds']}s, "
+                f"queue depth mean {stage['mean_queue_depth']} max {stage['max_queue_depth']}"
+            )
+        return pipeline_report
+
+    def __reset_run_stats(self):
+        self.run_stats = {
+            "tickets": 0,
+            "fast_path_hits": 0,
+            "cache_hits": 0,
+            "llm_calls": 0,
+            "embedding_hits": 0,
+            "tokens_saved": 0,
+            "journal_skips": 0,
+            "journal_resumed": 0,
+        }
+        # Tickets that got a reply in this run
+        self.answered_tickets = []
+        self.tracer.reset()
+
+    def __count(self, key):
+        self.run_stats[key] = self.run_stats.get(key, 0) + 1
+
+    def __report_run_stats(self):
+        tickets = self.run_stats["tickets"]
+        hits = self.run_stats["fast_path_hits"]
+        hit_rate = hits / tickets if tickets else 0.0
+        print(
+            f"Classified {tickets} tickets: {hits} resolved by trigger phrases "
+            f"({hit_rate:.0%}), {self.run_stats['llm_calls']} LLM calls, "
+            f"{hits + self.run_stats['cache_hits'] + self.run_stats['embedding_hits']} LLM calls saved, "
+            f"{self.run_stats['cache_hits']} from the classification cache, "
+            f"{self.run_stats['embedding_hits']} from the embedding index, "
+            f"{self.run_stats['tokens_saved']} prompt tokens saved by preprocessing"
+        )
+        if self.journal_path:
+            print(
+                f"Run journal: {self.run_stats['journal_skips']} tickets already answered, "
+                f"{self.run_stats['journal_resumed']} unfinished replies resumed"
+            )
+        macro_stats = self.zendesk_service.macro_cache.stats()
+        print(
+            f"Macro cache: {macro_stats['hits']} hits, {macro_stats['misses']} misses, "
+            f"{macro_stats['revalidations']} revalidations"
+        )
+        request_stats = self.zendesk_service.scheduler.metrics.as_dict()
+        print(
+            f"Zendesk requests: {request_stats['requests']['read']} reads, "
+            f"{request_stats['requests']['write']} writes, {request_stats['retries']} retries, "
+            f"{request_stats['throttled']} throttled for {request_stats['throttled_seconds']}s, "
+            f"{request_stats['failures']} failed"
+        )
+        for name, stage in self.tracer.write_summary(run_stats=self.run_stats).items():
+            print(
+                f"Span {name}: {stage['count']}x, total {stage['total_seconds']}s, "
+                f"p50 {stage['p50_ms']}ms, p95 {stage['p95_ms']}ms, p99 {stage['p99_ms']}ms"
+                + "".join(
+                    f", {llm_stage} {stage[f'{llm_stage}_tokens_per_second']} tokens/s"
+                    for llm_stage in ("prefill", "decode")
+                    if f"{llm_stage}_tokens_per_second" in stage
+                )
+            )
+
+    def classify_tickets(
+        self, support_tickets: List[SupportTicket]
+    ) -> List[SupportTicket]:
+        return self.__classify_tickets(support_tickets)
+
+    def __classify_in_workers(self, support_tickets):
+        # The embedding index stays in this process: tickets it decides never
+        # reach the workers, and the labels the workers find for the other
+        # tickets are added to it afterwards
+        classified_tickets = []
+        if self.embedding_index is not None:
+            support_tickets = self.__classify_before_workers(support_tickets, classified_tickets)
+            if not support_tickets:
+                return classified_tickets
+        if self.worker_pool is None:
+            self.worker_pool = ClassificationWorkerPool(
+                n_workers=self.classification_workers, agent_kwargs=self.worker_kwargs
+            )
+        for tickets, history, run_stats in self.worker_pool.classify(support_tickets):
+            classified_tickets.extend(tickets)
+            for interaction in history:
+                self.__record_history(interaction)
+            for key, value in run_stats.items():
+                self.run_stats[key] = self.run_stats.get(key, 0) + value
+            for support_ticket in tickets:
+                self.__index_classification(support_ticket)
+        return classified_tickets
+
+    def __classify_before_workers(self, support_tickets, classified_tickets):
+        # Returns the tickets that still need the LLM
+        remaining_tickets = []
+        for support_ticket in support_tickets:
+            with self.tracer.span("classify", ticket_id=support_ticket.ticket_id) as span:
+                output = self.__classify_without_llm(support_ticket)
+                span["path"] = self.__classification_path(output) if output else "workers"
+            if output is None:
+                remaining_tickets.append(support_ticket)
+                continue
+            self.__count("tickets")
+            self.generate_history_entry(support_ticket, output)
+            classified_tickets.append(support_ticket)
+        return remaining_tickets
 
     def __classify_tickets(
         self, support_tickets: List[SupportTicket]
     ) -> List[SupportTicket]:
-        prompt = PromptTemplate.from_template(template=self.template)
+        resumed_tickets, support_tickets = self.__resume_from_journal(support_tickets)
+        if not support_tickets:
+            return resumed_tickets
+        if self.classification_workers > 1:
+            classified_tickets = self.__classify_in_workers(support_tickets)
+        else:
+            classified_tickets = self.__classify_locally(support_tickets)
+        self.__journal_classified(classified_tickets)
+        return resumed_tickets + classified_tickets
+
+    def __classify_locally(self, support_tickets):
+        deferred_tickets = []
         for support_ticket in support_tickets:
-            support_ticket_template = prompt.format(
-                support_ticket=support_ticket.description
-            )
-            output = self.llm(support_ticket_template, echo=False)
-            ticket_classification = output["choices"][0]["text"].strip()
-            support_ticket.classification = ticket_classification
+            self.__count("tickets")
+            with self.tracer.span("classify", ticket_id=support_ticket.ticket_id) as span:
+                output = self.__classify_ticket(support_ticket)
+                span["path"] = self.__classification_path(output)
+            if output is None:
+                deferred_tickets.append(support_ticket)
+                continue
+            self.generate_history_entry(support_ticket, output)
+        if deferred_tickets:
+            self.__score_labels_batched(deferred_tickets)
         return support_tickets
 
+    def __resume_from_journal(self, support_tickets):
+        # Splits the tickets into those whose reply an earlier run sent but
+        # could not record, which get their journaled label back, and those
+        # that need a classification. Tickets it answered are dropped.
+        if self.run_journal is None:
+            return [], support_tickets
+        with self.tracer.span("journal", tickets=len(support_tickets)):
+            entries = self.run_journal.lookup(
+                support_ticket.ticket_id for support_ticket in support_tickets
+            )
+            self.run_journal.record_fetched(
+                support_ticket.ticket_id
+                for support_ticket in support_tickets
+                if str(support_ticket.ticket_id) not in entries
+            )
+        replied = self.__confirm_replies(
+            [
+                support_ticket
+                for support_ticket in support_tickets
+                if str(support_ticket.ticket_id) in entries
+                and entries[str(support_ticket.ticket_id)].stage == REPLYING
+            ]
+        )
+        resumed_tickets = []
+        unclassified_tickets = []
+        for support_ticket in support_tickets:
+            entry = entries.get(str(support_ticket.ticket_id))
+            stage = entry.stage if entry is not None else None
+            if stage == REPLIED or (
+                stage == REPLYING and replied[support_ticket.ticket_id] is not False
+            ):
+                self.__count("journal_skips")
+                continue
+            if stage != REPLYING or entry.label is None:
+                # The customer may have written again or the classifier may
+                # have changed since, so labels of tickets that were not in
+                # flight are not trusted. The classification cache knows
+                # when a label is still valid.
+                unclassified_tickets.append(support_ticket)
+                continue
+            support_ticket.classification = entry.label
+            support_ticket.confidence = entry.confidence
+            self.__count("journal_resumed")
+            resumed_tickets.append(support_ticket)
+        return resumed_tickets, unclassified_tickets
+
+    def __confirm_replies(self, support_tickets):
+        # A reply that was sent but not recorded may have reached Zendesk,
+        # the tag it adds tells. Returns True or False per ticket id, None
+        # where the tags cannot be read: those tickets are skipped this run
+        # rather than risking a second comment.
+        def has_replied_tag(support_ticket):
+            try:
+                return REPLIED_TAG in self.zendesk_service.get_ticket_tags(support_ticket.ticket_id)
+            except requests.RequestException as e:
+                print(f"Tags of ticket {support_ticket.ticket_id} unavailable: {e}")
+                return None
+
+        if not support_tickets:
+            return {}
+        replied = dict(
+            zip(
+                [support_ticket.ticket_id for support_ticket in support_tickets],
+                self.zendesk_service.map(has_replied_tag, support_tickets),
+            )
+        )
+        self.run_journal.record_stage(
+            [ticket_id for ticket_id, has_tag in replied.items() if has_tag], REPLIED
+        )
+        return replied
+
+    def __journal_classified(self, support_tickets):
+        if self.run_journal is not None:
+            self.run_journal.record_classified(
+                (
+                    support_ticket.ticket_id,
+                    support_ticket.classification,
+                    support_ticket.confidence,
+                    self.classification_map.get(support_ticket.classification),
+                )
+                for support_ticket in support_tickets
+            )
+
+    def __journal_stage(self, support_tickets, stage, macro_id=None):
+        if self.run_journal is not None:
+            self.run_journal.record_stage(
+                [support_ticket.ticket_id for support_ticket in support_tickets], stage, macro_id
+            )
+
+    def __classify_ticket(self, support_ticket):
+        output = self.__classify_without_llm(support_ticket)
+        if output is not None:
+            return output
+        self.__count("llm_calls")
+        if self.classification_mode == "batched":
+            # Scored together with the other tickets of this call
+            return None
+        with self.tracer.span("prompt_format", ticket_id=support_ticket.ticket_id):
+            ticket_text, preprocessing = self.__prepare_ticket_text(support_ticket)
+            support_ticket_template = self.prompt.format(support_ticket=ticket_text)
+        with self.tracer.span("llm", ticket_id=support_ticket.ticket_id) as span:
+            self.prompt_cache.restore(self.llm)
+            timings = llm_timings(self.llm)
+            if self.classification_mode == "constrained":
+                output = self.__score_labels(support_ticket, support_ticket_template)
+            else:
+                output = self.llm(support_ticket_template, echo=False)
+                ticket_classification = output["choices"][0]["text"].strip()
+                support_ticket.classification = ticket_classification
+            span.update(llm_timing_attributes(timings, llm_timings(self.llm)))
+        output["preprocessing"] = preprocessing
+        self.__cache_classification(support_ticket)
+        return output
+
+    def __classify_without_llm(self, support_ticket):
+        # Trigger phrases, cached labels and the embedding index, None if
+        # the ticket needs the LLM
+        label, matches = self.trigger_matcher.classify(
+            clean_ticket_text(support_ticket.description)
+        )
+        if label is not None:
+            self.__count("fast_path_hits")
+            support_ticket.classification = label
+            support_ticket.confidence = 1.0
+            return {"label": label, "trigger_phrases": [phrase for _, phrase in matches]}
+        if self.classification_cache is not None:
+            cached = self.classification_cache.get(
+                support_ticket.ticket_id, support_ticket.description, support_ticket.subject
+            )
+            if cached is not None:
+                self.__count("cache_hits")
+                support_ticket.classification, support_ticket.confidence = cached
+                return {"label": cached[0], "cached": True}
+        if self.embedding_index is not None:
+            return self.__classify_by_neighbours(support_ticket)
+        return None
+
+    def __classification_path(self, output):
+        if output is None:
+            return "batched"
+        if "trigger_phrases" in output:
+            return "trigger_phrases"
+        if output.get("cached"):
+            return "cache"
+        if "embedding_margin" in output:
+            return "embedding"
+        return "llm"
+
+    def __prepare_ticket_text(self, support_ticket):
+        ticket_text, preprocessing = self.ticket_preprocessor.prepare(
+            self.llm, support_ticket
+        )
+        self.run_stats["tokens_saved"] = (
+            self.run_stats.get("tokens_saved", 0) + preprocessing["tokens_saved"]
+        )
+        return ticket_text, preprocessing
+
+    def __classify_by_neighbours(self, support_ticket):
+        vector = self.__embed(support_ticket.subject, support_ticket.description)
+        label, margin, votes = self.embedding_index.query(vector, k=self.embedding_k)
+        if label is None or margin < self.embedding_margin:
+            # Too close to call, the generative prompt decides and the ticket
+            # is added to the index with that label afterwards
+            self.ticket_embeddings[support_ticket.ticket_id] = vector
+            return None
+        self.__count("embedding_hits")
+        support_ticket.classification = label
+        support_ticket.confidence = votes[label]
+        return {"label": label, "embedding_margin": margin, "votes": votes}
+
+    def __embed(self, subject, description):
+        text = clean_ticket_text(f"{subject or ''}\n{description or ''}")[:2000]
+        return self.embedding_llm.create_embedding(text)["data"][0]["embedding"]
+
+    def build_embedding_index(self, history_path):
+        self.embedding_index.build_from_history(
+            history_path,
+            embed=lambda ticket: self.__embed(ticket.get("subject"), ticket.get("description")),
+            labels=set(self.classification_map),
+        )
+        print(f"Embedding index holds {len(self.embedding_index)} labelled tickets")
+
+    def __cache_classification(self, support_ticket):
+        self.__index_classification(support_ticket)
+        if self.classification_cache is not None:
+            self.classification_cache.put(
+                support_ticket.ticket_id,
+                support_ticket.description,
+                support_ticket.classification,
+                support_ticket.confidence,
+                subject=support_ticket.subject,
+            )
+
+    def __index_classification(self, support_ticket):
+        # Tickets the index could not decide are added with the LLM's label
+        vector = self.ticket_embeddings.pop(support_ticket.ticket_id, None)
+        if vector is not None and support_ticket.classification in self.classification_map:
+            self.embedding_index.add(
+                vector, support_ticket.classification, support_ticket.ticket_id
+            )
+
+    def __score_labels_batched(self, support_tickets):
+        with self.tracer.span("prompt_format", tickets=len(support_tickets)):
+            prepared = [
+                self.__prepare_ticket_text(support_ticket) for support_ticket in support_tickets
+            ]
+            prompts = [
+                self.prompt.format(support_ticket=ticket_text) for ticket_text, _ in prepared
+            ]
+        with self.tracer.span("llm_batch", tickets=len(support_tickets)) as span:
+            timings = llm_timings(self.llm)
+            results = self.batched_label_scorer.score(
+                self.llm, self.prompt_cache.prefix, prompts
+            )
+            span.update(llm_timing_attributes(timings, llm_timings(self.llm)))
+        for support_ticket, (_, preprocessing), (label, probabilities) in zip(
+            support_tickets, prepared, results
+        ):
+            support_ticket.classification = label
+            support_ticket.confidence = probabilities[label]
+            self.__cache_classification(support_ticket)
+            self.generate_history_entry(
+                support_ticket,
+                {
+                    "label": label,
+                    "probabilities": probabilities,
+                    "batched": True,
+                    "preprocessing": preprocessing,
+                },
+            )
+
+    def __score_labels(self, support_ticket, support_ticket_template):
+        label, probabilities = self.label_scorer.score(
+            self.llm, support_ticket_template
+        )
+        support_ticket.classification = label
+        support_ticket.confidence = probabilities[label]
+        return {"label": label, "probabilities": probabilities}
+
     def __generate_answers(self, classified_tickets):
-        for classified_ticket in classified_tickets:
-            self.__solve_classifyed_tickt(classified_ticket)
+        if self.bulk_replies:
+            self.__solve_classified_tickets_bulk(classified_tickets)
+        else:
+            self.zendesk_service.map(self.__reply_or_report, classified_tickets)
         self.generate_export()
 
     def generate_history_entry(self, support_ticket, llama_output):
@@ -108,38 +759,137 @@ class SupportAgent:
                 "llama_output": llama_output,
             }
         }
-        self.history.append(interaction)
+        self.__record_history(interaction)
         return interaction
 
+    def __record_history(self, interaction):
+        if self.history_log is not None:
+            self.history_log.append(interaction)
+        else:
+            self.history.append(interaction)
+
+    def __reply_or_report(self, support_ticket):
+        # One failed reply must not stop the replies to the other tickets
+        try:
+            self.__solve_classifyed_tickt(support_ticket)
+        except requests.RequestException as e:
+            print(f"Reply to ticket {support_ticket.ticket_id} failed: {e}")
+
     def __solve_classifyed_tickt(self, support_ticket):
-        classification_map = {
-            "RESEND_TICKET": 8140353174289,
-            "DELETE_ACCOUNT": 8147065642385,
-        }
+        macro_id = self.__macro_for(support_ticket)
+        if macro_id is not None:
+            with self.tracer.span("macro", ticket_id=support_ticket.ticket_id, macro_id=macro_id):
+                html_body = self.zendesk_service.get_macro_html_body(macro_id=macro_id)
+                payload = self.__build_response_body(html_body=html_body)
+            self.__journal_stage([support_ticket], REPLYING, macro_id)
+            with self.tracer.span("reply", ticket_id=support_ticket.ticket_id):
+                try:
+                    self.zendesk_service.reply_to_customer(
+                        ticket_id=support_ticket.ticket_id, payload=payload
+                    )
+                except requests.HTTPError:
+                    # Zendesk refused the update, the next run tries again
+                    self.__journal_stage([support_ticket], CLASSIFIED)
+                    raise
+            self.__mark_replied([support_ticket], macro_id)
+
+    def __mark_replied(self, support_tickets, macro_id):
+        self.answered_tickets.extend(support_tickets)
+        self.__journal_stage(support_tickets, REPLIED, macro_id)
+
+    def __macro_for(self, support_ticket):
+        # The macro to reply with, None if the ticket should not be answered
         classification = support_ticket.classification
-        if classification in classification_map:
-            macro_id = classification_map[classification]
-            mail_template = self.zendesk_service.utilize_mail_template(
-                macro_id=macro_id
+        if (
+            support_ticket.confidence is not None
+            and support_ticket.confidence < self.confidence_threshold
+        ):
+            print(
+                f"Skipping ticket {support_ticket.ticket_id}: {_plain(classification)} "
+                f"with confidence {support_ticket.confidence:.2f}"
             )
-            mail_template_body = mail_template.text
-            payload = self.__generate_response_body(macro_template=mail_template_body)
-            self.zendesk_service.reply_to_customer(
-                ticket_id=support_ticket.ticket_id, payload=payload
+            return None
+        if classification not in self.classification_map:
+            return None
+        macro_id = self.classification_map[classification]
+        if self.dry_run:
+            print(f"Dry run: ticket {support_ticket.ticket_id} would get macro {macro_id}")
+            return None
+        return macro_id
+
+    def __solve_classified_tickets_bulk(self, classified_tickets):
+        # All tickets with the same macro get the same comment, so they are
+        # updated together with update_many
+        tickets_by_macro = {}
+        for support_ticket in classified_tickets:
+            macro_id = self.__macro_for(support_ticket)
+            if macro_id is not None:
+                tickets_by_macro.setdefault(macro_id, []).append(support_ticket)
+        failed_tickets = []
+        for macro_id, support_tickets in tickets_by_macro.items():
+            with self.tracer.span("macro", macro_id=macro_id):
+                html_body = self.zendesk_service.get_macro_html_body(macro_id=macro_id)
+            self.__journal_stage(support_tickets, REPLYING, macro_id)
+            with self.tracer.span("reply_bulk", macro_id=macro_id, tickets=len(support_tickets)):
+                failures = self.zendesk_service.reply_to_customers_bulk(
+                    ticket_ids=[support_ticket.ticket_id for support_ticket in support_tickets],
+                    payload=self.__build_response_body(html_body=html_body),
+                )
+            for support_ticket in support_tickets:
+                if support_ticket.ticket_id in failures:
+                    print(
+                        f"Reply to ticket {support_ticket.ticket_id} failed: "
+                        f"{failures[support_ticket.ticket_id]}"
+                    )
+                    failed_tickets.append(support_ticket)
+            self.__mark_replied(
+                [
+                    support_ticket
+                    for support_ticket in support_tickets
+                    if support_ticket.ticket_id not in failures
+                ],
+                macro_id,
             )
+        # Failed tickets stay journaled as replying, a job that timed out may
+        # still have been applied. The next run checks their tags.
+        return failed_tickets
 
     def __generate_response_body(self, macro_template):
         get_body = json.loads(macro_template)
+        return self.__build_response_body(
+            html_body=get_body["result"]["ticket"]["comment"]["html_body"]
+        )
+
+    def __build_response_body(self, html_body):
         answer = {
             "ticket": {
                 "comment": {
-                    "html_body": get_body["result"]["ticket"]["comment"]["html_body"],
+                    "html_body": html_body,
                     "public": False,
-                }
+                },
+                "additional_tags": [REPLIED_TAG],
             }
         }
         return answer
 
+    def close(self):
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+        self.batched_label_scorer.close()
+        if self.embedding_index is not None:
+            self.embedding_index.save()
+        if self._classification_cache is not None:
+            self._classification_cache.close()
+        if self._run_journal is not None:
+            self._run_journal.close()
+        if self._history_log is not None:
+            self._history_log.close()
+        if self.owns_zendesk_service:
+            self.zendesk_service.close()
+        self.tracer.close()
+
     def generate_export(self):
-        with open("history.json", "w") as outfile:
-            outfile.write(json.dumps(self.history))
+        # Entries are already on disk, only the buffered tail is written
+        if self._history_log is not None:
+            with self.tracer.span("export"):
+                self._history_log.flush()
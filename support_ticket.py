@@ -1,6 +1,59 @@
+import sys
+from enum import Enum
+
+
+class TicketStatus(str, Enum):
+    NEW = "new"
+    OPEN = "open"
+    PENDING = "pending"
+    HOLD = "hold"
+    SOLVED = "solved"
+    CLOSED = "closed"
+
+
+class Classification(str, Enum):
+    RESEND_TICKET = "RESEND_TICKET"
+    DELETE_ACCOUNT = "DELETE_ACCOUNT"
+
+
+def _compact(enum, value):
+    # Known values become shared enum members, anything else (for example a
+    # free-text label of the LLM) is interned so equal strings are stored once
+    if value is None or isinstance(value, enum):
+        return value
+    try:
+        return enum(value)
+    except ValueError:
+        return sys.intern(value) if isinstance(value, str) else value
+
+
+def _plain(value):
+    return value.value if isinstance(value, Enum) else value
+
+
 class SupportTicket:
+    # Backfills keep 100k+ tickets in memory, slots avoid a __dict__ per ticket
+    __slots__ = (
+        "ticket_id",
+        "customer_email",
+        "_status",
+        "subject",
+        "description",
+        "_classification",
+        "confidence",
+        "created_at",
+    )
+
     def __init__(
-        self, ticket_id, customer_email, status, subject, description, classification
+        self,
+        ticket_id,
+        customer_email,
+        status,
+        subject,
+        description,
+        classification,
+        confidence=None,
+        created_at=None,
     ):
         self.ticket_id = ticket_id
         self.customer_email = customer_email
@@ -8,13 +61,31 @@ class SupportTicket:
         self.subject = subject
         self.description = description
         self.classification = classification
+        self.confidence = confidence
+        self.created_at = created_at
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        self._status = _compact(TicketStatus, value)
+
+    @property
+    def classification(self):
+        return self._classification
+
+    @classification.setter
+    def classification(self, value):
+        self._classification = _compact(Classification, value)
 
     def as_dict(self):
         return {
             "ticket_id": self.ticket_id,
             "customer_email": self.customer_email,
-            "status": self.status,
+            "status": _plain(self.status),
             "subject": self.subject,
             "description": self.description,
-            "classification": self.classification,
+            "classification": _plain(self.classification),
         }
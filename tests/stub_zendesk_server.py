@@ -0,0 +1,268 @@
+import json
+import re
+from urllib.parse import parse_qs, urlencode, urlparse
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_ticket(ticket_id, description="Bitte die Tickets neu senden", group_id=1):
+    return {
+        "id": ticket_id,
+        "status": "open",
+        "group_id": group_id,
+        "subject": f"Ticket {ticket_id}",
+        "description": description,
+        "via": {
+            "channel": "email",
+            "source": {"from": {"address": f"customer{ticket_id}@example.com"}},
+        },
+    }
+
+
+class StubZendeskHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can reuse connections
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately, without this every
+        # response waits for the delayed ACK of the client
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        self.server.record(self)
+        if self.send_queued_error():
+            return
+        path = self.path.split("?")[0]
+        ticket_match = re.fullmatch(r"/api/v2/tickets/(\d+)", path)
+        macro_match = re.fullmatch(r"/api/v2/macros/(\d+)/apply", path)
+        tags_match = re.fullmatch(r"/api/v2/tickets/(\d+)/tags", path)
+        if path == "/api/v2/tickets":
+            params = parse_qs(urlparse(self.path).query)
+            if "page[size]" in params:
+                self.send_json(self.ticket_page(params))
+            else:
+                self.send_json(self.ticket_list(params))
+        elif path == "/api/v2/groups":
+            self.send_json(
+                {"groups": self.server.groups, "meta": {"has_more": False}, "links": {"next": None}}
+            )
+        elif path == "/api/v2/incremental/tickets/cursor.json":
+            self.send_json(self.incremental_page(parse_qs(urlparse(self.path).query)))
+        elif path == "/api/v2/job_statuses/show_many.json":
+            job_ids = parse_qs(urlparse(self.path).query)["ids"][0].split(",")
+            self.send_json(
+                {"job_statuses": [self.server.poll_job(job_id) for job_id in job_ids]}
+            )
+        elif re.fullmatch(r"/api/v2/job_statuses/(\w+)\.json", path):
+            job_id = re.fullmatch(r"/api/v2/job_statuses/(\w+)\.json", path).group(1)
+            self.send_json({"job_status": self.server.poll_job(job_id)})
+        elif ticket_match:
+            ticket_id = int(ticket_match.group(1))
+            tickets = [t for t in self.server.tickets if t["id"] == ticket_id]
+            if tickets:
+                self.send_json({"ticket": tickets[0]})
+            else:
+                self.send_json({"error": "RecordNotFound"}, status=404)
+        elif tags_match:
+            self.send_json({"tags": self.server.tags_of(int(tags_match.group(1)))})
+        elif macro_match:
+            etag = f'"macro-{macro_match.group(1)}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            macro = self.server.macros.get(macro_match.group(1)) or {
+                "result": {
+                    "ticket": {
+                        "comment": {
+                            "html_body": f"<p>Macro {macro_match.group(1)}</p>",
+                            "public": False,
+                        }
+                    }
+                }
+            }
+            self.send_json(macro, headers={"ETag": etag})
+        else:
+            self.send_json({"error": "InvalidEndpoint"}, status=404)
+
+    def do_PUT(self):
+        self.server.record(self)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.send_queued_error():
+            return
+        path = self.path.split("?")[0]
+        ticket_match = re.fullmatch(r"/api/v2/tickets/(\d+)", path)
+        if ticket_match:
+            self.server.replies.append((int(ticket_match.group(1)), json.loads(body)))
+            self.send_json({"ticket": {"id": int(ticket_match.group(1))}})
+        elif path == "/api/v2/tickets/update_many.json":
+            ticket_ids = [
+                int(ticket_id)
+                for ticket_id in parse_qs(urlparse(self.path).query)["ids"][0].split(",")
+            ]
+            job_status = self.server.create_job(ticket_ids, json.loads(body))
+            self.send_json({"job_status": job_status})
+        else:
+            self.send_json({"error": "InvalidEndpoint"}, status=404)
+
+    def ticket_list(self, params):
+        # Like Zendesk, a "count:N" in the query limits the answer to N tickets
+        query = params.get("query", [""])[0]
+        count = re.search(r"\s*\bcount:(\d+)", query)
+        tickets = self.server.tickets_for(re.sub(r"\s*\bcount:\d+", "", query) or None)
+        if count:
+            tickets = tickets[: int(count.group(1))]
+        return {"listName": "tickets", "tickets": tickets}
+
+    def ticket_page(self, params):
+        # Cursor pagination, the cursor is the index of the next ticket
+        page_size = int(params["page[size]"][0])
+        start = int(params.get("page[after]", ["0"])[0])
+        end = start + page_size
+        query = params.get("query", [None])[0]
+        tickets = self.server.tickets_for(query)
+        has_more = end < len(tickets)
+        next_params = {"page[size]": page_size, "page[after]": end}
+        if query:
+            next_params["query"] = query
+        return {
+            "tickets": tickets[start:end],
+            "meta": {"has_more": has_more, "after_cursor": str(end)},
+            "links": {
+                "next": f"{self.server.base_url}tickets?{urlencode(next_params)}"
+                if has_more
+                else None
+            },
+        }
+
+    def incremental_page(self, params):
+        # The cursor is the index of the next ticket, start_time is ignored
+        start = int(params.get("cursor", ["0"])[0])
+        end = min(start + self.server.incremental_page_size, len(self.server.tickets))
+        return {
+            "tickets": self.server.tickets[start:end],
+            "after_cursor": str(end),
+            "end_of_stream": end >= len(self.server.tickets),
+        }
+
+    def send_queued_error(self):
+        error = self.server.next_error()
+        if error is None:
+            return False
+        status, headers = error
+        self.send_json({"error": "Stub error"}, status=status, headers=headers)
+        return True
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubZendeskServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, tickets=None, delay=0.0, handler=StubZendeskHandler, macros=None):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.tickets = tickets or []
+        # Recorded macros/{id}/apply responses by macro id, other macros get
+        # a generated body
+        self.macros = {str(macro_id): macro for macro_id, macro in (macros or {}).items()}
+        # Simulated network round-trip per request
+        self.delay = delay
+        self.calls = Counter()
+        self.replies = []
+        self.lock = threading.Lock()
+        self.thread = None
+        # Bulk update jobs complete after polls_until_done status requests,
+        # updates of failing_ticket_ids are reported as failed
+        self.jobs = {}
+        self.polls_until_done = 2
+        self.failing_ticket_ids = set()
+        self.incremental_page_size = 1000
+        # Search queries with their own tickets, any other query gets tickets
+        self.tickets_by_query = {}
+        self.groups = [{"id": 1, "name": "1. Level Customer Support"}, {"id": 2, "name": "Brand B"}]
+        # (status, headers) pairs answered instead of the next requests
+        self.errors = []
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v2/"
+
+    def record(self, handler):
+        with self.lock:
+            self.calls[f"{handler.command} {handler.path.split('?')[0]}"] += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+    def tickets_for(self, query):
+        return self.tickets_by_query.get(query, self.tickets)
+
+    def tags_of(self, ticket_id):
+        # Tags of the ticket plus those added by the replies it received
+        with self.lock:
+            tags = [
+                tag
+                for ticket in self.tickets
+                if ticket["id"] == ticket_id
+                for tag in ticket.get("tags", [])
+            ]
+            for replied_ticket_id, payload in self.replies:
+                if replied_ticket_id == ticket_id:
+                    tags.extend(payload.get("ticket", {}).get("additional_tags", []))
+        return tags
+
+    def next_error(self):
+        with self.lock:
+            return self.errors.pop(0) if self.errors else None
+
+    def create_job(self, ticket_ids, payload):
+        with self.lock:
+            job_id = f"job{len(self.jobs) + 1}"
+            self.jobs[job_id] = {"ticket_ids": ticket_ids, "payload": payload, "polls": 0}
+        return {"id": job_id, "status": "queued", "url": f"{self.base_url}job_statuses/{job_id}.json"}
+
+    def poll_job(self, job_id):
+        with self.lock:
+            job = self.jobs[job_id]
+            job["polls"] += 1
+            if job["polls"] < self.polls_until_done:
+                return {"id": job_id, "status": "working", "results": None}
+            if not job.get("done"):
+                job["done"] = True
+                for ticket_id in job["ticket_ids"]:
+                    if ticket_id not in self.failing_ticket_ids:
+                        self.replies.append((ticket_id, job["payload"]))
+            results = []
+            for ticket_id in job["ticket_ids"]:
+                if ticket_id in self.failing_ticket_ids:
+                    results.append(
+                        {"id": ticket_id, "success": False, "error": "TicketLocked", "details": "locked"}
+                    )
+                else:
+                    results.append({"id": ticket_id, "action": "update", "success": True, "status": "Updated"})
+            return {"id": job_id, "status": "completed", "results": results}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
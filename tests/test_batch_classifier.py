@@ -0,0 +1,293 @@
+import json
+import os
+import re
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+import numpy as np
+from supportagent.batch_classifier import BatchedLabelScorer
+from supportagent.label_scorer import LabelScorer
+from supportagent.support_agent import SupportAgent
+from supportagent.support_ticket import SupportTicket
+
+TEST_MODEL = os.environ.get("SUPPORT_AGENT_TEST_MODEL")
+
+N_VOCAB = 4096
+LABEL_TOKENS = {" RESEND_TICKET": [1, 2], " DELETE_ACCOUNT": [3, 4]}
+
+
+class FakeLlama:
+    def __init__(self, n_seq_max=1, n_ctx=2048, n_batch=512):
+        # Words are tokens. The logits only depend on the last token: after a
+        # word containing "lösch" DELETE_ACCOUNT is likelier, after any other
+        # word RESEND_TICKET, and each label's first token leads to its second.
+        self.words = ["<s>", "RES", "END", "DEL", "ETE"]
+        self.vocab = {}
+        self._n_ctx = n_ctx
+        self.n_batch = n_batch
+        self.n_threads = 4
+        self.n_threads_batch = 4
+        self.model = self
+        # Contexts created on this model besides its own
+        self.contexts = []
+        self.input_ids = []
+        self.n_tokens = 0
+        self.scores = np.zeros((n_ctx, N_VOCAB))
+        # llama-cpp-python creates its context with llama.cpp's default of a
+        # single sequence
+        self.ctx = FakeContext(self, n_seq_max, n_ctx)
+
+    def tokenize(self, text, add_bos=True):
+        text = text.decode("utf-8")
+        tokens = LABEL_TOKENS.get(text)
+        if tokens is None:
+            tokens = []
+            for word in re.findall(r"\S+", text):
+                if word not in self.vocab:
+                    self.vocab[word] = len(self.words)
+                    self.words.append(word)
+                tokens.append(self.vocab[word])
+        return ([0] if add_bos else []) + tokens
+
+    def detokenize(self, tokens):
+        return " ".join(self.words[token] for token in tokens).encode("utf-8")
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def n_vocab(self):
+        return N_VOCAB
+
+    def logits_after(self, token):
+        row = np.zeros(N_VOCAB)
+        if token in (1, 3):
+            row[token + 1] = 5.0
+        elif "lösch" in self.words[token].casefold():
+            row[1], row[3] = 1.0, 3.0
+        else:
+            row[1], row[3] = 3.0, 1.0
+        return row
+
+    def eval(self, tokens):
+        self.input_ids = self.input_ids[: self.n_tokens]
+        for token in tokens:
+            self.input_ids.append(token)
+            self.scores[self.n_tokens] = self.logits_after(token)
+            self.n_tokens += 1
+
+
+class FakeContext:
+    def __init__(self, llm, n_seq_max, n_ctx):
+        self.llm = llm
+        self.n_seq_max = n_seq_max
+        self.n_ctx = n_ctx
+        self.sequences = {}
+        self.outputs = {}
+        self.max_seq_id = 0
+        self.freed = False
+
+
+def fake_llama_cpp():
+    # The parts of the llama.cpp bindings BatchedLabelScorer uses, with a KV
+    # cache of token lists per sequence id
+    def new_context(model, params):
+        ctx = FakeContext(model, params.n_seq_max, params.n_ctx)
+        model.contexts.append(ctx)
+        return ctx
+
+    def free(ctx):
+        ctx.freed = True
+
+    def seq_rm(ctx, seq_id, p0, p1):
+        ctx.sequences.clear()
+
+    def seq_cp(ctx, src, dst, p0, p1):
+        ctx.sequences[dst] = ctx.sequences[src][p0:p1]
+
+    def batch_init(n_tokens, embd, n_seq_max):
+        return types.SimpleNamespace(
+            token=[0] * n_tokens,
+            pos=[0] * n_tokens,
+            n_seq_id=[0] * n_tokens,
+            seq_id=[[0] for _ in range(n_tokens)],
+            logits=[False] * n_tokens,
+            n_tokens=0,
+        )
+
+    def decode(ctx, batch):
+        ctx.outputs = {}
+        for index in range(batch.n_tokens):
+            seq_id = batch.seq_id[index][0]
+            if seq_id >= ctx.n_seq_max:
+                return -1
+            ctx.max_seq_id = max(ctx.max_seq_id, seq_id)
+            sequence = ctx.sequences.setdefault(seq_id, [])
+            assert len(sequence) == batch.pos[index]
+            sequence.append(batch.token[index])
+            if batch.logits[index]:
+                ctx.outputs[index] = ctx.llm.logits_after(batch.token[index])
+        return 0
+
+    return types.SimpleNamespace(
+        llama_context_default_params=lambda: types.SimpleNamespace(
+            n_ctx=512, n_batch=512, n_seq_max=1, n_threads=1, n_threads_batch=1
+        ),
+        llama_new_context_with_model=new_context,
+        llama_free=free,
+        llama_n_ctx=lambda ctx: ctx.n_ctx,
+        llama_n_seq_max=lambda ctx: ctx.n_seq_max,
+        llama_kv_cache_seq_rm=seq_rm,
+        llama_kv_cache_seq_cp=seq_cp,
+        llama_batch_init=batch_init,
+        llama_batch_free=lambda batch: None,
+        llama_decode=decode,
+        llama_get_logits_ith=lambda ctx, index: ctx.outputs[index],
+    )
+
+
+class FormatPrompt:
+    def __init__(self, template):
+        self.template = template
+
+    def format(self, support_ticket):
+        return self.template.replace("{support_ticket}", support_ticket)
+
+
+class TestBatchedLabelScorer(unittest.TestCase):
+    def setUp(self):
+        self.scorer = BatchedLabelScorer(
+            labels=["RESEND_TICKET", "DELETE_ACCOUNT"], max_batch_size=3
+        )
+        self.scorer.label_tokens = {"RESEND_TICKET": [1, 2, 3], "DELETE_ACCOUNT": [4, 5]}
+
+    def test_plan_batches_respects_max_batch_size(self):
+        batches = self.scorer.plan_batches(100, [10] * 7, n_ctx=2048)
+
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_plan_batches_respects_context_size(self):
+        # Every ticket needs its suffix plus 3 continuation tokens for labels
+        batches = self.scorer.plan_batches(100, [47, 47, 10, 90], n_ctx=200)
+
+        self.assertEqual(batches, [[0, 1], [2], [3]])
+
+    def test_plan_batches_respects_sequence_limit(self):
+        # Every ticket needs 3 sequence ids, the prefix one
+        batches = self.scorer.plan_batches(100, [10] * 5, n_ctx=2048, n_seq_max=7)
+
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+        with self.assertRaises(RuntimeError):
+            self.scorer.plan_batches(100, [10], n_ctx=2048, n_seq_max=3)
+
+    @unittest.skipUnless(TEST_MODEL, "SUPPORT_AGENT_TEST_MODEL is not set")
+    def test_batched_labels_match_single_ticket_labels(self):
+        from llama_cpp import Llama
+
+        llm = Llama(model_path=TEST_MODEL, n_ctx=2048, verbose=False)
+        prefix = "Klassifiziere das Support-Ticket als RESEND_TICKET oder DELETE_ACCOUNT.\n"
+        prompts = [
+            prefix + description
+            for description in [
+                "Ich finde meine Tickets nicht, bitte neu senden.",
+                "Bitte löschen Sie meinen Account.",
+                "Ich habe keine E-Mail erhalten.",
+                "Wie kann ich meine Daten entfernen lassen?",
+            ]
+        ]
+
+        single_scorer = LabelScorer(labels=["RESEND_TICKET", "DELETE_ACCOUNT"])
+        single = []
+        for prompt in prompts:
+            llm.reset()
+            single.append(single_scorer.score(llm, prompt))
+        batched = BatchedLabelScorer(
+            labels=["RESEND_TICKET", "DELETE_ACCOUNT"], max_batch_size=4
+        ).score(llm, prefix, prompts)
+
+        for (single_label, single_probabilities), (batched_label, batched_probabilities) in zip(
+            single, batched
+        ):
+            self.assertEqual(single_label, batched_label)
+            for label, probability in single_probabilities.items():
+                self.assertAlmostEqual(probability, batched_probabilities[label], places=2)
+
+
+
+class TestSupportAgentBatched(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        # Without trigger phrases every ticket goes to the model
+        trigger_phrases_path = os.path.join(self.tmpdir.name, "trigger_phrases.json")
+        with open(trigger_phrases_path, "w") as outfile:
+            outfile.write(json.dumps({"RESEND_TICKET": [], "DELETE_ACCOUNT": []}))
+        self.support_agent = SupportAgent(
+            trigger_phrases_path=trigger_phrases_path,
+            classification_mode="batched",
+            max_batch_size=4,
+            prompt_cache_path=None,
+            classification_cache_path=None,
+            history_path=None,
+            journal_path=None,
+        )
+        self.support_agent.prompt = FormatPrompt(self.support_agent.template)
+        self.tickets = [
+            SupportTicket(ticket_id, "kunde@example.com", "open", "Anfrage", description, None)
+            for ticket_id, description in enumerate(
+                [
+                    "Bitte meinen Account löschen",
+                    "Wo sind meine Tickets",
+                    "Meine Daten bitte löschen",
+                    "Die Mail kam nicht an",
+                    "Konto löschen",
+                ],
+                start=1,
+            )
+        ]
+
+    def tearDown(self):
+        self.support_agent.close()
+        self.tmpdir.cleanup()
+
+    def test_deferred_tickets_get_labels_and_probabilities(self):
+        # The model's own context allows a single sequence, like a Llama
+        # created without n_seq_max
+        llm = FakeLlama()
+        self.support_agent.llm = llm
+
+        with mock.patch.dict(sys.modules, {"llama_cpp": fake_llama_cpp()}):
+            classified_tickets = self.support_agent.classify_tickets(self.tickets)
+
+        self.assertEqual(
+            [support_ticket.classification for support_ticket in classified_tickets],
+            ["DELETE_ACCOUNT", "RESEND_TICKET", "DELETE_ACCOUNT", "RESEND_TICKET", "DELETE_ACCOUNT"],
+        )
+        # Same probabilities as scoring every prompt on its own
+        single_scorer = LabelScorer(labels=["RESEND_TICKET", "DELETE_ACCOUNT"])
+        for support_ticket in classified_tickets:
+            ticket_text, _ = self.support_agent.ticket_preprocessor.prepare(llm, support_ticket)
+            llm.n_tokens = 0
+            _, probabilities = single_scorer.score(
+                llm, self.support_agent.prompt.format(support_ticket=ticket_text)
+            )
+            self.assertAlmostEqual(
+                support_ticket.confidence, probabilities[support_ticket.classification]
+            )
+        # The batches ran in a context of their own, sized for four tickets
+        # of 3 sequence ids each next to the prefix
+        self.assertEqual(len(llm.contexts), 1)
+        context = llm.contexts[0]
+        self.assertEqual(context.n_seq_max, 13)
+        self.assertEqual(context.n_ctx, 2048 + 4 * (256 + 32))
+        self.assertEqual(context.max_seq_id, 12)
+        self.assertEqual(llm.ctx.max_seq_id, 0)
+        self.assertEqual(self.support_agent.run_stats["llm_calls"], 5)
+
+        with mock.patch.dict(sys.modules, {"llama_cpp": fake_llama_cpp()}):
+            self.support_agent.close()
+        self.assertTrue(context.freed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from supportagent.tests.stub_zendesk_server import StubZendeskServer
+from supportagent.zendesk_service import ZendeskService
+
+PAYLOAD = {"ticket": {"comment": {"html_body": "Test reply", "public": False}}}
+
+
+class TestBulkReplies(unittest.TestCase):
+    def setUp(self):
+        self.server = StubZendeskServer().start()
+        self.zendesk_service = ZendeskService(base_url=self.server.base_url)
+
+    def tearDown(self):
+        self.zendesk_service.close()
+        self.server.stop()
+
+    def test_replies_are_sent_in_chunks(self):
+        failures = self.zendesk_service.reply_to_customers_bulk(
+            ticket_ids=range(1, 251), payload=PAYLOAD, poll_interval=0.01
+        )
+
+        self.assertEqual(failures, {})
+        self.assertEqual(self.server.calls["PUT /api/v2/tickets/update_many.json"], 3)
+        self.assertEqual(sorted(ticket_id for ticket_id, _ in self.server.replies), list(range(1, 251)))
+        # All three jobs are polled together
+        self.assertEqual(self.server.calls["GET /api/v2/job_statuses/show_many.json"], 2)
+
+    def test_failed_tickets_are_reported(self):
+        self.server.failing_ticket_ids = {3, 7}
+
+        failures = self.zendesk_service.reply_to_customers_bulk(
+            ticket_ids=range(1, 11), payload=PAYLOAD, poll_interval=0.01
+        )
+
+        self.assertEqual(failures, {3: "locked", 7: "locked"})
+        self.assertEqual(len(self.server.replies), 8)
+
+    def test_unfinished_job_times_out(self):
+        self.server.polls_until_done = 1000
+
+        failures = self.zendesk_service.reply_to_customers_bulk(
+            ticket_ids=[1, 2], payload=PAYLOAD, poll_interval=0.01, timeout=0.1
+        )
+
+        self.assertEqual(set(failures), {1, 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from supportagent.classification_cache import ClassificationCache
+from supportagent.ticket_text import normalize_description
+
+
+class TestClassificationCache(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "classification_cache.db")
+
+    def test_normalize_description_strips_greeting_and_signature(self):
+        first = "Hallo,\n\nIch finde meine  Tickets nicht.\n\nViele Grüße\nAnna"
+        second = "Sehr geehrte Damen und Herren,\nich finde meine Tickets nicht.\n--\nBen"
+
+        self.assertEqual(normalize_description(first), "ich finde meine tickets nicht.")
+        self.assertEqual(normalize_description(first), normalize_description(second))
+
+    def test_near_identical_ticket_hits_cache(self):
+        cache = ClassificationCache(self.path, fingerprint="prompt-a")
+        cache.put(1, "Hallo,\nIch finde meine Tickets nicht\nLG Anna", "RESEND_TICKET", 0.9)
+
+        self.assertEqual(
+            cache.get(2, "Hi,\nich finde meine Tickets nicht\nMfG Ben"),
+            ("RESEND_TICKET", 0.9),
+        )
+        self.assertIsNone(cache.get(3, "Bitte löschen Sie meinen Account"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_short_tickets_do_not_share_labels(self):
+        cache = ClassificationCache(self.path)
+        cache.put(1, "Hallo!", "DELETE_ACCOUNT")
+        cache.put(2, "", "DELETE_ACCOUNT")
+
+        self.assertIsNone(cache.get(3, "Hallo,\nLG Anna"))
+        self.assertIsNone(cache.get(4, ""))
+        self.assertEqual(cache.get(1, "Hallo!"), ("DELETE_ACCOUNT", None))
+
+    def test_subject_is_part_of_the_key(self):
+        cache = ClassificationCache(self.path)
+        cache.put(1, "Ich finde meine Tickets nicht", "RESEND_TICKET", subject="Tickets")
+
+        self.assertIsNone(cache.get(2, "Ich finde meine Tickets nicht", subject="Konto"))
+        self.assertEqual(
+            cache.get(3, "Ich finde meine Tickets nicht", subject="tickets"), ("RESEND_TICKET", None)
+        )
+
+    def test_changed_fingerprint_invalidates_cache(self):
+        cache = ClassificationCache(self.path, fingerprint="prompt-a")
+        cache.put(1, "Ich finde meine Tickets nicht", "RESEND_TICKET")
+        cache.close()
+
+        cache = ClassificationCache(self.path, fingerprint="prompt-b")
+
+        self.assertIsNone(cache.get(1, "Ich finde meine Tickets nicht"))
+
+    def test_eviction_by_size_and_age(self):
+        cache = ClassificationCache(self.path, max_entries=2)
+        for ticket_id in range(5):
+            cache.put(ticket_id, f"Ticket {ticket_id}", "RESEND_TICKET")
+        cache.evict()
+
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertIsNotNone(cache.get(4, "Ticket 4"))
+
+        cache.max_age = -1
+        cache.evict()
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
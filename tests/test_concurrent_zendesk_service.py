@@ -0,0 +1,57 @@
+import time
+import unittest
+from supportagent.concurrent_zendesk_service import ConcurrentZendeskService
+from supportagent.tests.stub_zendesk_server import StubZendeskServer, make_ticket
+from supportagent.zendesk_service import ZendeskService
+
+
+class TestConcurrentZendeskService(unittest.TestCase):
+    def setUp(self):
+        self.server = StubZendeskServer(
+            tickets=[make_ticket(ticket_id) for ticket_id in range(1, 41)], delay=0.05
+        ).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_get_tickets_by_id(self):
+        zendesk_service = ConcurrentZendeskService(
+            max_workers=8, base_url=self.server.base_url
+        )
+
+        tickets = zendesk_service.get_tickets_by_id([3, 1, 2])
+        zendesk_service.close()
+
+        self.assertEqual([ticket.ticket_id for ticket in tickets], [3, 1, 2])
+        self.assertEqual(tickets[0].customer_email, "customer3@example.com")
+
+    def test_reply_batch_is_faster_than_sequential(self):
+        payload = {"ticket": {"comment": {"html_body": "Test reply", "public": False}}}
+        replies = [(ticket["id"], payload) for ticket in self.server.tickets]
+
+        sequential_service = ZendeskService(base_url=self.server.base_url)
+        start = time.perf_counter()
+        for ticket_id, reply_payload in replies:
+            sequential_service.reply_to_customer(ticket_id, reply_payload)
+        sequential_time = time.perf_counter() - start
+        sequential_service.close()
+
+        concurrent_service = ConcurrentZendeskService(
+            max_workers=8, base_url=self.server.base_url
+        )
+        start = time.perf_counter()
+        responses = concurrent_service.reply_to_customers(replies)
+        concurrent_time = time.perf_counter() - start
+        concurrent_service.close()
+
+        print(
+            f"{len(replies)} replies: sequential {sequential_time:.2f}s, "
+            f"concurrent {concurrent_time:.2f}s"
+        )
+        self.assertEqual([response.status_code for response in responses], [200] * 40)
+        self.assertEqual(len(self.server.replies), 80)
+        self.assertLess(concurrent_time, sequential_time / 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import json
+import os
+import tempfile
+import unittest
+from supportagent.embedding_index import EmbeddingIndex
+from supportagent.history_log import HistoryLog
+from supportagent.support_agent import SupportAgent
+from supportagent.support_ticket import SupportTicket
+
+
+class FakeEmbeddingLlama:
+    def create_embedding(self, text):
+        if "senden" in text:
+            vector = [1.0, 0.0]
+        elif "löschen" in text:
+            vector = [0.0, 1.0]
+        else:
+            vector = [0.7, 0.7]
+        return {"data": [{"embedding": vector}]}
+
+
+class FakeWorkerPool:
+    # Answers like the worker processes would, every ticket gets DELETE_ACCOUNT
+    def __init__(self):
+        self.tickets = []
+
+    def classify(self, support_tickets):
+        self.tickets.extend(support_tickets)
+        for support_ticket in support_tickets:
+            support_ticket.classification = "DELETE_ACCOUNT"
+        run_stats = {"tickets": len(support_tickets), "llm_calls": len(support_tickets)}
+        return [(support_tickets, [], run_stats)]
+
+
+class TestEmbeddingIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "embedding_index")
+
+    def test_query_votes_by_nearest_neighbours(self):
+        index = EmbeddingIndex(self.path)
+        index.add([1.0, 0.0, 0.0], "RESEND_TICKET", 1)
+        index.add([0.9, 0.1, 0.0], "RESEND_TICKET", 2)
+        index.add([0.0, 1.0, 0.0], "DELETE_ACCOUNT", 3)
+
+        label, margin, votes = index.query([1.0, 0.05, 0.0], k=2)
+
+        self.assertEqual(label, "RESEND_TICKET")
+        self.assertAlmostEqual(margin, 1.0)
+        self.assertEqual(set(votes), {"RESEND_TICKET"})
+
+        label, margin, _ = index.query([1.0, 1.0, 0.0], k=3)
+        self.assertLess(margin, 0.5)
+
+    def test_saved_index_is_memory_mapped_and_extendable(self):
+        index = EmbeddingIndex(self.path)
+        index.add([1.0, 0.0], "RESEND_TICKET", 1)
+        index.save()
+
+        index = EmbeddingIndex(self.path)
+        self.assertEqual(index.matrix.__class__.__name__, "memmap")
+        index.add([0.0, 1.0], "DELETE_ACCOUNT", 2)
+
+        self.assertEqual(index.query([0.1, 1.0], k=1)[0], "DELETE_ACCOUNT")
+        index.save()
+        self.assertEqual(len(EmbeddingIndex(self.path)), 2)
+
+    def test_build_from_history(self):
+        history_path = os.path.join(self.directory, "history.jsonl")
+        history_log = HistoryLog(history_path)
+        for ticket_id, description, classification in [
+            (1, "neu senden", "RESEND_TICKET"),
+            (2, "account löschen", "DELETE_ACCOUNT"),
+            (3, "keine Ahnung", "Ich bin mir nicht sicher"),
+        ]:
+            history_log.append(
+                {
+                    f"{ticket_id}": {
+                        "support_ticket": {
+                            "ticket_id": ticket_id,
+                            "description": description,
+                            "classification": classification,
+                        },
+                        "llama_output": {},
+                    }
+                }
+            )
+        history_log.close()
+
+        def embed(support_ticket):
+            return [1.0, 0.0] if "senden" in support_ticket["description"] else [0.0, 1.0]
+
+        index = EmbeddingIndex(self.path)
+        index.build_from_history(
+            history_path, embed, labels={"RESEND_TICKET", "DELETE_ACCOUNT"}
+        )
+
+        self.assertEqual(len(index), 2)
+        with open(f"{self.path}.json") as infile:
+            self.assertEqual(json.load(infile)["ticket_ids"], [1, 2])
+
+
+
+class TestEmbeddingIndexWithWorkers(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        trigger_phrases_path = os.path.join(self.directory, "trigger_phrases.json")
+        with open(trigger_phrases_path, "w") as outfile:
+            outfile.write(json.dumps({"RESEND_TICKET": [], "DELETE_ACCOUNT": []}))
+        index = EmbeddingIndex(os.path.join(self.directory, "embedding_index"))
+        index.add([1.0, 0.0], "RESEND_TICKET", 1)
+        index.add([0.0, 1.0], "DELETE_ACCOUNT", 2)
+        index.save()
+        self.support_agent = SupportAgent(
+            trigger_phrases_path=trigger_phrases_path,
+            classification_workers=2,
+            embedding_index_path=os.path.join(self.directory, "embedding_index"),
+            embedding_k=2,
+            prompt_cache_path=None,
+            classification_cache_path=None,
+            history_path=None,
+            journal_path=None,
+        )
+        self.support_agent.embedding_llm = FakeEmbeddingLlama()
+        self.support_agent.worker_pool = FakeWorkerPool()
+
+    def tearDown(self):
+        self.support_agent.worker_pool = None
+        self.support_agent.close()
+
+    def test_index_decides_before_tickets_reach_the_workers(self):
+        support_tickets = [
+            SupportTicket(ticket_id, "kunde@example.com", "open", "Anfrage", description, None)
+            for ticket_id, description in [
+                (10, "Bitte neu senden"),
+                (11, "Konto löschen"),
+                (12, "Etwas ganz anderes"),
+            ]
+        ]
+
+        classified_tickets = self.support_agent.classify_tickets(support_tickets)
+
+        self.assertEqual(
+            {ticket.ticket_id: ticket.classification for ticket in classified_tickets},
+            {10: "RESEND_TICKET", 11: "DELETE_ACCOUNT", 12: "DELETE_ACCOUNT"},
+        )
+        self.assertEqual([ticket.ticket_id for ticket in self.support_agent.worker_pool.tickets], [12])
+        self.assertEqual(self.support_agent.run_stats["embedding_hits"], 2)
+        self.assertEqual(self.support_agent.run_stats["tickets"], 3)
+        # The label the workers found is added to the index
+        self.assertEqual(len(self.support_agent.embedding_index), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
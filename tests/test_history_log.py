@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from supportagent.history_log import CHUNK_HEADER, HistoryLog, read_history, tail_history
+
+
+class TestHistoryLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def test_entries_are_streamed_back(self):
+        path = os.path.join(self.directory, "history.jsonl")
+        history_log = HistoryLog(path, buffer_size=100)
+        for ticket_id in range(10):
+            history_log.append({f"{ticket_id}": {"classification": "RESEND_TICKET"}})
+        history_log.close()
+
+        entries = list(read_history(path))
+
+        self.assertEqual(len(entries), 10)
+        self.assertEqual(entries[3], {"3": {"classification": "RESEND_TICKET"}})
+        self.assertEqual(tail_history(path, count=2), entries[-2:])
+
+    def test_later_runs_append(self):
+        path = os.path.join(self.directory, "history.jsonl")
+        for run in range(2):
+            history_log = HistoryLog(path)
+            history_log.append({"run": run})
+            history_log.close()
+
+        self.assertEqual(list(read_history(path)), [{"run": 0}, {"run": 1}])
+
+    def test_partial_last_line_is_skipped(self):
+        path = os.path.join(self.directory, "history.jsonl")
+        history_log = HistoryLog(path)
+        history_log.append({"run": 0})
+        history_log.close()
+        with open(path, "ab") as outfile:
+            outfile.write(b'{"run": ')
+
+        self.assertEqual(list(read_history(path)), [{"run": 0}])
+
+    def test_torn_line_is_removed_before_appending(self):
+        path = os.path.join(self.directory, "history.jsonl")
+        history_log = HistoryLog(path)
+        history_log.append({"run": 0})
+        history_log.close()
+        with open(path, "ab") as outfile:
+            outfile.write(b'{"run": ')
+
+        history_log = HistoryLog(path)
+        history_log.append({"run": 1})
+        history_log.close()
+
+        self.assertEqual(list(read_history(path)), [{"run": 0}, {"run": 1}])
+
+    def test_torn_chunk_is_removed_before_appending(self):
+        path = os.path.join(self.directory, "history.jsonl.br")
+        with open(path, "wb") as outfile:
+            outfile.write(CHUNK_HEADER.pack(3) + b"abc" + CHUNK_HEADER.pack(100) + b"partial")
+
+        HistoryLog(path, compress=True).close()
+
+        self.assertEqual(os.path.getsize(path), CHUNK_HEADER.size + 3)
+
+    def test_compressed_log_gets_br_suffix(self):
+        history_log = HistoryLog(os.path.join(self.directory, "history.jsonl"), compress=True)
+        history_log.close()
+
+        self.assertTrue(history_log.path.endswith("history.jsonl.br"))
+
+    def test_compressed_log(self):
+        try:
+            import brotli  # noqa: F401
+        except ImportError:
+            self.skipTest("brotli is not installed")
+        path = os.path.join(self.directory, "history.jsonl.br")
+        for run in range(2):
+            history_log = HistoryLog(path, compress=True, buffer_size=50)
+            for ticket_id in range(5):
+                history_log.append({"run": run, "ticket_id": ticket_id})
+            history_log.close()
+
+        entries = list(read_history(path))
+
+        self.assertEqual(len(entries), 10)
+        self.assertEqual(entries[-1], {"run": 1, "ticket_id": 4})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from supportagent.label_scorer import LabelScorer
+
+VOCAB = ["<s>", "Ticket", "RES", "END", "DEL", "ETE"]
+
+
+class FakeLlama:
+    def __init__(self, next_token_logits):
+        # next_token_logits maps the last evaluated token to the logits row
+        self.next_token_logits = next_token_logits
+        self.input_ids = []
+        self.n_tokens = 0
+        self.scores = np.zeros((32, len(VOCAB)))
+        self.evaluated = 0
+
+    def tokenize(self, text, add_bos=True):
+        tokens = {
+            " RESEND_TICKET": [2, 3],
+            " DELETE_ACCOUNT": [4, 5],
+        }.get(text.decode("utf-8"))
+        if tokens is None:
+            tokens = [1] * len(text.decode("utf-8").split())
+        return ([0] if add_bos else []) + tokens
+
+    def eval(self, tokens):
+        self.input_ids = self.input_ids[: self.n_tokens]
+        for token in tokens:
+            self.input_ids.append(token)
+            self.scores[self.n_tokens] = self.next_token_logits.get(token, 0.0)
+            self.n_tokens += 1
+            self.evaluated += 1
+
+
+class TestLabelScorer(unittest.TestCase):
+    def test_score_returns_label_and_probabilities(self):
+        llm = FakeLlama(
+            {
+                1: np.array([0.0, 0.0, 4.0, 0.0, 1.0, 0.0]),
+                2: np.array([0.0, 0.0, 0.0, 5.0, 0.0, 0.0]),
+                4: np.array([0.0, 0.0, 0.0, 0.0, 0.0, 5.0]),
+            }
+        )
+        scorer = LabelScorer(labels=["RESEND_TICKET", "DELETE_ACCOUNT"])
+
+        label, probabilities = scorer.score(llm, "Ticket Ticket Ticket")
+
+        self.assertEqual(label, "RESEND_TICKET")
+        self.assertAlmostEqual(sum(probabilities.values()), 1.0)
+        self.assertGreater(probabilities["RESEND_TICKET"], 0.9)
+        # Prompt (4 tokens) plus one continuation token per label
+        self.assertEqual(llm.evaluated, 6)
+        self.assertEqual(llm.n_tokens, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from supportagent.concurrent_zendesk_service import ConcurrentZendeskService
+from supportagent.tests.stub_zendesk_server import StubZendeskServer
+from supportagent.zendesk_service import ZendeskService
+
+MACRO_PATH = "GET /api/v2/macros/8140353174289/apply"
+
+
+class TestMacroCache(unittest.TestCase):
+    def setUp(self):
+        self.server = StubZendeskServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_macro_is_fetched_once(self):
+        zendesk_service = ConcurrentZendeskService(
+            max_workers=8, base_url=self.server.base_url
+        )
+
+        html_bodies = zendesk_service.map(
+            zendesk_service.get_macro_html_body, [8140353174289] * 20
+        )
+        zendesk_service.close()
+
+        self.assertEqual(set(html_bodies), {"<p>Macro 8140353174289</p>"})
+        self.assertEqual(self.server.calls[MACRO_PATH], 1)
+        self.assertEqual(zendesk_service.macro_cache.stats()["hits"], 19)
+        self.assertEqual(zendesk_service.macro_cache.stats()["misses"], 1)
+
+    def test_expired_macro_is_revalidated_with_etag(self):
+        zendesk_service = ZendeskService(base_url=self.server.base_url, macro_cache_ttl=0)
+
+        zendesk_service.get_macro_html_body(8140353174289)
+        html_body = zendesk_service.get_macro_html_body(8140353174289)
+
+        self.assertEqual(html_body, "<p>Macro 8140353174289</p>")
+        self.assertEqual(self.server.calls[MACRO_PATH], 2)
+        self.assertEqual(zendesk_service.macro_cache.stats()["revalidations"], 1)
+
+    def test_macro_is_loaded_from_disk(self):
+        cache_path = os.path.join(tempfile.mkdtemp(), "macros.json")
+        ZendeskService(
+            base_url=self.server.base_url, macro_cache_path=cache_path
+        ).get_macro_html_body(8140353174289)
+
+        zendesk_service = ZendeskService(
+            base_url=self.server.base_url, macro_cache_path=cache_path
+        )
+        html_body = zendesk_service.get_macro_html_body(8140353174289)
+
+        self.assertEqual(html_body, "<p>Macro 8140353174289</p>")
+        self.assertEqual(self.server.calls[MACRO_PATH], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
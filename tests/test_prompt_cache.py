@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from supportagent.prompt_cache import PromptPrefixCache
+
+
+class FakeLlama:
+    def __init__(self):
+        self.evaluated = []
+        self.loaded_state = None
+
+    def tokenize(self, text):
+        return list(text.decode("utf-8").split())
+
+    def reset(self):
+        self.evaluated = []
+
+    def eval(self, tokens):
+        self.evaluated.extend(tokens)
+
+    def save_state(self):
+        return {"evaluated": list(self.evaluated)}
+
+    def load_state(self, state):
+        self.loaded_state = state
+
+
+class TestPromptPrefixCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_path = os.path.join(tempfile.mkdtemp(), "prompt_cache.bin")
+
+    def test_prefix_is_evaluated_once(self):
+        llm = FakeLlama()
+        prompt_cache = PromptPrefixCache("Du bist Supportio", "model.gguf", self.cache_path)
+
+        prompt_cache.restore(llm)
+        prompt_cache.restore(llm)
+
+        self.assertEqual(llm.evaluated, ["Du", "bist", "Supportio"])
+        self.assertEqual(llm.loaded_state, {"evaluated": ["Du", "bist", "Supportio"]})
+        self.assertEqual(
+            prompt_cache.prefill_tokens(llm, "Du bist Supportio Tickets neu senden"), 3
+        )
+
+    def test_snapshot_is_loaded_from_disk(self):
+        PromptPrefixCache("Du bist Supportio", "model.gguf", self.cache_path).restore(
+            FakeLlama()
+        )
+
+        llm = FakeLlama()
+        PromptPrefixCache("Du bist Supportio", "model.gguf", self.cache_path).restore(llm)
+
+        # Nothing is evaluated, the state comes from the snapshot file
+        self.assertEqual(llm.evaluated, [])
+        self.assertEqual(llm.loaded_state, {"evaluated": ["Du", "bist", "Supportio"]})
+
+    def test_snapshot_is_ignored_for_other_model(self):
+        PromptPrefixCache("Du bist Supportio", "model.gguf", self.cache_path).restore(
+            FakeLlama()
+        )
+
+        llm = FakeLlama()
+        PromptPrefixCache("Du bist Supportio", "other.gguf", self.cache_path).restore(llm)
+
+        self.assertEqual(llm.evaluated, ["Du", "bist", "Supportio"])
+
+
+if __name__ == "__main__":
+    unittest.main()
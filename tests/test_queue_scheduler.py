@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+from supportagent.queue_scheduler import QueueScheduler, load_queue_config
+from supportagent.tests.stub_zendesk_server import StubZendeskServer, make_ticket
+
+
+class TestQueueScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = StubZendeskServer().start()
+        self.server.tickets_by_query = {
+            "group:large": [make_ticket(ticket_id) for ticket_id in range(1, 61)],
+            "group:small": [make_ticket(ticket_id) for ticket_id in range(1001, 1021)],
+        }
+        config_path = os.path.join(self.tmpdir.name, "queues.json")
+        with open(config_path, "w") as outfile:
+            outfile.write(
+                json.dumps(
+                    {
+                        "quantum": 10,
+                        "queues": [
+                            {
+                                "name": "large",
+                                "query": "group:large",
+                                "weight": 3,
+                                "classification_map": {"RESEND_TICKET": 111},
+                            },
+                            {
+                                "name": "small",
+                                "query": "group:small",
+                                "weight": 1,
+                                "classification_map": {"RESEND_TICKET": 222},
+                            },
+                        ],
+                    }
+                )
+            )
+        self.config = load_queue_config(config_path)
+        for queue in self.config["queues"]:
+            queue["prompt_cache_path"] = None
+            queue["classification_cache_path"] = None
+            queue["history_path"] = os.path.join(self.tmpdir.name, f"history.{queue['name']}.jsonl")
+            queue["journal_path"] = os.path.join(self.tmpdir.name, f"run_journal.{queue['name']}.db")
+        self.scheduler = QueueScheduler(
+            self.config, zendesk_base_url=self.server.base_url, rate_limit=10**6
+        )
+
+    def tearDown(self):
+        self.scheduler.close()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def test_queues_share_model_and_http_pool(self):
+        large, small = (queue.agent for queue in self.scheduler.queues)
+        model = object()
+        large.llm = model
+
+        self.assertIs(small.zendesk_service, large.zendesk_service)
+        self.assertIs(small.llm, model)
+
+    def test_queues_use_their_own_macros(self):
+        served = self.scheduler.run(page_size=25)
+
+        self.assertEqual(served, {"large": 60, "small": 20})
+        self.assertEqual(self.server.calls["GET /api/v2/macros/111/apply"], 1)
+        self.assertEqual(self.server.calls["GET /api/v2/macros/222/apply"], 1)
+        bodies = {
+            ticket_id: payload["ticket"]["comment"]["html_body"]
+            for ticket_id, payload in self.server.replies
+        }
+        self.assertEqual(bodies[1], "<p>Macro 111</p>")
+        self.assertEqual(bodies[1001], "<p>Macro 222</p>")
+
+    def test_small_queue_is_not_starved(self):
+        self.scheduler.run(page_size=25)
+
+        order = [ticket_id > 1000 for ticket_id, _ in self.server.replies]
+        # With weights 3:1 the small queue gets its batches second and sixth,
+        # before the large queue has worked through its backlog
+        self.assertEqual(order, [False] * 10 + [True] * 10 + [False] * 30 + [True] * 10 + [False] * 20)
+
+    def test_weights_must_be_positive(self):
+        for weight in (0, -1):
+            config_path = os.path.join(self.tmpdir.name, f"queues.{weight}.json")
+            with open(config_path, "w") as outfile:
+                outfile.write(json.dumps({"queues": [{"name": "broken", "weight": weight}]}))
+
+            with self.assertRaises(ValueError):
+                load_queue_config(config_path)
+
+    def test_queues_do_not_start_worker_processes(self):
+        with self.assertRaises(ValueError):
+            QueueScheduler(self.config, classification_workers=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
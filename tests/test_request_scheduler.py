@@ -0,0 +1,100 @@
+import threading
+import time
+import unittest
+import requests
+from supportagent.request_scheduler import LANES, TokenBucket
+from supportagent.tests.stub_zendesk_server import StubZendeskServer, make_ticket
+from supportagent.zendesk_service import ZendeskService
+
+PAYLOAD = {"ticket": {"comment": {"html_body": "Test reply", "public": False}}}
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_acquire_waits_for_tokens(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+
+        # The first token is free, the other five refill at 50 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_writes_get_tokens_before_reads(self):
+        bucket = TokenBucket(rate=1000, capacity=1)
+        bucket.block(0.1)
+        order = []
+
+        def acquire(lane):
+            bucket.acquire(LANES[lane])
+            order.append(lane)
+
+        reader = threading.Thread(target=acquire, args=("read",))
+        reader.start()
+        time.sleep(0.02)
+        writer = threading.Thread(target=acquire, args=("write",))
+        writer.start()
+        reader.join()
+        writer.join()
+
+        self.assertEqual(order, ["write", "read"])
+
+    def test_sync_follows_the_server_limit(self):
+        bucket = TokenBucket(rate=100, capacity=50)
+
+        bucket.sync(remaining=3, limit=120)
+
+        self.assertEqual(bucket.rate, 2.0)
+        self.assertLessEqual(bucket.tokens, 3)
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.server = StubZendeskServer(tickets=[make_ticket(1)]).start()
+        self.zendesk_service = ZendeskService(base_url=self.server.base_url, max_retries=2)
+        self.zendesk_service.scheduler.backoff_base = 0.01
+        self.metrics = self.zendesk_service.scheduler.metrics
+
+    def tearDown(self):
+        self.zendesk_service.close()
+        self.server.stop()
+
+    def test_throttled_and_unavailable_requests_are_retried(self):
+        self.server.errors = [(429, {"Retry-After": "0.05"}), (503, {})]
+
+        support_ticket = self.zendesk_service.get_ticket(1)
+
+        self.assertEqual(support_ticket.ticket_id, 1)
+        self.assertEqual(self.server.calls["GET /api/v2/tickets/1"], 3)
+        stats = self.metrics.as_dict()
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["throttled"], 1)
+        self.assertGreaterEqual(stats["throttled_seconds"], 0.05)
+
+    def test_error_is_raised_after_retries(self):
+        self.server.errors = [(500, {})] * 3
+
+        with self.assertRaises(requests.HTTPError):
+            self.zendesk_service.get_ticket(1)
+
+        self.assertEqual(self.server.calls["GET /api/v2/tickets/1"], 3)
+        self.assertEqual(self.metrics.as_dict()["failures"], 1)
+
+    def test_failed_write_is_not_repeated(self):
+        # The reply may have been posted before the server failed
+        self.server.errors = [(500, {})]
+
+        with self.assertRaises(requests.HTTPError):
+            self.zendesk_service.reply_to_customer(1, PAYLOAD)
+
+        self.assertEqual(self.server.calls["PUT /api/v2/tickets/1"], 1)
+
+    def test_client_errors_are_raised(self):
+        with self.assertRaises(requests.HTTPError):
+            self.zendesk_service.get_ticket(2)
+
+        self.assertEqual(self.metrics.as_dict()["retries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import tempfile
+import unittest
+from supportagent.run_journal import CLASSIFIED, FETCHED, REPLIED, REPLYING, RunJournal
+from supportagent.support_agent import REPLIED_TAG, SupportAgent
+from supportagent.tests.stub_zendesk_server import StubZendeskServer, make_ticket
+
+
+class TestRunJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "run_journal.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_stages_survive_reopening(self):
+        journal = RunJournal(self.path)
+        journal.record_fetched([1, 2, 3])
+        journal.record_classified([(1, "RESEND_TICKET", 0.9, 111), (2, "DELETE_ACCOUNT", None, 222)])
+        journal.record_stage([1], REPLIED, 111)
+        journal.close()
+
+        journal = RunJournal(self.path)
+        entries = journal.lookup([1, 2, 3, 4])
+        journal.close()
+
+        self.assertEqual(sorted(entries), ["1", "2", "3"])
+        self.assertEqual(entries["1"].stage, REPLIED)
+        self.assertEqual(entries["1"].macro_id, 111)
+        self.assertEqual((entries["2"].stage, entries["2"].label), (CLASSIFIED, "DELETE_ACCOUNT"))
+        self.assertEqual(entries["3"].stage, FETCHED)
+
+    def test_fetching_again_keeps_the_stage(self):
+        journal = RunJournal(self.path)
+        journal.record_fetched([1])
+        journal.record_classified([(1, "RESEND_TICKET", None, 111)])
+        journal.record_fetched([1])
+
+        self.assertEqual(journal.lookup([1])["1"].stage, CLASSIFIED)
+        journal.close()
+
+    def test_lookup_of_many_tickets(self):
+        journal = RunJournal(self.path)
+        journal.record_fetched(range(5000))
+
+        self.assertEqual(len(journal.lookup(range(4990, 5010))), 10)
+        self.assertEqual(journal.stats(), {FETCHED: 5000})
+        journal.close()
+
+
+class TestSupportAgentJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = StubZendeskServer(
+            tickets=[make_ticket(ticket_id) for ticket_id in range(1, 6)]
+        ).start()
+        self.journal_path = os.path.join(self.tmpdir.name, "run_journal.db")
+        self.support_agent = self.make_agent()
+
+    def tearDown(self):
+        self.support_agent.close()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def make_agent(self):
+        return SupportAgent(
+            prompt_cache_path=None,
+            classification_cache_path=None,
+            history_path=os.path.join(self.tmpdir.name, "history.jsonl"),
+            journal_path=self.journal_path,
+            zendesk_base_url=self.server.base_url,
+        )
+
+    def replied_ticket_ids(self):
+        return sorted(ticket_id for ticket_id, _ in self.server.replies)
+
+    def test_second_run_skips_answered_tickets(self):
+        self.support_agent.solve_tickets()
+        self.support_agent.close()
+
+        self.support_agent = self.make_agent()
+        self.support_agent.solve_tickets()
+
+        self.assertEqual(self.replied_ticket_ids(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.support_agent.run_stats["tickets"], 0)
+        self.assertEqual(self.support_agent.run_stats["journal_skips"], 5)
+
+    def test_interrupted_run_is_resumed(self):
+        # The journal an earlier run left behind when it died: ticket 1 was
+        # answered, 2 classified, 3 and 4 sent but not recorded, of which
+        # only 3 reached Zendesk. Only ticket 4 keeps its journaled label.
+        journal = self.support_agent.run_journal
+        journal.record_fetched([1, 2, 3, 4, 5])
+        journal.record_classified(
+            [(ticket_id, "RESEND_TICKET", None, 8140353174289) for ticket_id in (1, 2, 3, 4)]
+        )
+        journal.record_stage([1], REPLIED)
+        journal.record_stage([3, 4], REPLYING)
+        self.server.replies.append((3, {"ticket": {"additional_tags": [REPLIED_TAG]}}))
+
+        self.support_agent.solve_tickets()
+
+        self.assertEqual(self.replied_ticket_ids(), [2, 3, 4, 5])
+        self.assertEqual(self.support_agent.run_stats["tickets"], 2)
+        self.assertEqual(self.support_agent.run_stats["journal_skips"], 2)
+        self.assertEqual(self.support_agent.run_stats["journal_resumed"], 1)
+        self.assertEqual(journal.stats(), {REPLIED: 5})
+
+    def test_refused_reply_is_retried_next_run(self):
+        self.server.tickets = [make_ticket(1)]
+        # Ticket list and macro go through, the reply is refused
+        self.server.errors = [None, None, (422, {})]
+        self.support_agent.solve_tickets()
+
+        self.assertEqual(self.support_agent.run_journal.lookup([1])["1"].stage, CLASSIFIED)
+
+        self.support_agent.solve_tickets()
+
+        self.assertEqual(self.replied_ticket_ids(), [1])
+        self.assertEqual(self.support_agent.run_stats["tickets"], 1)
+
+    def test_classified_ticket_is_classified_again(self):
+        # An earlier run skipped the ticket with a label that no longer holds
+        journal = self.support_agent.run_journal
+        journal.record_fetched([1])
+        journal.record_classified([(1, "DELETE_ACCOUNT", 0.1, 8147065642385)])
+        self.server.tickets = [make_ticket(1)]
+
+        self.support_agent.solve_tickets()
+
+        entry = journal.lookup([1])["1"]
+        self.assertEqual((entry.stage, entry.label), (REPLIED, "RESEND_TICKET"))
+        self.assertEqual(entry.macro_id, 8140353174289)
+        self.assertEqual(self.support_agent.run_stats["journal_resumed"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
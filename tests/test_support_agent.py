@@ -1,4 +1,6 @@
 import json
+import os
+import tempfile
 import unittest
 from unittest.mock import Mock, patch
 from supportagent.support_agent import SupportAgent
@@ -10,6 +12,16 @@ class TestSupportAgent(unittest.TestCase):
         # Create a SupportAgent instance for testing
         self.support_agent = SupportAgent()
 
+    def test_constructor_touches_no_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cwd = os.getcwd()
+            os.chdir(tmpdir)
+            try:
+                SupportAgent().close()
+            finally:
+                os.chdir(cwd)
+            self.assertEqual(os.listdir(tmpdir), [])
+
     def test_classify_tickets(self):
         # Create a list of mock SupportTicket objects
         support_tickets = [
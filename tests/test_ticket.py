@@ -1,5 +1,9 @@
+import contextlib
+import io
+import json
 import unittest
-from supportagent.support_ticket import SupportTicket
+from supportagent.support_agent import SupportAgent
+from supportagent.support_ticket import Classification, SupportTicket, TicketStatus
 
 
 class TestSupportTicket(unittest.TestCase):
@@ -27,3 +31,60 @@ class TestSupportTicket(unittest.TestCase):
             "classification": "RESEND_TICKET",
         }
         self.assertEqual(ticket_dict, expected_dict)
+
+    def test_known_values_are_stored_as_enums(self):
+        ticket = SupportTicket(
+            ticket_id=1,
+            customer_email="test@example.com",
+            status="open",
+            subject="Test subject",
+            description="Test description",
+            classification=None,
+        )
+        ticket.classification = "DELETE_ACCOUNT"
+
+        self.assertIs(ticket.status, TicketStatus.OPEN)
+        self.assertIs(ticket.classification, Classification.DELETE_ACCOUNT)
+        self.assertEqual(ticket.classification, "DELETE_ACCOUNT")
+        # as_dict keeps plain strings, so exports look as before
+        self.assertIs(type(ticket.as_dict()["classification"]), str)
+        self.assertEqual(json.loads(json.dumps(ticket.as_dict()))["status"], "open")
+
+    def test_unknown_values_are_kept(self):
+        ticket = SupportTicket(
+            ticket_id=1,
+            customer_email="",
+            status="archived",
+            subject="Test subject",
+            description="Test description",
+            classification="Unclear",
+        )
+
+        self.assertEqual(ticket.as_dict()["status"], "archived")
+        self.assertEqual(ticket.as_dict()["classification"], "Unclear")
+
+    def test_skipped_ticket_is_reported_with_its_label(self):
+        support_agent = SupportAgent(
+            confidence_threshold=0.5,
+            classification_cache_path=None,
+            history_path=None,
+            journal_path=None,
+        )
+        ticket = SupportTicket(1, "", "open", "Test subject", "Test description", "DELETE_ACCOUNT")
+        ticket.confidence = 0.2
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            macro_id = support_agent._SupportAgent__macro_for(ticket)
+        support_agent.close()
+
+        self.assertIsNone(macro_id)
+        self.assertEqual(
+            output.getvalue(), "Skipping ticket 1: DELETE_ACCOUNT with confidence 0.20\n"
+        )
+
+    def test_ticket_has_no_instance_dict(self):
+        ticket = SupportTicket(1, "", "open", "Test subject", "Test description", None)
+
+        with self.assertRaises(AttributeError):
+            ticket.unknown_attribute = True
@@ -0,0 +1,135 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from supportagent.support_agent import REPLIED_TAG, SupportAgent
+from supportagent.tests.stub_zendesk_server import StubZendeskServer, make_ticket
+from supportagent.ticket_daemon import TicketDaemon
+from supportagent.tracing import Tracer
+
+
+class TestTicketDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        closed_ticket = make_ticket(4)
+        closed_ticket["status"] = "closed"
+        answered_ticket = make_ticket(5)
+        answered_ticket["tags"] = [REPLIED_TAG]
+        self.server = StubZendeskServer(
+            tickets=[make_ticket(1), make_ticket(2), make_ticket(3), closed_ticket, answered_ticket]
+        ).start()
+        self.state_path = os.path.join(self.tmpdir.name, "daemon_state.json")
+        self.support_agent = SupportAgent(
+            prompt_cache_path=None,
+            classification_cache_path=None,
+            history_path=os.path.join(self.tmpdir.name, "history.jsonl"),
+            journal_path=os.path.join(self.tmpdir.name, "run_journal.db"),
+            zendesk_base_url=self.server.base_url,
+        )
+
+    def tearDown(self):
+        self.support_agent.close()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def replied_ticket_ids(self):
+        return sorted(ticket_id for ticket_id, _ in self.server.replies)
+
+    def test_poll_answers_changed_tickets_once(self):
+        daemon = TicketDaemon(self.support_agent, state_path=self.state_path)
+
+        self.assertEqual(daemon.poll(), 3)
+        self.assertEqual(self.replied_ticket_ids(), [1, 2, 3])
+        self.assertEqual(self.server.replies[0][1]["ticket"]["additional_tags"], [REPLIED_TAG])
+
+        self.server.tickets.append(make_ticket(6))
+        self.assertEqual(daemon.poll(), 1)
+        self.assertEqual(self.replied_ticket_ids(), [1, 2, 3, 6])
+        with open(self.state_path, "r") as infile:
+            self.assertEqual(json.load(infile)["cursor"], "6")
+
+    def test_cursor_survives_restart(self):
+        TicketDaemon(self.support_agent, state_path=self.state_path).poll()
+
+        daemon = TicketDaemon(self.support_agent, state_path=self.state_path)
+
+        self.assertEqual(daemon.state.cursor, "5")
+        self.assertEqual(daemon.poll(), 0)
+        self.assertEqual(len(self.server.replies), 3)
+
+    def test_tickets_of_other_groups_are_not_answered(self):
+        self.server.tickets.append(make_ticket(6, group_id=2))
+        daemon = TicketDaemon(self.support_agent, state_path=self.state_path)
+
+        self.assertEqual(daemon.poll(), 3)
+        self.assertEqual(daemon.group_id, 1)
+        self.assertEqual(self.replied_ticket_ids(), [1, 2, 3])
+
+    def test_unknown_group_stops_the_daemon(self):
+        daemon = TicketDaemon(self.support_agent, state_path=self.state_path, group_name="Unknown")
+
+        with self.assertRaises(ValueError):
+            daemon.run()
+        self.assertEqual(self.server.replies, [])
+
+    def test_creation_to_reply_covers_new_answered_tickets(self):
+        metrics_path = os.path.join(self.tmpdir.name, "metrics.jsonl")
+        self.support_agent.tracer = Tracer(metrics_path=metrics_path)
+        now = time.time()
+        self.server.tickets = []
+        for ticket_id, description, age in [
+            (1, "Bitte die Tickets neu senden", 5),
+            (2, "Bitte die Tickets neu senden", 30),
+            # Answered, but only updated since it was created two days ago
+            (3, "Bitte die Tickets neu senden", 2 * 24 * 3600),
+            # Not answered, the classification map has no macro for it
+            (4, "Bitte meine Daten löschen", 5),
+        ]:
+            ticket = make_ticket(ticket_id, description)
+            ticket["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now - age))
+            self.server.tickets.append(ticket)
+        self.support_agent.classification_map = {"RESEND_TICKET": 111}
+
+        TicketDaemon(self.support_agent, state_path=self.state_path).poll()
+        self.support_agent.tracer.close()
+
+        self.assertEqual(self.replied_ticket_ids(), [1, 2, 3])
+        with open(metrics_path, "r") as infile:
+            entries = [json.loads(line) for line in infile]
+        latencies = [entry for entry in entries if entry.get("span") == "creation_to_reply"]
+        self.assertEqual(sorted(entry["ticket_id"] for entry in latencies), [1, 2])
+        summaries = [entry["run_summary"] for entry in entries if "run_summary" in entry]
+        self.assertEqual(summaries[-1]["creation_to_reply"]["count"], 2)
+
+    def test_pages_are_followed(self):
+        self.server.incremental_page_size = 2
+        daemon = TicketDaemon(self.support_agent, state_path=self.state_path)
+
+        self.assertEqual(daemon.poll(), 3)
+        self.assertEqual(self.server.calls["GET /api/v2/incremental/tickets/cursor.json"], 3)
+
+    def test_run_backs_off_and_stops(self):
+        daemon = TicketDaemon(
+            self.support_agent, state_path=self.state_path, min_interval=0.01, max_interval=0.05
+        )
+        with patch.object(self.support_agent, "warm_up"):
+            thread = threading.Thread(target=daemon.run)
+            thread.start()
+            deadline = time.monotonic() + 5
+            while len(self.server.replies) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.2)
+            daemon.stop()
+            thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.replied_ticket_ids(), [1, 2, 3])
+        # Nothing changed after the first pass, so the interval grew to the maximum
+        self.assertEqual(daemon.interval, 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import time
+import unittest
+from supportagent.tests.stub_zendesk_server import StubZendeskServer, make_ticket
+from supportagent.zendesk_service import ZendeskService
+
+
+class TestTicketPagination(unittest.TestCase):
+    def setUp(self):
+        self.server = StubZendeskServer(
+            tickets=[make_ticket(ticket_id) for ticket_id in range(1, 251)]
+        ).start()
+        self.zendesk_service = ZendeskService(base_url=self.server.base_url)
+
+    def tearDown(self):
+        self.zendesk_service.close()
+        self.server.stop()
+
+    def test_iter_tickets_follows_cursor(self):
+        tickets = list(self.zendesk_service.iter_tickets(page_size=100))
+
+        self.assertEqual([ticket.ticket_id for ticket in tickets], list(range(1, 251)))
+        self.assertEqual(self.server.calls["GET /api/v2/tickets"], 3)
+
+    def test_next_page_is_prefetched(self):
+        self.server.delay = 0.1
+        pages = self.zendesk_service.iter_ticket_pages(page_size=100)
+
+        start = time.perf_counter()
+        for page in pages:
+            # Simulated classification of the page takes as long as a request
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - start
+
+        # Three pages sequentially would take 0.6s, with prefetch about 0.4s
+        self.assertLess(elapsed, 0.55)
+
+
+if __name__ == "__main__":
+    unittest.main()
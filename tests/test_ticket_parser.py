@@ -0,0 +1,55 @@
+import json
+import unittest
+from unittest.mock import patch
+from supportagent import ticket_parser
+from supportagent.tests.stub_zendesk_server import make_ticket
+
+
+def zendesk_ticket(ticket_id, channel="email"):
+    # A ticket with some of the fields the agent never reads
+    ticket_data = make_ticket(ticket_id)
+    ticket_data.update(
+        {
+            "url": f"https://example.zendesk.com/api/v2/tickets/{ticket_id}.json",
+            "tags": ["eticket", "resend"],
+            "custom_fields": [{"id": 360001, "value": None}],
+            "collaborator_ids": [],
+        }
+    )
+    if channel != "email":
+        ticket_data["via"] = {"channel": channel, "source": {"from": {}}}
+    return ticket_data
+
+
+class TestTicketParser(unittest.TestCase):
+    def setUp(self):
+        self.body = json.dumps(
+            {
+                "tickets": [zendesk_ticket(1), zendesk_ticket(2, channel="web")],
+                "meta": {"has_more": True, "after_cursor": "2"},
+                "links": {"next": "https://example.zendesk.com/api/v2/tickets?page[after]=2"},
+            }
+        ).encode("utf-8")
+
+    def test_parse_ticket_page(self):
+        page = ticket_parser.parse_ticket_page(self.body)
+
+        self.assertEqual([ticket.ticket_id for ticket in page["tickets"]], [1, 2])
+        self.assertEqual(page["tickets"][0].customer_email, "customer1@example.com")
+        self.assertEqual(page["tickets"][1].customer_email, "")
+        self.assertEqual(page["tickets"][0].as_dict()["status"], "open")
+        self.assertTrue(page["meta"]["has_more"])
+        self.assertIn("page[after]=2", page["links"]["next"])
+
+    def test_parse_ticket_page_without_orjson(self):
+        with patch.object(ticket_parser, "orjson", None):
+            page = ticket_parser.parse_ticket_page(self.body)
+
+        self.assertEqual(
+            [ticket.as_dict() for ticket in page["tickets"]],
+            [ticket.as_dict() for ticket in ticket_parser.parse_ticket_page(self.body)["tickets"]],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import threading
+import time
+import unittest
+from supportagent.ticket_pipeline import TicketPipeline
+
+
+class TestTicketPipeline(unittest.TestCase):
+    def test_stages_overlap(self):
+        replied = []
+
+        def classify(ticket):
+            time.sleep(0.01)
+            return [ticket]
+
+        def reply(ticket):
+            time.sleep(0.04)
+            replied.append(ticket)
+
+        pipeline = TicketPipeline(classify, reply, queue_size=4, reply_workers=4)
+        report = pipeline.run(range(40))
+
+        self.assertEqual(sorted(replied), list(range(40)))
+        self.assertEqual(report["stages"]["classify"]["processed"], 40)
+        self.assertEqual(report["stages"]["reply"]["processed"], 40)
+        # Sequential phases would take 0.4s + 1.6s
+        self.assertLess(report["wall_seconds"], 1.0)
+
+    def test_queues_are_bounded(self):
+        def classify(ticket):
+            return [ticket]
+
+        def reply(ticket):
+            time.sleep(0.005)
+
+        pipeline = TicketPipeline(classify, reply, queue_size=3, reply_workers=1)
+        report = pipeline.run(range(50))
+
+        self.assertLessEqual(report["stages"]["classify"]["max_queue_depth"], 3)
+        self.assertLessEqual(report["stages"]["reply"]["max_queue_depth"], 3)
+
+    def test_failed_ticket_does_not_stop_pipeline(self):
+        def classify(ticket):
+            if ticket == 3:
+                raise ValueError("broken ticket")
+            return [ticket]
+
+        pipeline = TicketPipeline(classify, lambda ticket: None, reply_workers=2)
+        report = pipeline.run(range(10))
+
+        self.assertEqual(report["stages"]["classify"]["errors"], 1)
+        self.assertEqual(report["stages"]["reply"]["processed"], 9)
+
+    def test_dropped_tickets_are_not_answered(self):
+        replied = []
+
+        def classify(ticket):
+            # e.g. tickets the run journal knows were answered already
+            return [ticket] if ticket % 2 else []
+
+        pipeline = TicketPipeline(classify, replied.append, reply_workers=2)
+        report = pipeline.run(range(10))
+
+        self.assertEqual(sorted(replied), [1, 3, 5, 7, 9])
+        self.assertEqual(report["stages"]["classify"]["processed"], 10)
+        self.assertEqual(report["stages"]["reply"]["processed"], 5)
+
+    def test_stop_finishes_tickets_in_flight(self):
+        replied = []
+        started = threading.Event()
+
+        def classify(ticket):
+            started.set()
+            time.sleep(0.01)
+            return [ticket]
+
+        pipeline = TicketPipeline(classify, replied.append, queue_size=2, reply_workers=1)
+        threading.Timer(0.05, pipeline.stop).start()
+        report = pipeline.run(range(1000))
+
+        self.assertTrue(started.is_set())
+        self.assertLess(len(replied), 1000)
+        self.assertEqual(len(replied), report["stages"]["classify"]["processed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
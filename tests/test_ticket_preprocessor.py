@@ -0,0 +1,92 @@
+import unittest
+from supportagent.support_ticket import SupportTicket
+from supportagent.ticket_preprocessor import TicketPreprocessor
+from supportagent.ticket_text import clean_ticket_text
+from supportagent.trigger_matcher import TriggerMatcher, load_trigger_phrases
+from supportagent.support_agent import TRIGGER_PHRASES_PATH
+
+
+class WordTokenizer:
+    # Stands in for the model tokenizer, one token per word
+    def __init__(self):
+        self.tokenized = []
+
+    def tokenize(self, text, add_bos=True):
+        self.tokenized.append(text.decode("utf-8"))
+        return text.decode("utf-8").split()
+
+    def detokenize(self, tokens):
+        return " ".join(tokens).encode("utf-8")
+
+
+class TestTicketPreprocessor(unittest.TestCase):
+    def test_clean_ticket_text_keeps_newest_message(self):
+        description = (
+            "<p>Hallo,</p><p>ich finde meine Tickets nicht &amp; brauche sie heute.</p>"
+            "<p>Viele Grüße<br>Anna</p>\n"
+            "Am 12.10.2023 um 10:00 schrieb Ticket i/O Support:\n"
+            "> Bitte löschen Sie meinen Account\n"
+        )
+
+        self.assertEqual(
+            clean_ticket_text(description),
+            "ich finde meine Tickets nicht & brauche sie heute.",
+        )
+
+    def test_clean_ticket_text_keeps_text_after_greeting(self):
+        self.assertEqual(
+            clean_ticket_text("Hallo, bitte Tickets neu senden"), "bitte Tickets neu senden"
+        )
+        self.assertEqual(clean_ticket_text("Guten Tag Frau Müller\nDSGVO"), "DSGVO")
+        self.assertEqual(
+            clean_ticket_text("Sehr geehrte Damen und Herren, bitte Daten löschen"),
+            "bitte Daten löschen",
+        )
+        self.assertEqual(clean_ticket_text("Hallo Anna!\nDSGVO"), "DSGVO")
+
+    def test_one_line_tickets_after_greeting_still_trigger_match(self):
+        matcher = TriggerMatcher(load_trigger_phrases(TRIGGER_PHRASES_PATH))
+        for description, expected in [
+            ("Hallo Account löschen bitte", "DELETE_ACCOUNT"),
+            ("Hi Tickets neu senden", "RESEND_TICKET"),
+            ("Hallo DSGVO Auskunft", "DELETE_ACCOUNT"),
+            ("Hallo DSGVO\nAuskunft bitte", "DELETE_ACCOUNT"),
+        ]:
+            self.assertIn(description.split()[1], clean_ticket_text(description))
+            self.assertEqual(matcher.classify(clean_ticket_text(description))[0], expected)
+
+    def test_clean_ticket_text_strips_outlook_header(self):
+        description = (
+            "Bitte neu senden.\n\nVon: Support <support@example.com>\n"
+            "Gesendet: Montag, 9. Oktober 2023\nAn: Anna\nBetreff: Ihre Tickets\n"
+            "Daten löschen"
+        )
+
+        self.assertEqual(clean_ticket_text(description), "Bitte neu senden.")
+
+    def test_prepare_respects_token_budget(self):
+        support_ticket = SupportTicket(
+            ticket_id=1,
+            customer_email="test@example.com",
+            status="open",
+            subject="Tickets fehlen",
+            description="Hallo,\n" + "wort " * 500 + "\n> alte Nachricht " * 100,
+            classification=None,
+        )
+
+        tokenizer = WordTokenizer()
+        text, stats = TicketPreprocessor(token_budget=20).prepare(tokenizer, support_ticket)
+
+        self.assertTrue(text.startswith("Tickets fehlen\nwort wort"))
+        self.assertEqual(len(text.split()), 20)
+        self.assertEqual(stats["prompt_tokens"], 20)
+        self.assertEqual(stats["tokens_saved"], stats["original_tokens"] - 20)
+        # Subject and cleaned body are tokenized once, the raw description
+        # with its quoted history not at all
+        self.assertEqual(tokenizer.tokenized, ["Tickets fehlen", "wort " * 499 + "wort"])
+        # 801 words, estimated from the words per character of the body
+        self.assertAlmostEqual(stats["original_tokens"], 801, delta=80)
+
+
+if __name__ == "__main__":
+    unittest.main()
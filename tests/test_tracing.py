@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import unittest
+from supportagent.tracing import Tracer, llm_timing_attributes, percentile
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.metrics_path = os.path.join(self.tmpdir.name, "metrics.jsonl")
+        self.tracer = Tracer(metrics_path=self.metrics_path)
+
+    def tearDown(self):
+        self.tracer.close()
+        self.tmpdir.cleanup()
+
+    def read_metrics(self):
+        with open(self.metrics_path, "r") as infile:
+            return [json.loads(line) for line in infile]
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_spans_are_written_and_summarized(self):
+        for ticket_id in range(1, 4):
+            with self.tracer.span("llm", ticket_id=ticket_id) as span:
+                span.update({"prefill_tokens": 100, "prefill_ms": 50.0})
+
+        summary = self.tracer.write_summary(run_stats={"tickets": 3})
+        self.tracer.close()
+
+        self.assertEqual(summary["llm"]["count"], 3)
+        self.assertEqual(summary["llm"]["prefill_tokens"], 300)
+        self.assertEqual(summary["llm"]["prefill_tokens_per_second"], 2000.0)
+        self.assertNotIn("ticket_id", summary["llm"])
+        entries = self.read_metrics()
+        self.assertEqual([entry.get("ticket_id") for entry in entries[:3]], [1, 2, 3])
+        self.assertEqual(entries[3]["run_summary"]["llm"]["count"], 3)
+        self.assertEqual(entries[3]["run_stats"], {"tickets": 3})
+
+    def test_failed_span_is_recorded(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span("reply", ticket_id=1):
+                raise ValueError("boom")
+
+        self.tracer.close()
+        self.assertEqual(self.read_metrics()[0]["error"], "ValueError")
+
+    def test_traced_iterator(self):
+        pages = list(self.tracer.traced("fetch", iter([[1, 2], [3]])))
+
+        self.assertEqual(pages, [[1, 2], [3]])
+        summary = self.tracer.summary()
+        self.assertEqual(summary["fetch"]["items"], 3)
+
+    def test_reset(self):
+        with self.tracer.span("export"):
+            pass
+
+        self.tracer.reset()
+
+        self.assertEqual(self.tracer.summary(), {})
+
+
+class TestLlmTimings(unittest.TestCase):
+    def test_timing_attributes(self):
+        before = {"prefill_ms": 100.0, "prefill_tokens": 10, "decode_ms": 0.0, "decode_tokens": 0}
+        after = {"prefill_ms": 300.0, "prefill_tokens": 110, "decode_ms": 100.0, "decode_tokens": 2}
+
+        attributes = llm_timing_attributes(before, after)
+
+        self.assertEqual(attributes["prefill_tokens"], 100)
+        self.assertEqual(attributes["prefill_tokens_per_second"], 500.0)
+        self.assertEqual(attributes["decode_tokens_per_second"], 20.0)
+        self.assertEqual(llm_timing_attributes(None, after), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
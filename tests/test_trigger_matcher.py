@@ -0,0 +1,45 @@
+import unittest
+from supportagent.trigger_matcher import TriggerMatcher, normalize_text
+
+TRIGGER_PHRASES = {
+    "RESEND_TICKET": ["Neu Senden", "Keine E-Mail erhalten"],
+    "DELETE_ACCOUNT": ["Account löschen", "DSGVO", "Daten entfernen"],
+}
+
+
+class TestTriggerMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = TriggerMatcher(TRIGGER_PHRASES)
+
+    def test_normalize_text_folds_case_and_umlauts(self):
+        self.assertEqual(normalize_text("Account LÖSCHEN!"), " account loeschen ")
+        self.assertEqual(normalize_text("E-Mail"), " email ")
+
+    def test_classify_single_label(self):
+        label, matches = self.matcher.classify(
+            "Hallo, ich habe keine Email erhalten. Bitte neu senden!"
+        )
+
+        self.assertEqual(label, "RESEND_TICKET")
+        self.assertEqual(
+            sorted(phrase for _, phrase in matches),
+            ["Keine E-Mail erhalten", "Neu Senden"],
+        )
+
+    def test_classify_ignores_partial_words(self):
+        label, matches = self.matcher.classify("Ich möchte meine Accounts löschenswert")
+
+        self.assertIsNone(label)
+        self.assertEqual(matches, [])
+
+    def test_classify_conflicting_labels_is_ambiguous(self):
+        label, matches = self.matcher.classify(
+            "Bitte Tickets neu senden und danach den Account löschen (DSGVO)"
+        )
+
+        self.assertIsNone(label)
+        self.assertEqual(len(matches), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
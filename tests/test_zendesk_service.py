@@ -6,7 +6,7 @@ from supportagent.zendesk_service import ZendeskService
 
 
 class TestZendeskService(unittest.TestCase):
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_get_tickets(self, mock_get):
         # Mock the response from the Zendesk API
         mock_response = Mock()
@@ -48,7 +48,7 @@ class TestZendeskService(unittest.TestCase):
         self.assertIsInstance(tickets[0], SupportTicket)
         self.assertIsInstance(tickets[1], SupportTicket)
 
-    @patch("requests.put")
+    @patch("requests.Session.put")
     def test_reply_to_customer(self, mock_put):
         # Mock the response from the Zendesk API
         mock_response = Mock()
@@ -64,7 +64,7 @@ class TestZendeskService(unittest.TestCase):
         # Assert that the method returns a response with status code 200
         self.assertEqual(response.status_code, 200)
 
-    @patch("requests.get")
+    @patch("requests.Session.get")
     def test_utilize_mail_template(self, mock_get):
         # Mock the response from the Zendesk API
         mock_response = Mock()
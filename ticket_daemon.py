@@ -0,0 +1,154 @@
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from support_agent import REPLIED_TAG
+from tracing import percentile
+from zendesk_service import DEFAULT_TICKET_GROUP
+
+
+class DaemonState:
+    def __init__(self, path="daemon_state.json"):
+        # The cursor of the incremental export is the watermark, it only
+        # moves after all tickets of a page are answered
+        self.path = path
+        self.cursor = None
+        if os.path.exists(path):
+            with open(path, "r") as infile:
+                self.cursor = json.load(infile).get("cursor")
+
+    def save(self, cursor):
+        self.cursor = cursor
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as outfile:
+            outfile.write(json.dumps({"cursor": cursor, "saved_at": int(time.time())}))
+        os.replace(tmp_path, self.path)
+
+
+class TicketDaemon:
+    def __init__(
+        self,
+        support_agent,
+        state_path="daemon_state.json",
+        min_interval=10.0,
+        max_interval=120.0,
+        backoff_factor=1.5,
+        initial_lookback=24 * 3600,
+        group_id=None,
+        group_name=DEFAULT_TICKET_GROUP,
+    ):
+        # Polls the incremental export, the interval starts at min_interval
+        # and grows by backoff_factor with every pass without new tickets.
+        # Zendesk allows 10 incremental export requests per minute. The
+        # export covers all groups, so without a group_id the id of
+        # group_name is looked up and only its tickets are answered.
+        self.support_agent = support_agent
+        self.state = DaemonState(state_path)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.initial_lookback = initial_lookback
+        self.group_id = group_id
+        self.group_name = group_name
+        self.interval = min_interval
+        self.stop_event = threading.Event()
+        # Tickets created before this were already there at an earlier pass
+        # or were only updated, their age is not the daemon's reply latency
+        self.new_since = None
+
+    def run(self):
+        # Fails right away instead of polling without a group filter
+        self.__resolve_group()
+        self.__install_signal_handlers()
+        self.support_agent.warm_up()
+        print(f"Daemon started, cursor {self.state.cursor or 'none'}")
+        while not self.stop_event.is_set():
+            try:
+                found = self.poll()
+            except Exception as e:
+                # Zendesk or the network is down, try again after the longest wait
+                print(e)
+                found = 0
+                self.interval = self.max_interval
+            if found:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * self.backoff_factor, self.max_interval)
+            self.stop_event.wait(self.interval)
+        print("Daemon stopped")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def poll(self):
+        # One pass over everything that changed since the watermark, returns
+        # the number of tickets that were answered
+        self.__resolve_group()
+        pass_started = time.time()
+        if self.new_since is None:
+            self.new_since = pass_started - self.max_interval
+        found = 0
+        while not self.stop_event.is_set():
+            page = self.support_agent.zendesk_service.get_incremental_ticket_page(
+                cursor=self.state.cursor,
+                start_time=time.time() - self.initial_lookback,
+                group_id=self.group_id,
+                skip_tag=REPLIED_TAG,
+            )
+            if page["tickets"]:
+                # The latencies go into the same summary as the page's spans
+                self.support_agent.solve_ticket_batch(page["tickets"], report=False)
+                self.__record_latencies(self.support_agent.answered_tickets)
+                self.support_agent.report_run_stats()
+                found += len(page["tickets"])
+            if page["after_cursor"]:
+                self.state.save(page["after_cursor"])
+            if page["end_of_stream"]:
+                break
+        self.new_since = pass_started
+        return found
+
+    def __resolve_group(self):
+        if self.group_id is not None:
+            return
+        self.group_id = self.support_agent.zendesk_service.get_group_id(self.group_name)
+        if self.group_id is None:
+            raise ValueError(f"Zendesk group {self.group_name!r} not found, pass --group-id")
+        print(f"Answering tickets of group {self.group_name!r} ({self.group_id})")
+
+    def __record_latencies(self, support_tickets):
+        now = time.time()
+        latencies = []
+        for support_ticket in support_tickets:
+            if not support_ticket.created_at:
+                continue
+            created_at = datetime.strptime(
+                support_ticket.created_at, "%Y-%m-%dT%H:%M:%SZ"
+            ).replace(tzinfo=timezone.utc).timestamp()
+            if created_at < self.new_since:
+                continue
+            latencies.append(now - created_at)
+            self.support_agent.tracer.record(
+                "creation_to_reply", latencies[-1], ticket_id=support_ticket.ticket_id
+            )
+        if latencies:
+            latencies.sort()
+            print(
+                f"Creation to reply: p50 {percentile(latencies, 50):.1f}s, "
+                f"p95 {percentile(latencies, 95):.1f}s, max {latencies[-1]:.1f}s"
+            )
+
+    def __install_signal_handlers(self):
+        # The first signal lets the current page finish, a second one stops
+        # right away
+        def handle(signum, frame):
+            if self.stop_event.is_set():
+                raise KeyboardInterrupt
+            print(f"Received signal {signum}, stopping after the current page")
+            self.stop()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, handle)
+            signal.signal(signal.SIGINT, handle)
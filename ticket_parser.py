@@ -0,0 +1,65 @@
+import json
+from typing import Dict
+from support_ticket import SupportTicket
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    # orjson parses the raw response bytes several times faster than json
+    # and skips decoding them to str first
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_ticket(ticket_data) -> SupportTicket:
+    # Only the fields the agent uses are copied, the rest of the Zendesk
+    # ticket (custom fields, tags, ids, ...) is dropped with the page
+    customer_email = ""
+    via = ticket_data["via"]
+    if via["channel"] == "email":
+        customer_email = via["source"]["from"]["address"]
+
+    return SupportTicket(
+        ticket_id=ticket_data["id"],
+        customer_email=customer_email,
+        status=ticket_data["status"],
+        subject=ticket_data["subject"],
+        description=ticket_data["description"],
+        classification=None,
+        created_at=ticket_data.get("created_at"),
+    )
+
+
+def parse_ticket_page(data) -> Dict:
+    json_response = loads(data)
+    return {
+        "tickets": [parse_ticket(ticket_data) for ticket_data in json_response.get("tickets", [])],
+        "meta": json_response.get("meta", {}),
+        "links": json_response.get("links", {}),
+    }
+
+
+def parse_incremental_page(data, statuses=None, group_id=None, skip_tag=None) -> Dict:
+    # The incremental export returns every ticket that changed, so tickets
+    # in other states or groups and tickets already answered are dropped here
+    json_response = loads(data)
+    tickets = []
+    for ticket_data in json_response.get("tickets", []):
+        if statuses and ticket_data.get("status") not in statuses:
+            continue
+        if group_id and ticket_data.get("group_id") != group_id:
+            continue
+        if skip_tag and skip_tag in (ticket_data.get("tags") or []):
+            continue
+        tickets.append(parse_ticket(ticket_data))
+    return {
+        "tickets": tickets,
+        "changed": len(json_response.get("tickets", [])),
+        "after_cursor": json_response.get("after_cursor"),
+        "end_of_stream": json_response.get("end_of_stream", True),
+    }
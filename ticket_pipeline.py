@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+
+STOP = object()
+
+
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.queue_depth_sum = 0
+        self.queue_depth_samples = 0
+        self.max_queue_depth = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.processed += 1
+            self.errors += error
+            self.busy_seconds += seconds
+
+    def sample_queue(self, depth):
+        with self.lock:
+            self.queue_depth_sum += depth
+            self.queue_depth_samples += 1
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def as_dict(self, wall_seconds):
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "tickets_per_second": round(self.processed / wall_seconds, 2)
+            if wall_seconds
+            else 0.0,
+            "mean_queue_depth": round(
+                self.queue_depth_sum / self.queue_depth_samples, 2
+            )
+            if self.queue_depth_samples
+            else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+class TicketPipeline:
+    def __init__(self, classify, reply, queue_size=32, reply_workers=8):
+        # classify runs on a single thread because the llama.cpp context is
+        # not thread safe, reply runs on reply_workers threads. classify
+        # returns the tickets to reply to, tickets it drops are not answered.
+        self.classify = classify
+        self.reply = reply
+        self.reply_workers = reply_workers
+        self.classify_queue = queue.Queue(maxsize=queue_size)
+        self.reply_queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.metrics = {
+            "classify": StageMetrics("classify"),
+            "reply": StageMetrics("reply"),
+        }
+
+    def run(self, support_tickets):
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=self.__feed, args=(support_tickets,), name="feed"),
+            threading.Thread(target=self.__classify_worker, name="classify"),
+        ] + [
+            threading.Thread(target=self.__reply_worker, name=f"reply-{index}")
+            for index in range(self.reply_workers)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            # Stop taking new tickets but finish the ones already in flight
+            print("Stopping pipeline, finishing tickets in flight")
+            self.stop()
+            for thread in threads:
+                thread.join()
+        return self.report(time.perf_counter() - start)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def report(self, wall_seconds):
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "stages": {
+                name: stage.as_dict(wall_seconds) for name, stage in self.metrics.items()
+            },
+        }
+
+    def __feed(self, support_tickets):
+        try:
+            for support_ticket in support_tickets:
+                if self.stop_event.is_set():
+                    break
+                # Blocks while the classifier is behind, which keeps at most
+                # queue_size tickets buffered
+                self.classify_queue.put(support_ticket)
+                self.metrics["classify"].sample_queue(self.classify_queue.qsize())
+        except Exception as e:
+            print(e)
+        finally:
+            self.classify_queue.put(STOP)
+
+    def __classify_worker(self):
+        while True:
+            support_ticket = self.classify_queue.get()
+            if support_ticket is STOP:
+                break
+            if self.stop_event.is_set():
+                continue
+            start = time.perf_counter()
+            try:
+                classified_tickets = self.classify(support_ticket)
+            except Exception as e:
+                print(e)
+                self.metrics["classify"].record(time.perf_counter() - start, error=True)
+                continue
+            self.metrics["classify"].record(time.perf_counter() - start)
+            for classified_ticket in classified_tickets:
+                self.reply_queue.put(classified_ticket)
+                self.metrics["reply"].sample_queue(self.reply_queue.qsize())
+        for _ in range(self.reply_workers):
+            self.reply_queue.put(STOP)
+
+    def __reply_worker(self):
+        while True:
+            support_ticket = self.reply_queue.get()
+            if support_ticket is STOP:
+                break
+            start = time.perf_counter()
+            try:
+                self.reply(support_ticket)
+            except Exception as e:
+                print(e)
+                self.metrics["reply"].record(time.perf_counter() - start, error=True)
+                continue
+            self.metrics["reply"].record(time.perf_counter() - start)
@@ -0,0 +1,33 @@
+from ticket_text import clean_ticket_text
+
+
+class TicketPreprocessor:
+    def __init__(self, token_budget=256):
+        # token_budget bounds subject plus newest message, so long threads
+        # neither overflow n_ctx nor spend the prefill on quoted history
+        self.token_budget = token_budget
+
+    def prepare(self, llm, support_ticket):
+        subject = (support_ticket.subject or "").strip()
+        description = support_ticket.description or ""
+        body = clean_ticket_text(description)
+        subject_tokens = llm.tokenize(subject.encode("utf-8"), add_bos=False) if subject else []
+        subject_tokens = subject_tokens[: self.token_budget // 4]
+        body_tokens = llm.tokenize(body.encode("utf-8"), add_bos=False)
+        # The raw description is not tokenized again just for the statistic,
+        # its length is estimated from the characters per token of the body
+        original_tokens = round(len(body_tokens) * len(description) / len(body)) if body else 0
+        body_tokens = body_tokens[: self.token_budget - len(subject_tokens)]
+
+        text = self.__detokenize(llm, body_tokens)
+        if subject_tokens:
+            text = f"{self.__detokenize(llm, subject_tokens)}\n{text}"
+        used_tokens = len(subject_tokens) + len(body_tokens)
+        return text, {
+            "original_tokens": original_tokens,
+            "prompt_tokens": used_tokens,
+            "tokens_saved": max(0, original_tokens - used_tokens),
+        }
+
+    def __detokenize(self, llm, tokens):
+        return llm.detokenize(tokens).decode("utf-8", errors="ignore").strip()
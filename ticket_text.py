@@ -0,0 +1,81 @@
+import html
+import re
+
+GREETING_WORD = r"(hallo|hi|hey|moin|servus|guten (morgen|tag|abend)|sehr geehrte[rs]?|liebe[rs]?|dear|hello)\b"
+FORMAL_ADDRESS = (
+    r"(damen und herren|sir or madam|(frau|herr|dr\.?)(\s+\S+){1,2}|([\w/.-]+\s+){0,2}team|zusammen)"
+)
+# A greeting with at most a name or form of address, followed by a comma or
+# "!", like "Hallo Anna," or "Sehr geehrte Damen und Herren,"
+GREETING = re.compile(
+    rf"^{GREETING_WORD}(\s+({FORMAL_ADDRESS}|[\w.-]+))?\s*[,!]\s*", re.IGNORECASE
+)
+# A line with nothing but a greeting, like "Guten Tag Frau Müller". Only
+# stripped when more lines follow, "Hallo Account löschen" is the request.
+GREETING_LINE = re.compile(rf"^{GREETING_WORD}(\s+{FORMAL_ADDRESS})?\s*$", re.IGNORECASE)
+SIGNATURE = re.compile(
+    r"^(--\s*|mit freundlichen gr(ü|ue)(ß|ss)en|freundliche gr(ü|ue)(ß|ss)e|viele gr(ü|ue)(ß|ss)e"
+    r"|beste gr(ü|ue)(ß|ss)e|liebe gr(ü|ue)(ß|ss)e|gr(ü|ue)(ß|ss)e|gru(ß|ss)|lg|vg|mfg|best regards"
+    r"|kind regards|gesendet von meinem .*|sent from my .*)([\s,.!]+.{0,40})?$",
+    re.IGNORECASE,
+)
+
+QUOTE_HEADER = re.compile(
+    r"^(am .+ schrieb .+:|on .+ wrote:|-+ ?(original message|urspr(ü|ue)ngliche nachricht) ?-+)$",
+    re.IGNORECASE,
+)
+MAIL_HEADER = re.compile(r"^(von|from):\s.+$", re.IGNORECASE)
+MAIL_HEADER_FIELD = re.compile(r"^(gesendet|sent|an|to|betreff|subject|datum|date):", re.IGNORECASE)
+
+
+def strip_html(text):
+    text = re.sub(r"(?is)<(script|style)\b.*?</\1>", " ", text or "")
+    text = re.sub(r"(?i)<br\s*/?>|</(p|div|li|tr|h[1-6])>", "\n", text)
+    text = re.sub(r"<[^>]+>", " ", text)
+    return html.unescape(text)
+
+
+def strip_quoted_reply(text):
+    # Keeps only the newest message of an e-mail thread
+    lines = (text or "").splitlines()
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith(">") or QUOTE_HEADER.match(stripped):
+            return "\n".join(lines[:index])
+        if MAIL_HEADER.match(stripped) and any(
+            MAIL_HEADER_FIELD.match(following.strip())
+            for following in lines[index + 1 : index + 5]
+        ):
+            return "\n".join(lines[:index])
+    return "\n".join(lines)
+
+
+def clean_ticket_text(text):
+    # HTML, quoted history, greeting and signature removed, newest message only
+    text = strip_quoted_reply(strip_html(text))
+    text = strip_greeting_and_signature(text)
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+def strip_greeting_and_signature(text):
+    lines = [line.strip() for line in (text or "").splitlines()]
+    while lines and not lines[0]:
+        lines.pop(0)
+    if lines:
+        lines[0] = GREETING.sub("", lines[0], count=1).strip()
+        if len(lines) > 1:
+            lines[0] = GREETING_LINE.sub("", lines[0], count=1).strip()
+    while lines and not lines[0]:
+        lines.pop(0)
+    for index, line in enumerate(lines):
+        if SIGNATURE.match(line):
+            lines = lines[:index]
+            break
+    return "\n".join(lines)
+
+
+def normalize_description(text):
+    # Tickets that only differ in markup, quoted history, greeting, signature
+    # or whitespace normalize to the same text
+    text = clean_ticket_text(text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
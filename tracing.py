@@ -0,0 +1,193 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PERCENTILES = (50, 95, 99)
+# Span attributes that are added up per run, e.g. prefill_tokens
+SUMMED_SUFFIXES = ("tokens", "_ms", "tickets", "items")
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class Tracer:
+    def __init__(self, metrics_path=None, otel=False):
+        # Spans are kept in memory for the per-run percentiles and, with a
+        # metrics_path, appended to it as JSON Lines. With otel, every span is
+        # also started on the OpenTelemetry tracer, which exports to whatever
+        # the OpenTelemetry SDK of the process is configured with.
+        self.metrics_path = metrics_path
+        self.file = open(metrics_path, "a", encoding="utf-8") if metrics_path else None
+        self.otel_tracer = None
+        if otel:
+            try:
+                from opentelemetry import trace
+
+                self.otel_tracer = trace.get_tracer("supportagent")
+            except ImportError:
+                print("opentelemetry-api is not installed, spans are not exported")
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.durations = defaultdict(list)
+            self.totals = defaultdict(lambda: defaultdict(float))
+
+    @contextmanager
+    def span(self, name, **attributes):
+        # Attributes can be added inside the block through the yielded dict
+        start = time.perf_counter()
+        started_at = time.time()
+        try:
+            if self.otel_tracer is None:
+                yield attributes
+            else:
+                with self.otel_tracer.start_as_current_span(name) as otel_span:
+                    yield attributes
+                    for key, value in attributes.items():
+                        if isinstance(value, (str, bool, int, float)):
+                            otel_span.set_attribute(key, value)
+        except BaseException as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, started_at, **attributes)
+
+    def traced(self, name, iterable):
+        # Times every step of an iterator, e.g. the download of the next page
+        iterator = iter(iterable)
+        while True:
+            with self.span(name) as attributes:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    attributes["exhausted"] = True
+                    return
+                if isinstance(item, list):
+                    attributes["items"] = len(item)
+            yield item
+
+    def record(self, name, seconds, started_at=None, **attributes):
+        with self.lock:
+            self.durations[name].append(seconds)
+            for key, value in attributes.items():
+                if key.endswith(SUMMED_SUFFIXES) and isinstance(value, (int, float)):
+                    self.totals[name][key] += value
+            if self.file is not None:
+                entry = {
+                    "span": name,
+                    "start": round(started_at or time.time(), 6),
+                    "duration_ms": round(1000 * seconds, 3),
+                }
+                entry.update(attributes)
+                self.file.write(json.dumps(entry, default=str) + "\n")
+
+    def summary(self):
+        with self.lock:
+            summary = {}
+            for name, durations in self.durations.items():
+                durations = sorted(durations)
+                stage = {
+                    "count": len(durations),
+                    "total_seconds": round(sum(durations), 4),
+                }
+                for q in PERCENTILES:
+                    stage[f"p{q}_ms"] = round(1000 * percentile(durations, q), 3)
+                stage["max_ms"] = round(1000 * durations[-1], 3)
+                totals = self.totals[name]
+                stage.update({key: round(value, 3) for key, value in totals.items()})
+                for llm_stage in ("prefill", "decode"):
+                    if totals.get(f"{llm_stage}_ms"):
+                        stage[f"{llm_stage}_tokens_per_second"] = round(
+                            1000 * totals[f"{llm_stage}_tokens"] / totals[f"{llm_stage}_ms"], 2
+                        )
+                summary[name] = stage
+            return summary
+
+    def write_summary(self, **attributes):
+        summary = self.summary()
+        if self.file is not None:
+            with self.lock:
+                entry = {"run_summary": summary, "end": round(time.time(), 6)}
+                entry.update(attributes)
+                self.file.write(json.dumps(entry, default=str) + "\n")
+                self.file.flush()
+        return summary
+
+    def close(self):
+        if self.file is not None:
+            with self.lock:
+                self.file.close()
+                self.file = None
+
+
+def llm_timings(llm):
+    # Cumulative prompt (prefill) and generation (decode) counters of the
+    # llama.cpp context, None where the bindings do not expose them
+    try:
+        import llama_cpp
+
+        internal = getattr(llm, "_ctx", None)
+        ctx = internal.ctx if internal is not None else llm.ctx
+        if hasattr(llama_cpp, "llama_perf_context"):
+            timings = llama_cpp.llama_perf_context(ctx)
+        else:
+            timings = llama_cpp.llama_get_timings(ctx)
+        return {
+            "prefill_ms": timings.t_p_eval_ms,
+            "prefill_tokens": timings.n_p_eval,
+            "decode_ms": timings.t_eval_ms,
+            "decode_tokens": timings.n_eval,
+        }
+    except Exception:
+        return None
+
+
+def llm_timing_attributes(before, after):
+    # Tokens and tokens/sec of the calls between two llm_timings() readings
+    if before is None or after is None:
+        return {}
+    attributes = {}
+    for stage in ("prefill", "decode"):
+        tokens = after[f"{stage}_tokens"] - before[f"{stage}_tokens"]
+        milliseconds = after[f"{stage}_ms"] - before[f"{stage}_ms"]
+        attributes[f"{stage}_tokens"] = tokens
+        attributes[f"{stage}_ms"] = round(milliseconds, 3)
+        attributes[f"{stage}_tokens_per_second"] = (
+            round(1000 * tokens / milliseconds, 2) if milliseconds > 0 else 0.0
+        )
+    return attributes
+
+
+def profile_run(run, output_path="support_agent.prof", top=25):
+    # Runs run() under cProfile and tracemalloc, writes the pstats dump to
+    # output_path and prints the hottest functions and allocation sites
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start(10)
+    profiler.enable()
+    try:
+        return run()
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profiler.dump_stats(output_path)
+        print(f"Profile written to {output_path}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+        print(f"Peak traced memory: {peak / 2**20:.1f} MiB")
+        for statistic in snapshot.statistics("lineno")[:10]:
+            print(statistic)
@@ -0,0 +1,74 @@
+import json
+import re
+from collections import deque
+from typing import Dict, List
+
+UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+
+
+def normalize_text(text):
+    text = text.casefold().translate(UMLAUTS).replace("-", "")
+    text = re.sub(r"[^\w]+", " ", text)
+    return f" {text.strip()} "
+
+
+def load_trigger_phrases(path="trigger_phrases.json") -> Dict[str, List[str]]:
+    with open(path, "r", encoding="utf-8") as infile:
+        return json.load(infile)
+
+
+class TriggerMatcher:
+    def __init__(self, trigger_phrases: Dict[str, List[str]]):
+        # Aho-Corasick automaton over the normalized phrases, so a ticket is
+        # scanned once no matter how many phrases are configured
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for label, phrases in trigger_phrases.items():
+            for phrase in phrases:
+                self.__add(normalize_text(phrase), (label, phrase))
+        self.__build_fail_links()
+
+    def match(self, text):
+        node = 0
+        matches = []
+        for char in normalize_text(text):
+            while char not in self.goto[node] and node != 0:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            matches.extend(self.output[node])
+        return matches
+
+    def classify(self, text):
+        # Only a ticket whose phrases all point to the same label is resolved
+        # here, anything else is left for the LLM
+        matches = self.match(text)
+        labels = {label for label, _ in matches}
+        if len(labels) != 1:
+            return None, matches
+        return labels.pop(), matches
+
+    def __add(self, phrase, entry):
+        node = 0
+        for char in phrase:
+            if char not in self.goto[node]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][char] = len(self.goto) - 1
+            node = self.goto[node][char]
+        self.output[node].append(entry)
+
+    def __build_fail_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while char not in self.goto[fallback] and fallback != 0:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
@@ -1,42 +1,175 @@
 import os
-from typing import List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
 import requests
-import json
+from requests.adapters import HTTPAdapter
 from dotenv import find_dotenv, load_dotenv
+from macro_cache import MacroCache
+from request_scheduler import RequestScheduler
 from support_ticket import SupportTicket
+from ticket_parser import loads, parse_incremental_page, parse_ticket, parse_ticket_page
+
+# The group every mode answers tickets of unless told otherwise
+DEFAULT_TICKET_GROUP = "1. Level Customer Support"
+DEFAULT_TICKET_QUERY = f"type:ticket group:{DEFAULT_TICKET_GROUP} status:open"
 
 
 class ZendeskService:
-    def __init__(self):
+    def __init__(
+        self,
+        base_url="https://ticketio.zendesk.com/api/v2/",
+        pool_size=10,
+        macro_cache_ttl=300,
+        macro_cache_path=None,
+        rate_limit=700,
+        max_retries=5,
+    ):
         load_dotenv(find_dotenv())
-        self.base_url = "https://ticketio.zendesk.com/api/v2/"
+        self.base_url = base_url
         self.headers = {
             "Content-Type": "application/json",
         }
         self.auth = (f'{os.environ.get("USERNAME")}/token', os.environ.get("API_TOKEN"))
+        # One keep-alive session for all calls instead of a new TCP+TLS
+        # handshake per request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.macro_cache = MacroCache(ttl=macro_cache_ttl, path=macro_cache_path)
+        # Every call goes through the scheduler, which keeps the account
+        # below its rate limit and retries throttled and failed requests
+        self.scheduler = RequestScheduler(
+            self.session, rate_limit=rate_limit, max_retries=max_retries
+        )
 
-    def get_tickets(self, count: int):
+    def get_tickets(self, count: int, query=DEFAULT_TICKET_QUERY):
         try:
             params = {
-                "query": f"type:ticket group:1. Level Customer Support status:open count:{count}",
+                "query": f"{query} count:{count}",
                 "sort_by": "created_at",
                 "sort_order": "asc",
             }
-            response = requests.get(
+            response = self.scheduler.request(
+                "GET",
                 self.base_url + "tickets",
                 params=params,
                 auth=self.auth,
                 headers=self.headers,
             )
 
-            support_tickets = self.__generate_support_tickets(json.loads(response.text))
+            support_tickets = self.__generate_support_tickets(loads(response.content))
             return support_tickets
         except Exception as e:
             print(e)
             raise
 
+    def iter_ticket_pages(
+        self, page_size=100, query=DEFAULT_TICKET_QUERY
+    ) -> Iterator[List[SupportTicket]]:
+        # Follows the cursor pagination of Zendesk and downloads the next page
+        # while the caller is still working on the current one
+        params = {
+            "query": query,
+            "sort_by": "created_at",
+            "sort_order": "asc",
+            "page[size]": page_size,
+        }
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            next_page = prefetcher.submit(
+                self.__get_ticket_page, self.base_url + "tickets", params
+            )
+            while next_page is not None:
+                page = next_page.result()
+                next_page = None
+                if page["meta"].get("has_more") and page["links"].get("next"):
+                    next_page = prefetcher.submit(
+                        self.__get_ticket_page, page["links"]["next"], None
+                    )
+                yield page["tickets"]
+
+    def iter_tickets(self, page_size=100, query=DEFAULT_TICKET_QUERY) -> Iterator[SupportTicket]:
+        for support_tickets in self.iter_ticket_pages(page_size=page_size, query=query):
+            yield from support_tickets
+
+    def __get_ticket_page(self, url, params):
+        try:
+            response = self.scheduler.request(
+                "GET",
+                url,
+                params=params,
+                auth=self.auth,
+                headers=self.headers,
+            )
+            return parse_ticket_page(response.content)
+        except Exception as e:
+            print(e)
+            raise
+
+    def get_incremental_ticket_page(
+        self,
+        cursor=None,
+        start_time=None,
+        statuses=("new", "open"),
+        group_id=None,
+        skip_tag=None,
+    ):
+        # Tickets created or updated since start_time, every later page is
+        # requested with the after_cursor of the previous one
+        params = {"cursor": cursor} if cursor else {"start_time": int(start_time)}
+        try:
+            response = self.scheduler.request(
+                "GET",
+                self.base_url + "incremental/tickets/cursor.json",
+                params=params,
+                auth=self.auth,
+                headers=self.headers,
+            )
+            return parse_incremental_page(
+                response.content, statuses=statuses, group_id=group_id, skip_tag=skip_tag
+            )
+        except Exception as e:
+            print(e)
+            raise
+
+    def get_group_id(self, name):
+        # Id of the group with this name, None if there is none
+        url = self.base_url + "groups"
+        params = {"page[size]": 100}
+        while url:
+            response = self.scheduler.request(
+                "GET", url, params=params, auth=self.auth, headers=self.headers
+            )
+            data = loads(response.content)
+            for group in data.get("groups", []):
+                if group.get("name") == name:
+                    return group["id"]
+            url = data.get("links", {}).get("next") if data.get("meta", {}).get("has_more") else None
+            params = None
+        return None
+
+    def get_ticket(self, ticket_id) -> SupportTicket:
+        response = self.scheduler.request(
+            "GET",
+            self.base_url + f"tickets/{ticket_id}",
+            auth=self.auth,
+            headers=self.headers,
+        )
+        return self.__generate_support_tickets(loads(response.content))[0]
+
+    def get_ticket_tags(self, ticket_id) -> List[str]:
+        response = self.scheduler.request(
+            "GET",
+            self.base_url + f"tickets/{ticket_id}/tags",
+            auth=self.auth,
+            headers=self.headers,
+        )
+        return loads(response.content)["tags"]
+
     def reply_to_customer(self, ticket_id, payload):
-        response = requests.put(
+        response = self.scheduler.request(
+            "PUT",
             self.base_url + f"tickets/{ticket_id}",
             auth=self.auth,
             headers=self.headers,
@@ -49,31 +182,18 @@ class ZendeskService:
 
         if isinstance(json_response, dict) and "listName" in json_response:
             for ticket_data in json_response["tickets"]:
-                support_ticket = self.__create_support_ticket_from_data(ticket_data)
+                support_ticket = parse_ticket(ticket_data)
                 support_tickets.append(support_ticket)
         else:
             support_ticket_data = json_response["ticket"]
-            support_ticket = self.__create_support_ticket_from_data(support_ticket_data)
+            support_ticket = parse_ticket(support_ticket_data)
             support_tickets.append(support_ticket)
 
         return support_tickets
 
-    def __create_support_ticket_from_data(self, ticket_data) -> SupportTicket:
-        customer_email = ""
-        if ticket_data["via"]["channel"] == "email":
-            customer_email = ticket_data["via"]["source"]["from"]["address"]
-
-        return SupportTicket(
-            ticket_id=ticket_data["id"],
-            customer_email=customer_email,
-            status=ticket_data["status"],
-            subject=ticket_data["subject"],
-            description=ticket_data["description"],
-            classification=None,
-        )
-
     def get_macros(self):
-        response = requests.get(
+        response = self.scheduler.request(
+            "GET",
             self.base_url + "macros/active",
             auth=self.auth,
             headers=self.headers,
@@ -83,7 +203,8 @@ class ZendeskService:
 
     def utilize_mail_template(self, macro_id):
         try:
-            response = requests.get(
+            response = self.scheduler.request(
+                "GET",
                 self.base_url + f"macros/{macro_id}/apply",
                 auth=self.auth,
                 headers=self.headers,
@@ -92,3 +213,100 @@ class ZendeskService:
         except Exception as e:
             print(e)
             raise Exception
+
+    def reply_to_customers_bulk(
+        self,
+        ticket_ids,
+        payload,
+        chunk_size=100,
+        poll_interval=1.0,
+        max_poll_interval=10.0,
+        timeout=600,
+    ):
+        # Sends the same update to many tickets with update_many, at most
+        # chunk_size tickets per job, and waits for the jobs to finish.
+        # Returns a dict ticket_id -> error message for every failed ticket.
+        ticket_ids = list(ticket_ids)
+        jobs = {}
+        failures = {}
+        for start in range(0, len(ticket_ids), chunk_size):
+            chunk = ticket_ids[start : start + chunk_size]
+            try:
+                response = self.scheduler.request(
+                    "PUT",
+                    self.base_url + "tickets/update_many.json",
+                    params={"ids": ",".join(str(ticket_id) for ticket_id in chunk)},
+                    auth=self.auth,
+                    headers=self.headers,
+                    json=payload,
+                )
+            except requests.RequestException as e:
+                # The other chunks still go out, this one is reported as failed
+                failures.update({ticket_id: str(e) for ticket_id in chunk})
+                continue
+            job_status = loads(response.content)["job_status"]
+            jobs[job_status["id"]] = chunk
+
+        pending = dict(jobs)
+        deadline = time.monotonic() + timeout
+        while pending:
+            if time.monotonic() > deadline:
+                for chunk in pending.values():
+                    for ticket_id in chunk:
+                        failures[ticket_id] = "job status polling timed out"
+                break
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+            response = self.scheduler.request(
+                "GET",
+                self.base_url + "job_statuses/show_many.json",
+                params={"ids": ",".join(pending)},
+                auth=self.auth,
+                headers=self.headers,
+            )
+            for job_status in loads(response.content)["job_statuses"]:
+                if job_status["status"] not in ("completed", "failed", "killed"):
+                    continue
+                chunk = pending.pop(job_status["id"])
+                failures.update(self.__job_failures(job_status, chunk))
+        return failures
+
+    def __job_failures(self, job_status, ticket_ids):
+        results = {result.get("id"): result for result in job_status.get("results") or []}
+        failures = {}
+        for ticket_id in ticket_ids:
+            result = results.get(ticket_id)
+            if result is None:
+                failures[ticket_id] = job_status.get("message") or f"job {job_status['status']}"
+            elif not result.get("success", "error" not in result):
+                failures[ticket_id] = result.get("details") or result.get("error") or "update failed"
+        return failures
+
+    def get_macro_html_body(self, macro_id):
+        html_body = self.macro_cache.get(macro_id)
+        if html_body is not None:
+            return html_body
+        with self.macro_cache.lock_for(macro_id):
+            # Another thread may have fetched the macro in the meantime
+            html_body = self.macro_cache.get(macro_id)
+            if html_body is not None:
+                return html_body
+            headers = dict(self.headers)
+            etag = self.macro_cache.etag(macro_id)
+            if etag:
+                headers["If-None-Match"] = etag
+            response = self.scheduler.request(
+                "GET",
+                self.base_url + f"macros/{macro_id}/apply",
+                auth=self.auth,
+                headers=headers,
+            )
+            if response.status_code == 304:
+                return self.macro_cache.revalidated(macro_id)
+            macro = loads(response.content)
+            html_body = macro["result"]["ticket"]["comment"]["html_body"]
+            self.macro_cache.put(macro_id, html_body, etag=response.headers.get("ETag"))
+            return html_body
+
+    def close(self):
+        self.session.close()